@@ -0,0 +1,39 @@
+import benchmark.benchmarks as benchmarks
+import classifier.util as util
+import argparse
+import sys
+
+
+parser = argparse.ArgumentParser(description="Benchmarks how every stage of the classifier scales with the length of a performance, comparing against this machine's baseline")
+parser.add_argument("--durations", type=float, nargs="+", default=benchmarks.DURATIONS, help="lengths of performance to benchmark in seconds")
+parser.add_argument("--stages", nargs="+", help="names of the stages to benchmark, e.g. beat_tracking Chroma.calculate_metric Reverb.apply, defaults to every stage")
+parser.add_argument("--repeat", type=int, default=1, help="number of times to time each stage, the quickest is kept")
+parser.add_argument("--no-memory", action="store_true", help="don't measure peak memory, which needs an extra run of every stage")
+parser.add_argument("--sample-rate", type=int, default=44100, help="sample rate of the synthesised performances")
+parser.add_argument("--tolerance", type=float, default=benchmarks.TOLERANCE, help="fraction a stage can slow down by before it counts as a regression")
+parser.add_argument("--baseline-dir", default=benchmarks.BASELINE_DIR, help="directory the baselines are kept in")
+parser.add_argument("--save", action="store_true", help="save the results as this machine's baseline")
+args = parser.parse_args()
+
+# durations given as whole seconds are stored as whole seconds, so they line up with the default durations in baselines
+durations = [int(duration) if duration == int(duration) else duration for duration in args.durations]
+
+results = benchmarks.run_benchmarks(durations, stage_names=args.stages, repeat=args.repeat, memory=not args.no_memory, sample_rate=args.sample_rate)
+print(benchmarks.format_results(results))
+
+regressions = []
+baseline = benchmarks.load_baseline(results["machine"], args.baseline_dir)
+if baseline is None:
+    util.log("No baseline for this machine yet")
+elif baseline["sample_rate"] != results["sample_rate"]:
+    util.log(f"Baseline was run at {baseline['sample_rate']}Hz, not comparing")
+else:
+    regressions = benchmarks.find_regressions(results, baseline, tolerance=args.tolerance)
+    for regression in regressions:
+        print(f"REGRESSION {regression['stage']} on {regression['duration']}s: {regression['measure']} {regression['baseline']:.4g} -> {regression['current']:.4g} ({regression['ratio']:.2f}x)")
+    util.log(f"{len(regressions)} regressions against the baseline")
+
+if args.save:
+    util.log(f"Saved baseline to {benchmarks.save_baseline(results, args.baseline_dir)}")
+
+sys.exit(1 if len(regressions) > 0 else 0)
@@ -0,0 +1,305 @@
+import benchmark.signals as signals
+import classifier.audio as audio
+import classifier.instrumentation as instrumentation
+import classifier.metrics.metric_calculator as metric_calculator
+import classifier.metrics.tempo as tempo
+import classifier.transformations.noise as noise
+import classifier.transformations.reverb as reverb
+import classifier.util as util
+import hashlib
+import json
+import os
+import os.path
+import platform
+import tempfile
+import numpy as np
+import scipy
+
+# lengths of the synthesised performances in seconds, from 10 seconds to an hour
+DURATIONS = [10, 30, 60, 300, 600, 1800, 3600]
+
+# where baselines are kept, one file per machine
+BASELINE_DIR = os.path.join(os.path.dirname(__file__), "baselines")
+
+# how much slower, or bigger, than its baseline a stage can be before it counts as a regression
+TOLERANCE = 0.2
+
+# differences smaller than these are noise however large they are relative to the baseline
+MIN_TIME = 0.01
+MIN_MEMORY = 1 << 20
+
+
+def copy_audio(audio_obj, beat_tracking=True):
+    """
+    audio_obj: an Audio object
+    beat_tracking: whether to carry over any onset function, global tempo and beat times audio_obj has calculated, defaults to True
+
+    returns: a new Audio object of the same signal, without any cached metrics, spectrograms or resampled signals
+    """
+    copied = audio.Audio(audio_obj.signal, audio_obj.sample_rate, name=audio_obj.name)
+    if beat_tracking:
+        copied.onset_function = audio_obj.onset_function
+        copied.global_tempo = audio_obj.global_tempo
+        copied.beat_times = audio_obj.beat_times
+    return copied
+
+
+def get_stages(performance, other_performance, transforms, metrics=metric_calculator.METRICS):
+    """
+    Works out every stage to benchmark on a pair of performances
+
+    performance: Audio object of the performance most stages are run on, with its beats already tracked
+    other_performance: Audio object of the performance compared with it by calculate_similarity, with its beats already tracked
+    transforms: list of Transformations to benchmark
+    metrics: list of MetricCalculators to benchmark, defaults to metric_calculator.METRICS
+
+    returns: a dictionary of setup functions, indexed by stage name. Each does any work the stage relies on, which isn't timed,
+             and returns a function with no arguments that runs the stage
+    """
+    def onset_function():
+        fresh = copy_audio(performance, beat_tracking=False)
+        return lambda: tempo.TempoCalculator.calculate_onset_func(fresh)
+
+    def global_tempo():
+        fresh = copy_audio(performance, beat_tracking=False)
+        fresh.onset_function = performance.onset_function
+        return lambda: tempo.TempoCalculator.calculate_global_tempo(fresh)
+
+    def beat_tracking():
+        fresh = copy_audio(performance, beat_tracking=False)
+        fresh.onset_function = performance.onset_function
+        fresh.global_tempo = performance.global_tempo
+        return lambda: tempo.TempoCalculator.calculate_beats(fresh)
+
+    stages = {
+        "onset_function": onset_function,
+        "global_tempo": global_tempo,
+        "beat_tracking": beat_tracking,
+    }
+
+    # default arguments so that each function keeps its own metric
+    for metric in metrics:
+        def calculate_metric(metric=metric):
+            # without any spectrograms, so each metric pays for its own
+            fresh = copy_audio(performance)
+            return lambda: metric.calculate_metric(fresh)
+
+        def calculate_similarity(metric=metric):
+            metric1 = metric.calculate_metric(copy_audio(performance))
+            metric2 = metric.calculate_metric(copy_audio(other_performance))
+            return lambda: metric.calculate_similarity(performance, other_performance, metric1, metric2)
+
+        stages[f"{metric}.calculate_metric"] = calculate_metric
+        stages[f"{metric}.calculate_similarity"] = calculate_similarity
+
+    for transform in transforms:
+        def apply(transform=transform):
+            return lambda: transform.apply(performance)
+
+        stages[f"{type(transform).__name__}.apply"] = apply
+
+    return stages
+
+
+def measure(name, setup, repeat=1, memory=True):
+    """
+    Measures a stage
+
+    name: name of the stage
+    setup: function doing any untimed work and returning the function to time, see get_stages
+    repeat: number of times to time the stage, the quickest is kept, defaults to 1
+    memory: whether to measure the peak memory of the stage, in an extra run with tracemalloc so that tracing doesn't slow down the timed runs, defaults to True
+
+    returns: a dictionary of the "wall_time" and "cpu_time" in seconds and "peak_memory" in bytes (None without memory) of the stage
+    """
+    result = None
+    for _ in range(repeat):
+        run = setup()
+        with instrumentation.record(memory=False) as recorder:
+            with instrumentation.stage(name):
+                run()
+
+        # the stage itself finishes last, after anything recorded inside it
+        stage = recorder.stages[-1]
+        if result is None or stage["wall_time"] < result["wall_time"]:
+            result = {"wall_time": stage["wall_time"], "cpu_time": stage["cpu_time"], "peak_memory": None}
+
+    if memory:
+        run = setup()
+        with instrumentation.record(memory=True) as recorder:
+            with instrumentation.stage(name):
+                run()
+        result["peak_memory"] = recorder.stages[-1]["peak_memory"]
+
+    return result
+
+
+def run_benchmarks(durations=DURATIONS, stage_names=None, repeat=1, memory=True, sample_rate=44100):
+    """
+    Benchmarks every stage on synthesised performances of each duration
+
+    durations: list of lengths of performance in seconds, defaults to DURATIONS
+    stage_names: optionally, list of names of the stages to benchmark, see get_stages, defaults to every stage
+    repeat: see measure
+    memory: see measure
+    sample_rate: sample rate of the synthesised performances in samples/sec, defaults to 44100
+
+    returns: a dictionary of the "machine" the benchmarks were run on (see get_machine), the settings they were run with,
+             and the "results", a dictionary indexed by stage name then duration (as a string, as it is in JSON), of the results of measure
+    """
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        ir_path = os.path.join(directory, "ir.wav")
+        noise_path = os.path.join(directory, "noise.wav")
+        signals.write_impulse_response(ir_path, sample_rate=sample_rate)
+        signals.write_noise(noise_path, sample_rate=sample_rate)
+        transforms = [reverb.Reverb(ir_path), noise.Noise(noise_path)]
+
+        for duration in durations:
+            util.log(f"Synthesising {duration}s performances...")
+            performance = signals.piano(duration, sample_rate, seed=0)
+            other_performance = signals.piano(duration, sample_rate, bpm=104, seed=1)
+            # beat tracking is shared by most stages, so it is done once up front, and benchmarked separately
+            performance.get_beat_times()
+            other_performance.get_beat_times()
+
+            stages = get_stages(performance, other_performance, transforms)
+            for name in stages:
+                if stage_names is not None and name not in stage_names:
+                    continue
+                util.log(f"Benchmarking {name} on {duration}s...", level=2)
+                results.setdefault(name, {})[str(duration)] = measure(name, stages[name], repeat=repeat, memory=memory)
+
+    return {
+        "machine": get_machine(),
+        "sample_rate": sample_rate,
+        "repeat": repeat,
+        "results": results,
+    }
+
+
+def get_machine():
+    """
+    returns: a dictionary describing the machine and software benchmarks are being run on, any of which changing makes timings incomparable
+    """
+    return {
+        "node": platform.node(),
+        "machine": platform.machine(),
+        "processor": platform.processor(),
+        "cpu_count": os.cpu_count(),
+        "system": platform.system(),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "scipy": scipy.__version__,
+    }
+
+
+def get_machine_tag(machine):
+    """
+    machine: a dictionary describing a machine, from get_machine
+
+    returns: a short string identifying the machine, which baselines are stored under
+    """
+    description = json.dumps(machine, sort_keys=True)
+    return f"{machine['node']}-{hashlib.sha256(description.encode()).hexdigest()[:12]}"
+
+
+def get_baseline_path(machine, baseline_dir=BASELINE_DIR):
+    return os.path.join(baseline_dir, f"{get_machine_tag(machine)}.json")
+
+
+def load_baseline(machine, baseline_dir=BASELINE_DIR):
+    """
+    machine: a dictionary describing a machine, from get_machine
+    baseline_dir: directory the baselines are kept in, defaults to BASELINE_DIR
+
+    returns: the baseline saved for the machine, in the same form as run_benchmarks returns, or None if there isn't one
+    """
+    path = get_baseline_path(machine, baseline_dir)
+    if not os.path.isfile(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_baseline(benchmarks, baseline_dir=BASELINE_DIR):
+    """
+    Saves benchmarks as the baseline of the machine they were run on, replacing the results of any stage and duration already there
+    and keeping the rest, so a baseline can be built up a few stages at a time
+
+    benchmarks: the output of run_benchmarks
+    baseline_dir: directory the baselines are kept in, created if it doesn't exist, defaults to BASELINE_DIR
+
+    returns: the path the baseline was saved to
+    """
+    baseline = load_baseline(benchmarks["machine"], baseline_dir)
+    if baseline is None:
+        baseline = dict(benchmarks, results={})
+
+    for name, durations in benchmarks["results"].items():
+        baseline["results"].setdefault(name, {}).update(durations)
+
+    os.makedirs(baseline_dir, exist_ok=True)
+    path = get_baseline_path(benchmarks["machine"], baseline_dir)
+    with open(path, "w") as f:
+        json.dump(baseline, f, indent=2, sort_keys=True)
+    return path
+
+
+def find_regressions(benchmarks, baseline, tolerance=TOLERANCE):
+    """
+    Compares benchmarks with a baseline, finding every stage that has got slower, or needs more memory, by more than the tolerance
+
+    benchmarks: the output of run_benchmarks
+    baseline: a baseline in the same form, e.g. from load_baseline
+    tolerance: fraction the wall time or peak memory can grow by before it counts as a regression, defaults to TOLERANCE
+
+    returns: a list of dictionaries of the "stage", "duration", "measure" ("wall_time" or "peak_memory"), its "baseline" and "current" values and their "ratio"
+    """
+    regressions = []
+    for name, durations in benchmarks["results"].items():
+        for duration, result in durations.items():
+            baseline_result = baseline["results"].get(name, {}).get(duration)
+            if baseline_result is None:
+                continue
+
+            for measure_name, minimum in (("wall_time", MIN_TIME), ("peak_memory", MIN_MEMORY)):
+                current = result[measure_name]
+                previous = baseline_result[measure_name]
+                if current is None or previous is None:
+                    continue
+                if current > previous * (1 + tolerance) + minimum:
+                    regressions.append({
+                        "stage": name,
+                        "duration": duration,
+                        "measure": measure_name,
+                        "baseline": previous,
+                        "current": current,
+                        "ratio": current / previous if previous > 0 else float("inf"),
+                    })
+
+    return regressions
+
+
+def format_results(benchmarks):
+    """
+    benchmarks: the output of run_benchmarks
+
+    returns: a string of a table of the wall time and peak memory of every stage at every duration
+    """
+    durations = sorted({duration for results in benchmarks["results"].values() for duration in results}, key=float)
+    width = max([len("Stage")] + [len(name) for name in benchmarks["results"]])
+
+    lines = [f"{'Stage':<{width}}" + "".join(f"  {duration + 's':>18}" for duration in durations)]
+    for name, results in benchmarks["results"].items():
+        line = f"{name:<{width}}"
+        for duration in durations:
+            if duration not in results:
+                line += f"  {'-':>18}"
+                continue
+            result = results[duration]
+            peak_memory = f"{result['peak_memory'] / (1 << 20):.0f}MiB" if result["peak_memory"] is not None else "-"
+            line += f"  {result['wall_time']:>9.4f}s {peak_memory:>7}"
+        lines.append(line)
+
+    return "\n".join(lines)
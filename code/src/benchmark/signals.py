@@ -0,0 +1,80 @@
+import classifier.audio as audio
+import numpy as np
+import scipy.io.wavfile
+
+# number of samples of noise generated at a time, so a long signal never needs a double precision copy of all its noise
+CHUNK_SIZE = 1 << 20
+
+
+def piano(duration, sample_rate=44100, bpm=112, seed=0):
+    """
+    Synthesises a deterministic piano-like performance: decaying notes with a few harmonics, of random pitches and loudnesses,
+    at a slightly uneven tempo, over a quiet noise floor. The same arguments always give exactly the same signal
+
+    duration: length of the signal in seconds
+    sample_rate: sample rate in samples/sec, defaults to 44100
+    bpm: the tempo the notes are played at, defaults to 112
+    seed: seed of the random pitches, loudnesses, timings and noise, defaults to 0
+
+    returns: an Audio object of the performance, in single precision and scaled like a 16-bit recording
+    """
+    rng = np.random.default_rng(seed)
+    num_samples = int(duration * sample_rate)
+
+    signal = np.empty(num_samples, dtype=np.float32)
+    for start in range(0, num_samples, CHUNK_SIZE):
+        chunk = signal[start:start + CHUNK_SIZE]
+        chunk[:] = rng.standard_normal(len(chunk), dtype=np.float32)
+    signal *= 0.01
+
+    # every note is one of two octaves of pitches, so each pitch is only synthesised once
+    t = np.arange(sample_rate, dtype=np.float64) / sample_rate
+    envelope = np.exp(-4 * t)
+    notes = []
+    for pitch in range(24):
+        frequency = 220 * 2 ** (pitch / 12)
+        notes.append((sum(np.sin(2 * np.pi * frequency * harmonic * t) / harmonic for harmonic in range(1, 6)) * envelope).astype(np.float32))
+
+    beat_time = 0.3
+    period = 60 / bpm
+    while beat_time < duration:
+        note = notes[rng.integers(0, 24)]
+        start = int(beat_time * sample_rate)
+        length = min(num_samples - start, len(note))
+        signal[start:start + length] += rng.uniform(0.4, 1.0) * note[:length]
+        beat_time += period * rng.uniform(0.95, 1.05)
+
+    signal *= 20000 / np.max(np.abs(signal))
+    return audio.Audio(signal, sample_rate, name=f"piano {duration}s seed {seed}")
+
+
+def write_impulse_response(path, duration=1.5, sample_rate=44100, seed=0):
+    """
+    Writes a deterministic synthetic room impulse response, exponentially decaying noise, to a wavfile
+
+    path: path of the wavfile to write
+    duration: length of the impulse response in seconds, defaults to 1.5
+    sample_rate: sample rate in samples/sec, defaults to 44100
+    seed: seed of the noise, defaults to 0
+    """
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(duration * sample_rate)) / sample_rate
+    ir = rng.standard_normal(len(t)) * np.exp(-6 * t)
+    ir[0] = 1
+    scipy.io.wavfile.write(path, sample_rate, (ir / np.max(np.abs(ir))).astype(np.float32))
+
+
+def write_noise(path, duration=10, sample_rate=44100, seed=0):
+    """
+    Writes deterministic background noise, low passed white noise at a 16-bit scale, to a wavfile
+
+    path: path of the wavfile to write
+    duration: length of the noise in seconds, defaults to 10
+    sample_rate: sample rate in samples/sec, defaults to 44100
+    seed: seed of the noise, defaults to 0
+    """
+    rng = np.random.default_rng(seed)
+    noise = np.cumsum(rng.standard_normal(int(duration * sample_rate)))
+    # take the drift out of the random walk, so the noise loops without a jump
+    noise -= np.linspace(noise[0], noise[-1], len(noise))
+    scipy.io.wavfile.write(path, sample_rate, (noise / np.max(np.abs(noise)) * 1000).astype(np.float32))
@@ -1,24 +1,38 @@
 import os.path
 import os
+import classifier.instrumentation as instrumentation
 import classifier.metrics.tempo as tempo
+import classifier.resampling as resampling
+import classifier.util as util
+import numpy as np
+import scipy.fft
 import scipy.signal
+import scipy.signal.windows
 
 class Audio:
-    def __init__(self, signal, sample_rate, name=""):
+    def __init__(self, signal, sample_rate, name="", fingerprint=None):
         """
-        signal: 1D np array of the signal
+        signal: 1D np array of the signal, float32 signals are processed in single precision all the way through, anything else in double precision
         sample_rate: sample_rate in samples/sec for the signal
         name: optionally, the name of the this audio, for debugging/plotting, e.g. the filename
+        fingerprint: optionally, a string uniquely identifying the contents of this audio, e.g. a hash of the file it was read from, needed to persist results in a FeatureStore
         """
         self.signal = signal
         self.sample_rate = sample_rate
 
         self.name = name
+        self.fingerprint = fingerprint
 
         self.onset_function = None
         self.beat_times = None
         self.global_tempo = None
         self.cached_metrics = {}
+        # spectrograms indexed by the parameters they were calculated with, so metrics using the same parameters share them
+        self.spectrograms = {}
+        # resampled versions of this audio indexed by sample rate, so each is only calculated once
+        self.resampled = {}
+        # the starts of this audio indexed by number of samples, see get_prefix
+        self.prefixes = {}
 
     def cache_metric(self, metric, value):
         self.cached_metrics[metric] = value
@@ -26,6 +40,23 @@ class Audio:
     def get_cached_metric(self, metric):
         return self.cached_metrics.get(metric, None)
 
+    def get_dtype(self):
+        """
+        returns: the float dtype that everything calculated from this audio (spectrograms, onset functions, metrics etc.) should be kept in
+        """
+        return util.float_dtype(self.signal)
+
+    def astype(self, dtype):
+        """
+        dtype: the np dtype to convert the signal to, e.g. np.float32 for single precision processing
+
+        returns: a new Audio object with the converted signal, none of the cached results carry over as they depend on the precision
+        """
+        fingerprint = None
+        if self.fingerprint is not None:
+            fingerprint = f"{self.fingerprint}/{np.dtype(dtype).name}"
+        return Audio(self.signal.astype(dtype), self.sample_rate, name=self.name, fingerprint=fingerprint)
+
     def get_duration(self):
         return self.to_seconds(len(self.signal))
 
@@ -36,26 +67,131 @@ class Audio:
         return int(num_seconds * self.sample_rate)
 
     def get_onset_function(self):
+        instrumentation.count_cache("onset_function", self.onset_function is not None)
         if self.onset_function is None:
-            self.onset_function = tempo.TempoCalculator.calculate_onset_func(self)
+            with instrumentation.stage("onset_function"):
+                self.onset_function = tempo.TempoCalculator.calculate_onset_func(self)
             return self.onset_function
         else:
             return self.onset_function
 
     def get_beat_times(self):
+        instrumentation.count_cache("beat_times", self.beat_times is not None)
         if self.beat_times is None:
-            self.beat_times = tempo.TempoCalculator.calculate_beats(self)
+            with instrumentation.stage("beat_tracking"):
+                self.beat_times = tempo.TempoCalculator.calculate_beats(self)
             return self.beat_times
         else:
             return self.beat_times
 
     def get_global_tempo(self):
+        instrumentation.count_cache("global_tempo", self.global_tempo is not None)
         if self.global_tempo is None:
-            self.global_tempo = tempo.TempoCalculator.calculate_global_tempo(self)
+            with instrumentation.stage("global_tempo"):
+                self.global_tempo = tempo.TempoCalculator.calculate_global_tempo(self)
         return self.global_tempo
 
+    def get_prefix(self, num_samples):
+        """
+        Gets the start of the audio, caching it so that everything comparing against the same length of this audio shares its metrics.
+        Rather than tracking its own beats, the start shares this audio's onset function, global tempo and beats up to that point,
+        so starts of many different lengths only cost their own metrics
+
+        num_samples: number of samples from the start of the signal
+
+        returns: an Audio object of the first num_samples samples of the signal, or this audio itself if it is no longer than that
+        """
+        if num_samples >= len(self.signal):
+            return self
+
+        instrumentation.count_cache("prefix", num_samples in self.prefixes)
+        if num_samples not in self.prefixes:
+            prefix = Audio(self.signal[:num_samples], self.sample_rate, name=self.name)
+            duration = prefix.get_duration()
+
+            onset_function = self.get_onset_function()
+            num_windows = int(duration / onset_function.window_advance)
+            prefix.onset_function = tempo.OnsetFunction(onset_function.data[:num_windows], onset_function.window_advance, onset_function.sample_rate)
+            prefix.global_tempo = self.get_global_tempo()
+            beat_times = self.get_beat_times()
+            prefix.beat_times = beat_times[beat_times < duration]
+
+            self.prefixes[num_samples] = prefix
+
+        return self.prefixes[num_samples]
+
+    def get_frames(self, window_size, hop):
+        """
+        Splits the signal into successive (possibly overlapping) frames
+
+        window_size: size of each frame in seconds
+        hop: how far along each frame is in seconds
+
+        returns: a 2D np array with one frame per row. When the hop is a whole number of samples this is a read only strided view of the signal,
+                 otherwise the frames are gathered into a new array
+        """
+        frame_length = int(round(window_size * self.sample_rate))
+        num_frames = max(0, int((self.get_duration() - window_size) / hop))
+        if num_frames == 0 or frame_length > len(self.signal):
+            return np.zeros((0, frame_length), dtype=self.signal.dtype)
+
+        # a strided view of every possible frame, no copying happens here
+        all_frames = np.lib.stride_tricks.sliding_window_view(self.signal, frame_length)
+
+        hop_samples = hop * self.sample_rate
+        if float(hop_samples).is_integer() and (num_frames - 1) * int(hop_samples) < len(all_frames):
+            # every frame starts a whole number of samples after the last, so the frames are a view too
+            return all_frames[:(num_frames - 1) * int(hop_samples) + 1:int(hop_samples)]
+
+        # frames start at the same positions as if we sliced out each window in turn
+        starts = (np.arange(num_frames) * hop_samples).astype(int)
+        return all_frames[np.minimum(starts, len(all_frames) - 1)]
+
+    def get_spectrogram(self, window_size, hop, window_fn=None, sample_rate=None):
+        """
+        Calculates the magnitude spectrogram of the signal with one batched rfft, caching it so that every metric asking for the same parameters shares it
+
+        window_size: size of each frame in seconds
+        hop: how far along each frame is in seconds
+        window_fn: optionally, name of a window (as understood by scipy.signal.windows.get_window) to apply to each frame, e.g. "hann"
+        sample_rate: optionally, the sample rate to resample the signal to before framing, defaults to the audio's own sample rate
+
+        returns: a 2D np array of the magnitude spectrum of each frame, one frame per row
+        """
+        key = (window_size, hop, window_fn, sample_rate)
+        instrumentation.count_cache("spectrogram", key in self.spectrograms)
+        if key not in self.spectrograms:
+            audio = self
+            if sample_rate is not None and sample_rate != self.sample_rate:
+                audio = self.resample(sample_rate)
+
+            frames = audio.get_frames(window_size, hop)
+            if window_fn is not None:
+                # symmetric window, same as scipy.signal.windows.hann(n)
+                window = scipy.signal.windows.get_window(window_fn, frames.shape[1], fftbins=False)
+                frames = frames * window.astype(self.get_dtype())
+
+            # integer signals are transformed in double precision, float32 signals stay in single precision
+            self.spectrograms[key] = np.abs(scipy.fft.rfft(frames.astype(self.get_dtype(), copy=False), axis=1))
+
+        return self.spectrograms[key]
+
     def resample(self, new_sample_rate):
-        new_signal = scipy.signal.resample(self.signal, int(len(self.signal) * new_sample_rate/self.sample_rate))
-        return Audio(new_signal, new_sample_rate)
+        """
+        Resamples the audio with a polyphase filter, caching the result so that everything needing the same sample rate shares it
+
+        new_sample_rate: the sample rate to resample to in samples/sec
+
+        returns: an Audio object of the resampled signal
+        """
+        instrumentation.count_cache("resampled", new_sample_rate in self.resampled)
+        if new_sample_rate not in self.resampled:
+            with instrumentation.stage("resample"):
+                new_signal = resampling.resample(self.signal, self.sample_rate, new_sample_rate, dtype=self.get_dtype())
+            # same length as we have always resampled to
+            new_signal = new_signal[:int(len(self.signal) * new_sample_rate/self.sample_rate)]
+            self.resampled[new_sample_rate] = Audio(new_signal, new_sample_rate, name=self.name)
+
+        return self.resampled[new_sample_rate]
 
 
@@ -0,0 +1,204 @@
+import classifier.metrics.metric_calculator as metric_calculator
+import classifier.feature_store as feature_store
+import classifier.instrumentation as instrumentation
+import classifier.util as util
+import argparse
+import json
+import os
+import os.path
+import socket
+import socketserver
+import stat
+import tempfile
+import time
+
+# where the daemon listens and the identify CLI connects by default
+SOCKET_PATH = os.path.join(tempfile.gettempdir(), "classifier.sock")
+
+
+class IdentificationDaemon:
+    def __init__(self, reference_dir, metrics=metric_calculator.METRICS, workers=1, feature_store=None):
+        """
+        Identifies unknown recordings against a directory of reference recordings that is read, and has its metrics calculated, once up front.
+        The reference Audio objects, and everything they have cached, are kept for as long as the daemon runs, so each identification only
+        has to read the unknown recording and calculate its own metrics
+
+        reference_dir: path to a directory of reference wavfiles, each of which is identified by its filename
+        metrics: list of MetricCalculators to identify recordings with, defaults to metric_calculator.METRICS
+        workers: number of processes to calculate the reference metrics with, defaults to 1
+        feature_store: optionally, a FeatureStore to load previously calculated reference metrics from and save new ones to, defaults to metric_calculator.FEATURE_STORE
+        """
+        self.metrics = list(metrics)
+        self.feature_store = feature_store
+
+        filenames = sorted(f for f in os.listdir(reference_dir) if f.endswith(".wav") and os.path.isfile(os.path.join(reference_dir, f)))
+        self.names = filenames
+        self.references = [util.read_audio(os.path.join(reference_dir, filename)) for filename in filenames]
+
+        if workers != 1:
+            self.reference_metrics = metric_calculator.calculate_metrics_parallel(self.references, self.metrics, workers=workers, feature_store=feature_store)
+        else:
+            self.reference_metrics = [metric_calculator.calculate_metrics(reference, self.metrics, feature_store=feature_store) for reference in self.references]
+
+    def get_metrics(self, names=None):
+        """
+        names: list of names of metrics, as given by their __repr__, or None for every metric of the daemon
+
+        returns: list of the daemon's MetricCalculators with those names
+        """
+        if names is None:
+            return self.metrics
+
+        metrics = {repr(metric): metric for metric in self.metrics}
+        for name in names:
+            if name not in metrics:
+                raise ValueError(f"Unknown metric: {name}")
+        return [metrics[name] for name in names]
+
+    def identify(self, path, metrics=None, top=1):
+        """
+        Identifies an unknown recording, comparing it against every reference
+
+        path: path to the wavfile of the unknown recording
+        metrics: optionally, list of names of a subset of the daemon's metrics to use, defaults to every metric
+        top: number of the most similar references to return, defaults to 1
+
+        returns: a JSON serialisable dictionary of the most similar reference ("match"), its mean similarity ("similarity") and the similarity
+                 of each metric ("scores"), the top most similar references in the same form ("ranking"), and how long each stage took in seconds ("timings")
+        """
+        metrics = self.get_metrics(metrics)
+        if len(self.references) == 0:
+            raise ValueError("There are no references to identify against")
+
+        start_time = time.perf_counter()
+        timings = {"metrics": {}, "similarity": {}}
+
+        # the unknown recording isn't put in metric_calculator.CACHED_AUDIOS, so it is freed as soon as we are done with it
+        audio = util.read_audio(path)
+        # nor are its metrics persisted, so the feature store only grows with the references, not with every query
+        audio.fingerprint = None
+        timings["read"] = time.perf_counter() - start_time
+
+        # most metrics need the beats, which are tracked by whichever one asks first, so they are timed separately
+        stage_start = time.perf_counter()
+        audio.get_beat_times()
+        timings["beat_tracking"] = time.perf_counter() - stage_start
+
+        unknown_metrics = {}
+        for metric in metrics:
+            stage_start = time.perf_counter()
+            unknown_metrics.update(metric_calculator.calculate_metrics(audio, [metric]))
+            timings["metrics"][repr(metric)] = time.perf_counter() - stage_start
+
+        scores = [{} for _ in self.references]
+        for metric in metrics:
+            stage_start = time.perf_counter()
+            for i, reference in enumerate(self.references):
+                with instrumentation.stage(f"{metric}.calculate_similarity"):
+                    scores[i][repr(metric)] = float(metric.calculate_similarity(audio, reference, unknown_metrics[metric], self.reference_metrics[i][metric]))
+            timings["similarity"][repr(metric)] = time.perf_counter() - stage_start
+
+        similarities = [sum(reference_scores.values()) / len(metrics) for reference_scores in scores]
+        # sorted is stable, so ties go to the first reference, as in get_most_similar
+        ranking = sorted(range(len(self.references)), key=lambda i: -similarities[i])[:top]
+        ranking = [{"reference": self.names[i], "similarity": similarities[i], "scores": scores[i]} for i in ranking]
+
+        timings["total"] = time.perf_counter() - start_time
+
+        return {
+            "path": path,
+            "match": ranking[0]["reference"],
+            "similarity": ranking[0]["similarity"],
+            "scores": ranking[0]["scores"],
+            "ranking": ranking,
+            "timings": timings,
+        }
+
+    def handle(self, request):
+        """
+        Answers a single request
+
+        request: dictionary with the "path" of the recording to identify, and optionally "metrics" and "top", see identify
+
+        returns: the result of identify, or a dictionary with the "path" and an "error" if the recording couldn't be identified
+        """
+        if not isinstance(request, dict):
+            return {"error": f"Malformed request: expected an object, got {type(request).__name__}"}
+
+        path = request.get("path")
+        try:
+            return self.identify(path, metrics=request.get("metrics"), top=request.get("top", 1))
+        except Exception as e:
+            # one bad request shouldn't bring down the daemon and lose everything it has cached
+            return {"path": path, "error": f"{type(e).__name__}: {e}"}
+
+    def create_server(self, socket_path=SOCKET_PATH):
+        """
+        Creates a server answering requests on a Unix socket, see IdentificationHandler for the protocol
+
+        socket_path: path of the socket to listen on, defaults to SOCKET_PATH. A stale socket left there by a daemon that didn't shut down
+                     cleanly is replaced, but anything else there, or a socket another daemon is still listening on, is an error
+
+        returns: the socketserver.UnixStreamServer, which is listening but not yet serving
+        """
+        if os.path.exists(socket_path):
+            if not stat.S_ISSOCK(os.stat(socket_path).st_mode):
+                raise FileExistsError(f"{socket_path} already exists and isn't a socket")
+            with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as connection:
+                try:
+                    connection.connect(socket_path)
+                except ConnectionRefusedError:
+                    # nobody is listening, so it is stale
+                    os.remove(socket_path)
+                else:
+                    raise RuntimeError(f"Another daemon is already listening on {socket_path}")
+
+        server = socketserver.UnixStreamServer(socket_path, IdentificationHandler)
+        server.identification_daemon = self
+        return server
+
+    def serve(self, socket_path=SOCKET_PATH):
+        """
+        Answers requests on a Unix socket until interrupted
+
+        socket_path: see create_server
+        """
+        with self.create_server(socket_path) as server:
+            try:
+                server.serve_forever()
+            finally:
+                os.remove(socket_path)
+
+
+class IdentificationHandler(socketserver.StreamRequestHandler):
+    """
+    Each line a client sends is a JSON request (see IdentificationDaemon.handle), which is answered with a single JSON line.
+    Requests are answered one at a time, in the order they arrive, so a client can stream many requests down one connection
+    """
+
+    def handle(self):
+        for line in self.rfile:
+            if not line.strip():
+                continue
+            try:
+                result = self.server.identification_daemon.handle(json.loads(line))
+            except ValueError as e:
+                # both invalid JSON and lines that aren't valid UTF-8 (or UTF-16/32, which json.loads also detects) are ValueErrors
+                result = {"error": f"Malformed request: {e}"}
+
+            self.wfile.write((json.dumps(result) + "\n").encode())
+            self.wfile.flush()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Keeps a directory of reference recordings loaded, and identifies recordings against it sent over a Unix socket")
+    parser.add_argument("reference_dir", help="directory of reference wavfiles")
+    parser.add_argument("--socket", default=SOCKET_PATH, help=f"path of the socket to listen on, defaults to {SOCKET_PATH}")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="number of processes to calculate the reference metrics with")
+    parser.add_argument("--features", help="directory of a FeatureStore to persist calculated metrics in")
+    args = parser.parse_args()
+
+    store = feature_store.FeatureStore(args.features) if args.features is not None else None
+    daemon = IdentificationDaemon(args.reference_dir, workers=args.workers, feature_store=store)
+    util.log(f"Loaded {len(daemon.references)} references, listening on {args.socket}")
+    daemon.serve(args.socket)
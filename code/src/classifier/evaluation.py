@@ -1,13 +1,17 @@
 import classifier.metrics.metric_calculator as metric_calculator
+import classifier.feature_store as feature_store
+import classifier.similarity_matrix as similarity_matrix
 import matplotlib.pyplot as plt
 import numpy as np
 import classifier.util as util
+import classifier.instrumentation as instrumentation
 import os
 import os.path
 import itertools
 import classifier.transformations.noise as noise
 import classifier.transformations.reverb as reverb
 import classifier.transformations.unique_reverb as unique_reverb
+import classifier.transformations.transform_graph as transform_graph
 
 TRANSFORMS = [
         noise.Noise("../res/noise/room.wav", level=1.0),
@@ -17,6 +21,9 @@ TRANSFORMS = [
 
 data_dir = "../res/data"
 
+# calculated features are persisted here, so re-running over an unchanged corpus doesn't recalculate them
+feature_dir = "../res/features"
+
 class Performance:
     def __init__(self, performer, piece, performance_number, audio, path):
         """
@@ -37,16 +44,17 @@ class Performance:
         return f"Performer: {self.performer}, Piece: {self.piece}, Performance: {self.performance_number}"
 
 
-# cache of audios already found in get_files, maps (path, transforms) tuples to audio objects
+# cache of audios already found in get_files, maps (path, transforms) tuples to audio objects, transforms with the same parameters share entries
 # need this or we recreate the Audio objects on each call of evaluate_metrics, losing caching
 AUDIO_CACHE = {}
 
-def get_files(data_dir, transforms=[]):
+def get_files(data_dir, transforms=[], graph=None):
     """
     processes file names in a directory according to the filename format i use: "participant_{participant number}_{piece name}_{performance number}.wav"
 
     data_dir: path to the directory containing the performance files
     transforms: list of Transformations to apply to each audio file, defaults to []
+    graph: optionally, a TransformGraph containing transforms, which shares intermediate audios with the other combinations of transforms in it
 
     returns: a dictionary indexed by piece name, participant number, then performance number, containing Performance objects.
     """
@@ -55,7 +63,7 @@ def get_files(data_dir, transforms=[]):
     file_dict = {}
 
     for filename in files:
-        print(filename)
+        util.log(filename, level=2)
         # string processing based on format of filenames
         filename_l = filename.split("_")
         participant_number = int(filename_l[1])
@@ -65,11 +73,16 @@ def get_files(data_dir, transforms=[]):
 
         audio = AUDIO_CACHE.get((full_path, tuple(transforms)))
         if audio == None:
-            # read the audio data
-            audio = util.read_audio(full_path)
-            # apply transforms repeatedly
-            for transform in transforms:
-                audio = transform.apply(audio)
+            if graph is not None:
+                # the graph releases its intermediate audios once every combination has been got, so the result is kept here like any other
+                audio = graph.get(full_path, transforms)
+            else:
+                # read the audio data
+                audio = util.read_audio(full_path)
+                # apply transforms repeatedly
+                for transform in transforms:
+                    with instrumentation.stage(f"{type(transform).__name__}.apply"):
+                        audio = transform.apply(audio)
 
             AUDIO_CACHE[full_path, tuple(transforms)] = audio
 
@@ -84,20 +97,36 @@ def get_files(data_dir, transforms=[]):
 
     return file_dict
 
-def evaluate_metrics(data_dir, metrics, transforms=[]):
+def release_files(transforms):
+    """
+    Forgets the audios get_files found for a combination of transforms, so their signals can be freed once nothing else uses them
+
+    transforms: list of Transformations passed to get_files
+    """
+    for key in [key for key in AUDIO_CACHE if key[1] == tuple(transforms)]:
+        del AUDIO_CACHE[key]
+
+def evaluate_metrics(data_dir, metrics, transforms=[], workers=1, graph=None):
     """
     Evaluates a set of metrics on all of the files in a directory
 
     data_dir: string of path to data directory
     metrics: list of MetricCalculators
     transforms: list of Transformations that are applied to each performance audio, defaults to []
+    workers: number of processes to calculate metrics with, defaults to 1, which calculates everything in this process
+    graph: optionally, a TransformGraph containing transforms, see get_files
 
     returns: float from 0-1 representing percentage of trials guessed correctly
     """
-    print(f"Evaluating metrics: {metrics}")
-    print(f"Using transforms: {transforms}")
+    util.log(f"Evaluating metrics: {metrics}")
+    util.log(f"Using transforms: {transforms}")
 
-    files = get_files(data_dir, transforms=transforms)
+    files = get_files(data_dir, transforms=transforms, graph=graph)
+
+    if workers != 1:
+        # calculate the metrics of every performance up front in parallel, so every trial below just uses the cached metrics
+        all_performances = [performance for piece in files.values() for performer in piece.values() for performance in performer.values()]
+        metric_calculator.calculate_metrics_parallel([performance.audio for performance in all_performances], metrics, workers=workers)
 
     total_trials = 0
     total_correct = 0
@@ -112,17 +141,17 @@ def evaluate_metrics(data_dir, metrics, transforms=[]):
         for performance_num in range(1, performances_per_piece+1):
             chosen_performance = None
             other_performances = []
-            print(performance_num)
+            util.log(performance_num, level=2)
             for performer in files[piece]:
                 for performance in files[piece][performer]:
                     # this relies on the fact that performer and performance are just numbers and sensibly named
-                    print(performer, performance)
+                    util.log(f"{performer} {performance}", level=2)
                     if (performer-1)*2 + performance == performance_num:
                         chosen_performance = files[piece][performer][performance]
                     else:
                         other_performances.append(files[piece][performer][performance])
 
-            print(f"Using {chosen_performance}...")
+            util.log(f"Using {chosen_performance}...")
             similarity, detected_performance_audio = metric_calculator.get_most_similar(chosen_performance.audio, [p.audio for p in other_performances], metrics)
 
             detected_performance = None
@@ -135,9 +164,9 @@ def evaluate_metrics(data_dir, metrics, transforms=[]):
 
             if detected_performance.performer == chosen_performance.performer and detected_performance.piece == chosen_performance.piece:
                 total_correct += 1
-                print(f"Correctly detected:\n{chosen_performance}\nas\n{detected_performance}")
+                util.log(f"Correctly detected:\n{chosen_performance}\nas\n{detected_performance}")
             else:
-                print(f"Incorrectly detected:\n{chosen_performance}\nas\n{detected_performance}")
+                util.log(f"Incorrectly detected:\n{chosen_performance}\nas\n{detected_performance}")
 
             total_trials += 1
 
@@ -145,7 +174,45 @@ def evaluate_metrics(data_dir, metrics, transforms=[]):
     return total_correct/total_trials
 
 
+def evaluate_metric_combinations(data_dir, metric_combinations, transforms=[], workers=1, k=1, graph=None):
+    """
+    Evaluates many combinations of metrics on all of the files in a directory, giving the same results as calling evaluate_metrics for each combination,
+    but only calculating the similarity between each pair of performances once per metric
+
+    data_dir: string of path to data directory
+    metric_combinations: list of lists of MetricCalculators
+    transforms: list of Transformations that are applied to each performance audio, defaults to []
+    workers: number of processes to calculate metrics with, defaults to 1, which calculates everything in this process
+    k: a trial counts as correct if a performance by the same performer is in the k most similar performances, defaults to 1
+    graph: optionally, a TransformGraph containing transforms, see get_files
+
+    returns: a dictionary indexed by metric combination of floats from 0-1 representing percentage of trials guessed correctly
+    """
+    util.log(f"Using transforms: {transforms}")
+
+    files = get_files(data_dir, transforms=transforms, graph=graph)
+
+    # every performance of a piece is compared to every other performance of the same piece, in the same order as evaluate_metrics
+    pieces = []
+    for piece in files:
+        performances = [performance for performer in files[piece].values() for performance in performer.values()]
+        matrices = similarity_matrix.SimilarityMatrices([performance.audio for performance in performances], workers=workers)
+        performers = np.array([performance.performer for performance in performances])
+        pieces.append((matrices, performers))
+
+    results = {}
+    for metric_combination in metric_combinations:
+        hits = [similarity_matrix.top_k_hits(matrices.rank(metric_combination), performers, k) for matrices, performers in pieces]
+        results[metric_combination] = float(np.mean(np.concatenate(hits)))
+        util.log(f"{metric_combination}: {results[metric_combination]}")
+
+    return results
+
+
 if __name__ == "__main__":
+    metric_calculator.FEATURE_STORE = feature_store.FeatureStore(feature_dir)
+    workers = os.cpu_count()
+
     # need to cast to list because we consume the generator in making metric_results
     transform_combinations = list(itertools.chain.from_iterable(itertools.combinations(TRANSFORMS, i) for i in range(0, len(TRANSFORMS)+1)))
 
@@ -163,13 +230,19 @@ if __name__ == "__main__":
     """
 
     metric_results = {transform_combination: {} for transform_combination in transform_combinations}
+    # combinations sharing their first transforms share the audios those produce
+    graph = transform_graph.TransformGraph(transform_combinations)
 
-    for transform_combination in transform_combinations:
-        metric_combinations = itertools.chain.from_iterable(itertools.combinations(metric_calculator.METRICS, i) for i in range(1, len(metric_calculator.METRICS)+1))
-        for metric_combination in metric_combinations:
-            metric_results[transform_combination][metric_combination] = evaluate_metrics(data_dir, metric_combination, transforms=transform_combination)
+    # anything calculated in the worker processes isn't recorded, only what happens in this process
+    with instrumentation.record(memory=False) as recorder:
+        for transform_combination in transform_combinations:
+            metric_combinations = list(itertools.chain.from_iterable(itertools.combinations(metric_calculator.METRICS, i) for i in range(1, len(metric_calculator.METRICS)+1)))
+            metric_results[transform_combination] = evaluate_metric_combinations(data_dir, metric_combinations, transforms=transform_combination, workers=workers, graph=graph)
+            # every metric of these audios is in the feature store now, so we don't need to keep them around
+            release_files(transform_combination)
 
     print(metric_results)
+    util.log(recorder.format_summary())
     """
 
     # for generating noise level testing
@@ -0,0 +1,149 @@
+import hashlib
+import json
+import os
+import os.path
+import zipfile
+import numpy as np
+
+
+class FeatureStore:
+    def __init__(self, directory):
+        """
+        An on-disk store of calculated features (metrics, beat times etc.), so they don't have to be recalculated by every new process.
+        Features are indexed by the fingerprint of the audio they were calculated from, along with the name, version and parameters of
+        whatever calculated them, and each one is stored as an uncompressed .npz file alongside a small JSON index.
+        New entries are appended to a journal rather than rewriting the whole index, which is only rewritten when the store is opened or pruned
+
+        directory: path to the directory to keep the features in, created if it doesn't exist
+        """
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+        self.index_path = os.path.join(directory, "index.json")
+        self.journal_path = os.path.join(directory, "journal.jsonl")
+        if os.path.isfile(self.index_path):
+            with open(self.index_path) as f:
+                self.index = json.load(f)
+        else:
+            self.index = {}
+
+        if os.path.isfile(self.journal_path):
+            with open(self.journal_path) as f:
+                for line in f:
+                    try:
+                        key, entry = json.loads(line)
+                    except ValueError:
+                        # the last line can be half written if a process was killed while saving, its feature is just recalculated
+                        continue
+                    self.index[key] = entry
+            # fold the journal into the index, so it only ever holds what has been saved since the store was last opened
+            self.write_index()
+
+    def get_key(self, fingerprint, name, version, parameters={}):
+        """
+        Works out the key a feature is stored under
+
+        fingerprint: the fingerprint of the Audio the feature was calculated from
+        name: name of the feature, e.g. the name of the MetricCalculator class that calculated it
+        version: version of the algorithm that calculated the feature, changing this invalidates previously stored features
+        parameters: dictionary of any parameters that affect the feature
+
+        returns: a hex string key
+        """
+        description = json.dumps([fingerprint, name, version, parameters], sort_keys=True)
+        return hashlib.sha256(description.encode()).hexdigest()
+
+    def get_path(self, key):
+        return os.path.join(self.directory, f"{key}.npz")
+
+    def contains(self, fingerprint, name, version, parameters={}):
+        return self.get_key(fingerprint, name, version, parameters) in self.index
+
+    def load(self, fingerprint, name, version, parameters={}):
+        """
+        Loads a feature from the store
+
+        fingerprint, name, version, parameters: see get_key
+
+        returns: the stored feature, or None if it isn't in the store or its file is corrupt
+        """
+        key = self.get_key(fingerprint, name, version, parameters)
+        if key not in self.index or not os.path.isfile(self.get_path(key)):
+            return None
+
+        try:
+            with np.load(self.get_path(key), allow_pickle=False) as stored:
+                kind = str(stored["kind"])
+                if kind == "tuple":
+                    return tuple(FeatureStore.from_array(stored[f"item_{i}"]) for i in range(int(stored["length"])))
+                return FeatureStore.from_array(stored["value"])
+        except (OSError, EOFError, ValueError, KeyError, zipfile.BadZipFile):
+            # a corrupt file, e.g. written by an older version that saved in place and was killed mid save, is dropped and recalculated
+            os.remove(self.get_path(key))
+            del self.index[key]
+            return None
+
+    def save(self, fingerprint, name, version, value, parameters={}):
+        """
+        Saves a feature to the store
+
+        fingerprint, name, version, parameters: see get_key
+        value: the feature to store, either a np array, a number, or a tuple of these
+        """
+        key = self.get_key(fingerprint, name, version, parameters)
+
+        # write to a temporary file first, as write_index does, so that a process killed mid save never leaves a half-written feature behind.
+        # The process ID keeps processes saving the same feature at once from writing to the same temporary file
+        temporary_path = f"{self.get_path(key)}.{os.getpid()}.tmp"
+        with open(temporary_path, "wb") as f:
+            if isinstance(value, tuple):
+                arrays = {f"item_{i}": np.asarray(item) for i, item in enumerate(value)}
+                np.savez(f, kind="tuple", length=len(value), **arrays)
+            else:
+                np.savez(f, kind="value", value=np.asarray(value))
+        os.replace(temporary_path, self.get_path(key))
+
+        self.index[key] = {
+            "fingerprint": fingerprint,
+            "name": name,
+            "version": version,
+            "parameters": parameters,
+        }
+        # appending one line keeps saving n features O(n), rather than O(n^2) if the whole index were rewritten each time
+        with open(self.journal_path, "a") as f:
+            f.write(json.dumps([key, self.index[key]]) + "\n")
+
+    def prune(self, current_versions):
+        """
+        Deletes stored features calculated by outdated versions of an algorithm
+
+        current_versions: dictionary mapping feature names to their current versions, features with other names are left alone
+
+        returns: the number of features deleted
+        """
+        outdated = [key for key, entry in self.index.items()
+                    if entry["name"] in current_versions and entry["version"] != current_versions[entry["name"]]]
+
+        for key in outdated:
+            if os.path.isfile(self.get_path(key)):
+                os.remove(self.get_path(key))
+            del self.index[key]
+
+        self.write_index()
+        return len(outdated)
+
+    def write_index(self):
+        # write to a temporary file first so that we never leave a half-written index behind
+        temporary_path = self.index_path + ".tmp"
+        with open(temporary_path, "w") as f:
+            json.dump(self.index, f)
+        os.replace(temporary_path, self.index_path)
+        # everything in the journal is in the index now. If we are killed before this, replaying the journal again is harmless
+        if os.path.isfile(self.journal_path):
+            os.remove(self.journal_path)
+
+    def from_array(array):
+        # numbers get stored as 0-dimensional arrays, turn them back into numbers
+        if array.ndim == 0:
+            return array.item()
+        return array
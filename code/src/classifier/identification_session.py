@@ -0,0 +1,244 @@
+import classifier.audio as audio
+import classifier.instrumentation as instrumentation
+import classifier.metrics.metric_calculator as metric_calculator
+import classifier.metrics.tempo as tempo
+import classifier.streaming as streaming
+import classifier.util as util
+import numpy as np
+
+
+class IdentificationSession:
+    def __init__(self, references, sample_rate, metrics=metric_calculator.METRICS, labels=None, update_interval=10.0, min_duration=20.0,
+            threshold=0.05, confirmations=2, dtype=np.float32, workers=1):
+        """
+        Identifies an unknown performance while it is still arriving, a block of audio at a time, stopping as soon as one reference is clearly ahead.
+        The unknown performance's onset function and beats are tracked as each block arrives, by a StreamingOnsetDetector and StreamingBeatTracker.
+        Every update_interval seconds, the metrics of everything heard so far are calculated from these, and compared by calculate_similarity with
+        the metrics of the same length of each reference, so that metrics summarising a whole performance, like offsets, compare like with like.
+        The starts of the references are cached on the references themselves (see Audio.get_prefix), so later sessions reuse their metrics
+
+        references: list of Audio objects, or strings representing paths, of the reference performances
+        sample_rate: sample rate of the unknown performance in samples/sec
+        metrics: list of MetricCalculators, defaults to metric_calculator.METRICS
+        labels: optionally, list of who performed each reference. The margin is to the best reference with a different label, so that two
+                references by the same performer don't hold each other back. Defaults to every reference having its own label
+        update_interval: how many seconds of audio to wait between updating the ranking, defaults to 10
+        min_duration: how many seconds of audio to wait before the first update, defaults to 20
+        threshold: how far ahead of every other performer, in mean similarity, the best reference has to be to stop early, defaults to 0.05
+        confirmations: how many updates in a row the same reference has to be that far ahead to stop early, defaults to 2
+        dtype: the np dtype to keep the unknown performance in, defaults to float32 as in util.read_audio
+        workers: number of processes to calculate the metrics of the starts of the references with, defaults to 1
+        """
+        self.references = []
+        for reference in references:
+            if isinstance(reference, str):
+                if reference not in metric_calculator.CACHED_AUDIOS:
+                    metric_calculator.CACHED_AUDIOS[reference] = util.read_audio(reference)
+                reference = metric_calculator.CACHED_AUDIOS[reference]
+            self.references.append(reference)
+
+        self.sample_rate = sample_rate
+        self.metrics = list(metrics)
+        self.labels = list(labels) if labels is not None else list(range(len(self.references)))
+        self.update_interval = update_interval
+        self.min_duration = min_duration
+        self.threshold = threshold
+        self.confirmations = confirmations
+        self.workers = workers
+
+        self.detector = streaming.StreamingOnsetDetector(sample_rate)
+        self.tracker = streaming.StreamingBeatTracker(window_advance=self.detector.window_advance)
+        # the onset values and beat times of the unknown performance so far, as lists of arrays that are joined up at each update
+        self.onsets = []
+        self.beats = []
+        # the Audio object of the unknown performance the latest update calculated its metrics from
+        self.unknown_audio = None
+
+        # the unknown performance so far, in a buffer that doubles in size as it fills so adding n samples only copies O(n) samples
+        self.signal = np.zeros(0, dtype=dtype)
+        self.num_samples = 0
+        # number of samples to have before the next update
+        self.next_update = int(max(min_duration, update_interval) * sample_rate)
+        # number of samples the latest update used
+        self.updated_samples = 0
+
+        # (mean similarity, reference index) tuples from the latest update, best first
+        self.ranking = []
+        # similarity of each metric to each reference from the latest update, indexed by reference index then MetricCalculator
+        self.scores = []
+        # how many updates in a row the current best reference has been far enough ahead
+        self.confident_updates = 0
+        self.stopped = False
+        self.finished = False
+
+    def get_duration(self):
+        return self.num_samples / self.sample_rate
+
+    def add(self, block):
+        """
+        Adds the next block of the unknown performance, updating the ranking at each multiple of update_interval (after min_duration) it passes
+
+        block: 1D np array of the next samples of the unknown performance
+
+        returns: True if the session has stopped early, after which any more blocks are ignored
+        """
+        if self.stopped or self.finished:
+            return self.stopped
+
+        if self.num_samples + len(block) > len(self.signal):
+            grown = np.zeros(max(2 * len(self.signal), self.num_samples + len(block)), dtype=self.signal.dtype)
+            grown[:self.num_samples] = self.signal[:self.num_samples]
+            self.signal = grown
+        self.signal[self.num_samples:self.num_samples + len(block)] = block
+        self.num_samples += len(block)
+
+        onsets = self.detector.process(block)
+        self.onsets.append(onsets)
+        self.beats.append(self.tracker.process(onsets))
+
+        # updates are always at the same lengths whatever size the blocks are, so the starts of the references cached by one session suit the next
+        while self.num_samples >= self.next_update and not self.stopped:
+            self.update(self.next_update)
+            self.next_update += int(self.update_interval * self.sample_rate)
+
+        return self.stopped
+
+    def finish(self):
+        """
+        Finishes the session once the whole unknown performance has arrived, updating the ranking with all of it if we haven't stopped early
+        and either it has been added to since the latest update, or the last few beats, which the tracker holds back until it is sure of them, change it
+
+        returns: see get_best
+        """
+        if not self.stopped and not self.finished:
+            onsets = self.detector.flush()
+            self.onsets.append(onsets)
+            last_beats = np.concatenate((self.tracker.process(onsets), self.tracker.flush()))
+            self.beats.append(last_beats)
+            if self.num_samples > self.updated_samples or (self.num_samples > 0 and np.any(last_beats < self.updated_samples / self.sample_rate)):
+                self.update(self.num_samples)
+        self.finished = True
+        return self.get_best()
+
+    def get_unknown_audio(self, num_samples):
+        """
+        num_samples: number of samples of the unknown performance to include
+
+        returns: an Audio object of the start of the unknown performance, with the onset function and beats tracked so far rather than tracking them again
+        """
+        unknown_audio = audio.Audio(self.signal[:num_samples], self.sample_rate, name="unknown")
+        duration = unknown_audio.get_duration()
+
+        self.onsets = [np.concatenate(self.onsets)]
+        self.beats = [np.concatenate(self.beats)]
+        num_windows = int(duration / self.detector.window_advance)
+        unknown_audio.onset_function = tempo.OnsetFunction(self.onsets[0][:num_windows], self.detector.window_advance, self.detector.onset_sample_rate)
+        unknown_audio.beat_times = self.beats[0][self.beats[0] < duration]
+        # None until the tracker has heard enough to estimate it, in which case it is estimated from the onset function if anything needs it
+        unknown_audio.global_tempo = self.tracker.tempo
+
+        return unknown_audio
+
+    def update(self, num_samples):
+        """
+        Ranks the references against the start of the unknown performance, and stops the session if the best reference is far enough ahead
+
+        num_samples: number of samples of the unknown performance to rank against
+        """
+        self.updated_samples = num_samples
+        with instrumentation.stage("IdentificationSession.update"):
+            self.unknown_audio = self.get_unknown_audio(num_samples)
+            reference_audios = [self.get_reference_prefix(reference, num_samples) for reference in self.references]
+
+            if self.workers != 1:
+                # calculate everything up front in parallel, after which the calls below just fetch cached metrics
+                metric_calculator.calculate_metrics_parallel(reference_audios, self.metrics, workers=self.workers)
+            unknown_metrics = metric_calculator.calculate_metrics(self.unknown_audio, self.metrics)
+
+            self.scores = []
+            similarities = []
+            for reference, reference_audio in zip(self.references, reference_audios):
+                reference_metrics = metric_calculator.calculate_metrics(reference_audio, self.metrics)
+                if reference_audio is not reference:
+                    # only the metrics and beats of the start are used again, the spectrograms would otherwise be kept for every length
+                    reference_audio.spectrograms = {}
+                    reference_audio.resampled = {}
+
+                scores = {}
+                for metric in self.metrics:
+                    with instrumentation.stage(f"{metric}.calculate_similarity"):
+                        scores[metric] = metric.calculate_similarity(self.unknown_audio, reference_audio, unknown_metrics[metric], reference_metrics[metric])
+                self.scores.append(scores)
+                # added up in the same order as get_most_similar, so the same audio gives exactly the same similarities
+                similarity_sum = 0
+                for metric in self.metrics:
+                    similarity_sum += scores[metric]
+                similarities.append(similarity_sum / len(self.metrics))
+
+        previous_best = self.ranking[0][1] if len(self.ranking) > 0 else None
+        # sorted is stable, so ties go to the first reference, as in get_most_similar
+        self.ranking = [(similarities[i], i) for i in sorted(range(len(similarities)), key=lambda i: -similarities[i])]
+
+        margin = self.get_margin()
+        if margin < self.threshold:
+            self.confident_updates = 0
+        elif self.ranking[0][1] == previous_best:
+            self.confident_updates += 1
+        else:
+            self.confident_updates = 1
+
+        util.log(f"After {num_samples / self.sample_rate:.1f}s, best reference is {self.references[self.ranking[0][1]].name} by a margin of {margin:.4f}", level=2)
+
+        if self.confident_updates >= self.confirmations:
+            self.stopped = True
+            util.log(f"Stopped early after {num_samples / self.sample_rate:.1f}s")
+
+    def get_reference_prefix(self, reference, num_samples):
+        """
+        reference: Audio object of a reference performance
+        num_samples: number of samples of the unknown performance
+
+        returns: an Audio object of as much of reference as num_samples of the unknown performance lasts, cached on reference,
+                 or reference itself if the unknown performance is at least as long
+        """
+        return reference.get_prefix(int(num_samples * reference.sample_rate / self.sample_rate))
+
+    def get_margin(self):
+        """
+        returns: how far ahead, in mean similarity, the best reference is of the best reference by anyone else, inf if nobody else is in the ranking
+        """
+        if len(self.ranking) == 0:
+            return 0
+        best_similarity, best = self.ranking[0]
+        for similarity, i in self.ranking[1:]:
+            if self.labels[i] != self.labels[best]:
+                return best_similarity - similarity
+        return np.inf
+
+    def get_best(self):
+        """
+        returns: a (similarity, Audio) tuple of the best reference so far, as get_most_similar returns, or None if there hasn't been an update yet
+        """
+        if len(self.ranking) == 0:
+            return None
+        similarity, i = self.ranking[0]
+        return (similarity, self.references[i])
+
+
+def identify_incrementally(blocks, references, sample_rate, **kwargs):
+    """
+    Identifies a performance from successive blocks of its audio, stopping as soon as the IdentificationSession is confident
+
+    blocks: iterable of 1D np arrays of successive blocks of the unknown performance, which stops being consumed once the session stops
+    references: see IdentificationSession
+    sample_rate: see IdentificationSession
+    kwargs: any other arguments for the IdentificationSession
+
+    returns: the finished IdentificationSession, see its get_best, stopped and get_duration for the answer and how much audio it needed
+    """
+    session = IdentificationSession(references, sample_rate, **kwargs)
+    for block in blocks:
+        if session.add(block):
+            break
+    session.finish()
+    return session
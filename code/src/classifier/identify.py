@@ -0,0 +1,53 @@
+import classifier.daemon as daemon
+import argparse
+import json
+import os.path
+import socket
+import sys
+
+
+def submit(paths, socket_path=daemon.SOCKET_PATH, metrics=None, top=1):
+    """
+    Asks a running IdentificationDaemon to identify recordings, one at a time down a single connection
+
+    paths: list of paths to the wavfiles of the recordings to identify
+    socket_path: path of the socket the daemon is listening on, defaults to daemon.SOCKET_PATH
+    metrics: optionally, list of names of the metrics to identify with, defaults to every metric of the daemon
+    top: number of the most similar references to return for each recording, defaults to 1
+
+    returns: a generator of the result for each recording, as described in IdentificationDaemon.identify, in the same order as paths
+    """
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as connection:
+        connection.connect(socket_path)
+        with connection.makefile("rwb") as stream:
+            for path in paths:
+                # the daemon may well be running from a different directory
+                request = {"path": os.path.abspath(path), "top": top}
+                if metrics is not None:
+                    request["metrics"] = list(metrics)
+
+                # waiting for each answer before sending the next request means neither side can fill up the socket's buffers
+                stream.write((json.dumps(request) + "\n").encode())
+                stream.flush()
+                line = stream.readline()
+                if not line:
+                    raise ConnectionError("Daemon closed the connection")
+                yield json.loads(line)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Identifies recordings with a running classifier.daemon, printing a JSON line for each as it is identified")
+    parser.add_argument("paths", nargs="+", help="wavfiles of the recordings to identify")
+    parser.add_argument("--socket", default=daemon.SOCKET_PATH, help=f"path of the socket the daemon is listening on, defaults to {daemon.SOCKET_PATH}")
+    parser.add_argument("--metrics", help="comma separated names of the metrics to use, e.g. Chroma,Tempo, defaults to every metric")
+    parser.add_argument("--top", type=int, default=1, help="number of the most similar references to give for each recording")
+    args = parser.parse_args()
+
+    metrics = args.metrics.split(",") if args.metrics is not None else None
+
+    failed = False
+    for result in submit(args.paths, args.socket, metrics, args.top):
+        print(json.dumps(result), flush=True)
+        failed = failed or "error" in result
+
+    sys.exit(1 if failed else 0)
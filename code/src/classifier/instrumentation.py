@@ -0,0 +1,157 @@
+import contextlib
+import time
+import tracemalloc
+
+# the Recorder stages and cache lookups are recorded to, set by record. While this is None nothing is recorded
+RECORDER = None
+
+# what stage returns while nothing is being recorded, it does nothing on entering or exiting
+NULL_STAGE = contextlib.nullcontext()
+
+
+class Recorder:
+    def __init__(self, memory=True):
+        """
+        Records how long each stage of a run takes and how much memory it needs, along with how often each cache is hit or missed
+
+        memory: if True, the peak memory allocated by each stage is measured with tracemalloc, which slows everything else down a fair bit, defaults to True
+        """
+        self.memory = memory
+        # one dictionary per stage, in the order they finished, with the "stage" name, its "depth" in the stages that were running,
+        # the "wall_time" and "cpu_time" in seconds, and the "peak_memory" in bytes allocated above what was allocated when it started (None without memory)
+        self.stages = []
+        # [hits, misses] of each cache, indexed by cache name
+        self.caches = {}
+        # [start memory, highest memory seen] of each stage that is running, innermost last
+        self.running = []
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        if self.memory:
+            current, peak = tracemalloc.get_traced_memory()
+            if len(self.running) > 0:
+                # resetting the peak below loses it, so the stage we are inside of has to keep hold of it
+                self.running[-1][1] = max(self.running[-1][1], peak)
+            tracemalloc.reset_peak()
+            memory = [current, current]
+        else:
+            memory = None
+
+        depth = len(self.running)
+        self.running.append(memory)
+        start_wall = time.perf_counter()
+        start_cpu = time.process_time()
+        try:
+            yield
+        finally:
+            wall_time = time.perf_counter() - start_wall
+            cpu_time = time.process_time() - start_cpu
+            self.running.pop()
+
+            peak_memory = None
+            if self.memory:
+                memory[1] = max(memory[1], tracemalloc.get_traced_memory()[1])
+                peak_memory = memory[1] - memory[0]
+                if len(self.running) > 0:
+                    self.running[-1][1] = max(self.running[-1][1], memory[1])
+
+            self.stages.append({"stage": name, "depth": depth, "wall_time": wall_time, "cpu_time": cpu_time, "peak_memory": peak_memory})
+
+    def count_cache(self, name, hit):
+        counts = self.caches.setdefault(name, [0, 0])
+        counts[0 if hit else 1] += 1
+
+    def summarise(self):
+        """
+        returns: a dictionary indexed by stage name, of dictionaries of how many times it ran ("count"), its total "wall_time" and "cpu_time",
+                 and the highest "peak_memory" of any one run
+        """
+        summary = {}
+        for stage in self.stages:
+            if stage["stage"] not in summary:
+                summary[stage["stage"]] = {"count": 0, "wall_time": 0, "cpu_time": 0, "peak_memory": stage["peak_memory"]}
+            stage_summary = summary[stage["stage"]]
+            stage_summary["count"] += 1
+            stage_summary["wall_time"] += stage["wall_time"]
+            stage_summary["cpu_time"] += stage["cpu_time"]
+            if stage["peak_memory"] is not None:
+                stage_summary["peak_memory"] = max(stage_summary["peak_memory"], stage["peak_memory"])
+
+        return summary
+
+    def format_summary(self):
+        """
+        returns: a string of a table of summarise, slowest stage first, followed by a table of the hits and misses of each cache
+        """
+        summary = self.summarise()
+        width = max([len("Stage")] + [len(name) for name in summary])
+        lines = [f"{'Stage':<{width}}  {'Count':>7}  {'Wall (s)':>10}  {'CPU (s)':>10}  {'Peak (MiB)':>10}"]
+        for name, stage in sorted(summary.items(), key=lambda item: -item[1]["wall_time"]):
+            peak_memory = f"{stage['peak_memory'] / (1 << 20):.1f}" if stage["peak_memory"] is not None else "-"
+            lines.append(f"{name:<{width}}  {stage['count']:>7}  {stage['wall_time']:>10.3f}  {stage['cpu_time']:>10.3f}  {peak_memory:>10}")
+
+        if len(self.caches) > 0:
+            width = max([len("Cache")] + [len(name) for name in self.caches])
+            lines.append("")
+            lines.append(f"{'Cache':<{width}}  {'Hits':>7}  {'Misses':>7}")
+            for name, (hits, misses) in sorted(self.caches.items()):
+                lines.append(f"{name:<{width}}  {hits:>7}  {misses:>7}")
+
+        return "\n".join(lines)
+
+
+@contextlib.contextmanager
+def record(memory=True):
+    """
+    Records everything that happens inside the with statement, e.g.
+
+        with instrumentation.record() as recorder:
+            metric_calculator.get_most_similar(...)
+        print(recorder.format_summary())
+
+    memory: see Recorder
+
+    returns: the Recorder, which keeps everything that was recorded after the with statement
+    """
+    global RECORDER
+    recorder = Recorder(memory)
+    previous_recorder = RECORDER
+    # only stop tracing memory afterwards if we were the ones to start it
+    start_tracing = memory and not tracemalloc.is_tracing()
+    if start_tracing:
+        tracemalloc.start()
+
+    RECORDER = recorder
+    try:
+        yield recorder
+    finally:
+        RECORDER = previous_recorder
+        if start_tracing:
+            tracemalloc.stop()
+
+
+def stage(name):
+    """
+    Times a stage of a run, if we are recording, e.g.
+
+        with instrumentation.stage("read_audio"):
+            ...
+
+    name: name of the stage, runs of stages with the same name are added together in the summary
+
+    returns: a context manager
+    """
+    if RECORDER is None:
+        return NULL_STAGE
+    return RECORDER.stage(name)
+
+
+def count_cache(name, hit):
+    """
+    Counts a lookup in a cache, if we are recording
+
+    name: name of the cache
+    hit: whether what was looked up was in the cache
+    """
+    if RECORDER is not None:
+        RECORDER.count_cache(name, hit)
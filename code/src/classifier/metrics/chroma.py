@@ -4,7 +4,13 @@ import numpy as np
 import matplotlib.pyplot as plt
 import classifier.metrics.metric as metric
 
+# matrices projecting spectra onto the 12 pitch classes, indexed by (number of spectrum bins, sample rate, dtype)
+PITCH_CLASS_PROJECTIONS = {}
+
 class ChromaCalculator(metric.MetricCalculator):
+    # a spectrogram of the whole signal, and the most expensive comparison
+    COST = 5
+
     def __init__(self, window_size=0.1, window_advance=0.025):
         """
         window_size: the size of the window to take spectras from in seconds
@@ -23,18 +29,12 @@ class ChromaCalculator(metric.MetricCalculator):
         returns: a 12xn NP array containing a series of pitch class profiles for windows of the audio signal
         """
 
-        chroma_array = np.zeros((int((audio.get_duration() - self.window_size) / self.window_advance), 12))
-        num_windows = len(chroma_array)
-        for window in range(num_windows):
-            window_start = int(window * self.window_advance * audio.sample_rate)
-            window_end = int((window * self.window_advance +
-                          self.window_size) * audio.sample_rate)
-
-            window_signal = audio.signal[window_start:window_end]
+        spectrogram = audio.get_spectrogram(self.window_size, self.window_advance)
 
-            #TODO: maybe apply hanning window?
+        #TODO: maybe apply hanning window?
 
-            chroma_array[window] = ChromaCalculator.calculate_pitch_profile(window_signal, audio.sample_rate)
+        projection = ChromaCalculator.get_pitch_class_projection(spectrogram.shape[1], audio.sample_rate, spectrogram.dtype)
+        chroma_array = spectrogram @ projection.T
 
 
         # now we normalise
@@ -113,6 +113,14 @@ class ChromaCalculator(metric.MetricCalculator):
         # so, we apply exp(-x) to get similarity
         return np.exp(-mse)
 
+    def calculate_embedding(self, metric):
+        """
+        metric: an output of self.calculate_metric
+
+        returns: a 24-length np array of the mean and standard deviation of each pitch class over time
+        """
+        return np.concatenate((np.mean(metric, axis=0), np.std(metric, axis=0)))
+
     def calculate_pitch_profile(signal, sample_rate):
         """
         Calculates the pitch profile of a signal
@@ -124,22 +132,64 @@ class ChromaCalculator(metric.MetricCalculator):
         """
 
         spectrum = np.abs(scipy.fft.rfft(signal))
+
+        return ChromaCalculator.spectrum_to_pitch_profile(spectrum, sample_rate)
+
+    def spectrum_to_pitch_profile(spectrum, sample_rate):
+        """
+        Calculates the pitch profile from the magnitude spectrum of a signal
+
+        spectrum: 1D np array of the magnitude of the rfft of the signal
+        sample_rate: the sample rate of the signal
+
+        returns: a 12-length NP array containing a coefficient for each pitch class
+        """
+
+        spectrum = np.absolute(spectrum)
+        projection = ChromaCalculator.get_pitch_class_projection(len(spectrum), sample_rate, util.float_dtype(spectrum))
+
+        return projection @ spectrum
+
+    def get_pitch_class_projection(num_bins, sample_rate, dtype=np.float64):
+        """
+        Gets the matrix mapping spectrum bins onto pitch classes, building and caching it if we haven't seen it before
+
+        num_bins: the length of the spectra to be projected, which is decided by the frame length
+        sample_rate: the sample rate of the signal the spectra are taken from
+        dtype: the np dtype of the matrix, which should match the spectra so that projecting them doesn't change their precision, defaults to float64
+
+        returns: a 12 x num_bins NP array, where entry (p, i) is how many times bin i counts towards pitch class p
+        """
+        key = (num_bins, sample_rate, np.dtype(dtype))
+        if key in PITCH_CLASS_PROJECTIONS:
+            return PITCH_CLASS_PROJECTIONS[key]
+
         max_frequency = sample_rate/2
 
-        freq_to_index = lambda f: int(f * (len(spectrum)/max_frequency))
+        freq_to_index = lambda f: int(f * (num_bins/max_frequency))
 
-        ret = np.zeros(12)
+        projection = np.zeros((12, num_bins))
 
         # corresponds to lowest/highest notes on a piano
         for pitch in range(21, 109):
             lower_frequency = int(2 ** ((pitch - 0.5 - 69)/12) * 440)
             upper_frequency = int(2 ** ((pitch + 0.5 - 69)/12) * 440)
 
-            for index in range(freq_to_index(lower_frequency), freq_to_index(upper_frequency)):
-                ret[pitch % 12] += np.absolute(spectrum[index])
+            # bins above the nyquist frequency don't exist for low sample rates
+            indices = np.arange(freq_to_index(lower_frequency), min(num_bins, freq_to_index(upper_frequency)))
+            np.add.at(projection[pitch % 12], indices, 1)
+
+        # the counts are small integers, so these are exact in any float dtype
+        projection = projection.astype(dtype)
+        PITCH_CLASS_PROJECTIONS[key] = projection
 
+        return projection
 
-        return ret
+    def get_parameters(self):
+        return {
+            "window_size": self.window_size,
+            "window_advance": self.window_advance,
+        }
 
     def __repr__(self):
         return "Chroma"
@@ -1,4 +1,9 @@
 class MetricCalculator:
+    # bump this whenever calculate_metric changes, so that results persisted in a FeatureStore are recalculated
+    VERSION = 1
+    # roughly how expensive calculating and comparing this metric is relative to the others, cheaper metrics are used first when cascading
+    COST = 1
+
     def __init__(self):
         raise NotImplementedError("Please override this method")
 
@@ -8,3 +13,18 @@ class MetricCalculator:
     def calculate_similarity(self, audio1, audio2, metric1, metric2):
         raise NotImplementedError("Please override this method")
 
+    def calculate_embedding(self, metric):
+        """
+        Summarises a metric as a fixed length vector, so that many audios can be compared at once by the distance between their embeddings
+
+        metric: an output of self.calculate_metric
+
+        returns: a 1D np array, the same length for every audio, or None if this metric doesn't have an embedding
+        """
+        return None
+
+    def get_parameters(self):
+        """
+        returns: a dictionary of the parameters that affect calculate_metric, used to identify persisted results
+        """
+        return {}
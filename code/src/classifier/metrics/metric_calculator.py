@@ -1,9 +1,12 @@
 import classifier.util as util
+import classifier.instrumentation as instrumentation
 import classifier.metrics.chroma as chroma
 import classifier.metrics.dynamics as dynamics
 import classifier.metrics.offsets as offsets
 import classifier.metrics.tempo as tempo
 import classifier.metrics.timbre as timbre
+import classifier.audio
+import concurrent.futures
 import matplotlib.pyplot as plt
 
 
@@ -19,13 +22,72 @@ METRICS = [
 # we cache audio objects because audio objects contain their own cached information which we don't want to just throw away, better solution would be to cache these in util.py
 CACHED_AUDIOS = {}
 
+# set this to a FeatureStore to persist calculated metrics between runs
+FEATURE_STORE = None
 
-def calculate_metrics(audio, metrics):
+# how far below the best similarity sum cascade_candidates lets a candidate's best possible sum fall before dropping it,
+# so that floating point rounding never drops a candidate tied with the best
+CASCADE_TOLERANCE = 1e-9
+
+
+def get_version(metric):
+    """
+    metric: a MetricCalculator
+
+    returns: the version string the results of metric are stored under, which changes if the metric or the beat tracking it relies on changes
+    """
+    return f"{metric.VERSION}/{tempo.BEAT_TRACKING_VERSION}"
+
+
+def load_beat_tracking(audio, feature_store):
+    """
+    Loads any persisted onset function, global tempo and beat times of an audio object that it hasn't calculated yet
+
+    audio: an Audio object with a fingerprint
+    feature_store: the FeatureStore to load from
+    """
+    version = tempo.BEAT_TRACKING_VERSION
+
+    if audio.onset_function is None:
+        stored = feature_store.load(audio.fingerprint, "OnsetFunction", version)
+        if stored is not None:
+            audio.onset_function = tempo.OnsetFunction(*stored)
+
+    if audio.global_tempo is None:
+        audio.global_tempo = feature_store.load(audio.fingerprint, "GlobalTempo", version)
+
+    if audio.beat_times is None:
+        audio.beat_times = feature_store.load(audio.fingerprint, "BeatTimes", version)
+
+
+def save_beat_tracking(audio, feature_store):
+    """
+    Persists any onset function, global tempo and beat times an audio object has calculated, if they aren't already stored
+
+    audio: an Audio object with a fingerprint
+    feature_store: the FeatureStore to save to
+    """
+    version = tempo.BEAT_TRACKING_VERSION
+
+    onset_function = audio.onset_function
+    if onset_function is not None and not feature_store.contains(audio.fingerprint, "OnsetFunction", version):
+        feature_store.save(audio.fingerprint, "OnsetFunction", version,
+                (onset_function.data, onset_function.window_advance, onset_function.sample_rate))
+
+    if audio.global_tempo is not None and not feature_store.contains(audio.fingerprint, "GlobalTempo", version):
+        feature_store.save(audio.fingerprint, "GlobalTempo", version, audio.global_tempo)
+
+    if audio.beat_times is not None and not feature_store.contains(audio.fingerprint, "BeatTimes", version):
+        feature_store.save(audio.fingerprint, "BeatTimes", version, audio.beat_times)
+
+
+def calculate_metrics(audio, metrics, feature_store=None):
     """
     Calculates the chosen metrics for a particular piece of audio
 
     audio: either a string representing a path to a wavfile, or an Audio object
     metric_flags: list of MetricCalculators
+    feature_store: optionally, a FeatureStore to load previously calculated metrics from and save new ones to, defaults to FEATURE_STORE
 
     returns: a dictionary of the calculated metrics, indexed by MetricCalculator
     """
@@ -38,32 +100,187 @@ def calculate_metrics(audio, metrics):
             CACHED_AUDIOS[audio] = util.read_audio(audio)
         audio = CACHED_AUDIOS[audio]
 
+    if feature_store is None:
+        feature_store = FEATURE_STORE
+    # we can only persist results for audio we can identify
+    if audio.fingerprint is None:
+        feature_store = None
+
+    if feature_store is not None:
+        # the similarity calculations need beat times too, even if all the metrics are stored
+        load_beat_tracking(audio, feature_store)
+
     for metric in metrics:
-        print(f"Calculating {metric} metric...")
+        util.log(f"Calculating {metric} metric...", level=2)
         # check if cached
         cached_metric = audio.get_cached_metric(metric)
+        instrumentation.count_cache("metric", cached_metric is not None)
+        if cached_metric is None and feature_store is not None:
+            cached_metric = feature_store.load(audio.fingerprint, type(metric).__name__, get_version(metric), metric.get_parameters())
+            instrumentation.count_cache("feature_store", cached_metric is not None)
+            if cached_metric is not None:
+                audio.cache_metric(metric, cached_metric)
+
         if cached_metric is not None:
             calculated_metrics[metric] = cached_metric
         else:
-            calculated_metric = metric.calculate_metric(audio)
+            with instrumentation.stage(f"{metric}.calculate_metric"):
+                calculated_metric = metric.calculate_metric(audio)
             calculated_metrics[metric] = calculated_metric
             audio.cache_metric(metric, calculated_metric)
+            if feature_store is not None:
+                feature_store.save(audio.fingerprint, type(metric).__name__, get_version(metric), calculated_metric, metric.get_parameters())
+
+    if feature_store is not None:
+        save_beat_tracking(audio, feature_store)
 
     return calculated_metrics
 
 
-def get_most_similar(unknown_audio, other_audios, metrics):
+def calculate_metrics_in_worker(signal, sample_rate, name, beat_tracking, metrics):
+    """
+    Calculates metrics for a signal inside a worker process, see calculate_metrics_parallel
+
+    signal, sample_rate, name: describe the audio to calculate the metrics of
+    beat_tracking: (onset function, global tempo, beat times) tuple of anything the parent process has already calculated, or None
+    metrics: list of MetricCalculators
+
+    returns: a (metric values, beat tracking) tuple, where metric values is a list of the calculated metrics in the same order as metrics
+    """
+    audio = classifier.audio.Audio(signal, sample_rate, name=name)
+    audio.onset_function, audio.global_tempo, audio.beat_times = beat_tracking
+
+    calculated_metrics = calculate_metrics(audio, metrics)
+
+    return ([calculated_metrics[metric] for metric in metrics], (audio.onset_function, audio.global_tempo, audio.beat_times))
+
+
+def calculate_metrics_parallel(audios, metrics, workers=None, feature_store=None):
+    """
+    Calculates the chosen metrics for many pieces of audio, spreading the audios over a pool of worker processes.
+    The results are cached in the Audio objects exactly as calculate_metrics would, and are identical to calculating them one at a time
+
+    audios: list of Audio objects, or strings representing paths to wavfiles
+    metrics: list of MetricCalculators
+    workers: number of worker processes to use, defaults to the number of CPUs
+    feature_store: optionally, a FeatureStore to load previously calculated metrics from and save new ones to, defaults to FEATURE_STORE
+
+    returns: a list of dictionaries of the calculated metrics, indexed by MetricCalculator, in the same order as audios
+    """
+    audio_objs = []
+    for audio in audios:
+        if isinstance(audio, str):
+            if audio not in CACHED_AUDIOS:
+                CACHED_AUDIOS[audio] = util.read_audio(audio)
+            audio = CACHED_AUDIOS[audio]
+        audio_objs.append(audio)
+
+    if feature_store is None:
+        feature_store = FEATURE_STORE
+
+    # work out which audios still have metrics that need calculating, anything stored is loaded by calculate_metrics as normal
+    to_calculate = []
+    for audio in audio_objs:
+        store = feature_store if audio.fingerprint is not None else None
+        if store is not None:
+            load_beat_tracking(audio, store)
+
+        for metric in metrics:
+            if audio.get_cached_metric(metric) is not None:
+                continue
+            if store is not None and store.contains(audio.fingerprint, type(metric).__name__, get_version(metric), metric.get_parameters()):
+                continue
+            to_calculate.append(audio)
+            break
+
+    # an audio can appear more than once, but we only want to calculate it once
+    to_calculate = list({id(audio): audio for audio in to_calculate}.values())
+
+    if len(to_calculate) > 0:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(calculate_metrics_in_worker,
+                    audio.signal, audio.sample_rate, audio.name, (audio.onset_function, audio.global_tempo, audio.beat_times), metrics)
+                    for audio in to_calculate]
+
+            for audio, future in zip(to_calculate, futures):
+                metric_values, beat_tracking = future.result()
+                audio.onset_function, audio.global_tempo, audio.beat_times = beat_tracking
+                for metric, metric_value in zip(metrics, metric_values):
+                    # metrics already cached or stored take priority, so we never have two different values for the same metric
+                    if audio.get_cached_metric(metric) is None:
+                        audio.cache_metric(metric, metric_value)
+
+    # everything is now cached, so this just collects the metrics and persists anything new
+    return [calculate_metrics(audio, metrics, feature_store=feature_store) for audio in audio_objs]
+
+
+def cascade_candidates(unknown_audio, unknown_audio_metrics, other_audios, candidates, metrics):
+    """
+    Narrows down the candidates for the most similar audio by scoring them one metric at a time, cheapest metric first, and dropping any candidate
+    that couldn't catch up with the best candidate so far even if every metric it has left gave it a similarity of 1.
+    After each metric, the candidate leading so far is scored on all of its metrics, as it is usually the most similar and has to be scored fully anyway,
+    and its whole similarity is a much higher bar for the others than its similarity so far.
+    This relies on every similarity being between 0 and 1, so the best candidate is never dropped, and metrics are only calculated for candidates still in the running
+
+    unknown_audio: Audio object we want to find the most similar audio to
+    unknown_audio_metrics: dictionary of the metrics of unknown_audio, indexed by MetricCalculator
+    other_audios: list of Audio objects to compare unknown_audio to
+    candidates: indices into other_audios of the audios to consider
+    metrics: list of MetricCalculators
+
+    returns: a (remaining, similarities) tuple, where remaining is the indices of the candidates left, in the same order as candidates,
+             and similarities is a dictionary of the similarity of every metric calculated for each candidate, indexed by candidate then MetricCalculator
+    """
+    similarities = {i: {} for i in candidates}
+    remaining = list(candidates)
+    # sorted is stable, so metrics of equal cost are done in the order they were given
+    ordered_metrics = sorted(metrics, key=lambda metric: metric.COST)
+
+    def score(i, metric):
+        if metric not in similarities[i]:
+            metric_value = calculate_metrics(other_audios[i], [metric])[metric]
+            with instrumentation.stage(f"{metric}.calculate_similarity"):
+                similarities[i][metric] = metric.calculate_similarity(unknown_audio, other_audios[i], unknown_audio_metrics[metric], metric_value)
+
+    for metric in ordered_metrics:
+        for i in remaining:
+            score(i, metric)
+
+        sums = {i: sum(similarities[i].values()) for i in remaining}
+        leader = max(remaining, key=lambda i: sums[i])
+        for leader_metric in ordered_metrics:
+            score(leader, leader_metric)
+        sums[leader] = sum(similarities[leader].values())
+
+        # the best final sum is at least the leader's, a tiny bit of slack covers the sums being added up in a different order later
+        best = sums[leader]
+        remaining = [i for i in remaining if sums[i] + len(metrics) - len(similarities[i]) >= best - CASCADE_TOLERANCE]
+        util.log(f"{len(remaining)} candidates left after {metric} metric", level=2)
+
+    return (remaining, similarities)
+
+
+def get_most_similar(unknown_audio, other_audios, metrics, workers=1, shortlist=None, cascade=False, index=None):
     """
     Finds the most similar audio to an unknown audio, using the given metric flags.
 
     unknown_audio: Audio object, or string representing path, of the audio we want to find the most similar performer to
     other_audios: list of Audio objects, or string representing path, to compare unknown_audio to
     metrics: list of MetricCalculators
+    workers: number of processes to calculate metrics with, defaults to 1, which calculates everything in this process
+    shortlist: optionally, only calculate the similarities of this many audios, the ones whose embeddings are nearest to the unknown audio's
+               in index, which must be given, and every metric must have an embedding to use this. Defaults to None, which compares against every audio
+    cascade: if True, rule out audios a metric at a time, cheapest first, as in cascade_candidates, which gives exactly the same answer
+             while skipping the more expensive metrics for audios that can't be the most similar, defaults to False
+    index: a ReferenceIndex of other_audios built with the same metrics, e.g. loaded with ReferenceIndex.load, to shortlist with.
+           A key that is one of the paths in other_audios refers to that path, as ReferenceIndex.add keys paths by default, and an integer key
+           refers to that position in other_audios, so Audio objects have to be added by position, as their names needn't be unique.
+           Any of other_audios missing from it are always compared. Only used with shortlist, defaults to None
 
     returns: a (similarity, Audio) tuple, where similarity is the calculated similarity, and Audio is the most similar Audio object in other_audios
     """
 
-    print("Reading in audio files...")
+    util.log("Reading in audio files...")
 
 
     # first check if unknown_audio is a string, make it an Audio object if it is
@@ -82,26 +299,54 @@ def get_most_similar(unknown_audio, other_audios, metrics):
             other_audio = CACHED_AUDIOS[other_audio]
         other_audios_objs.append(other_audio)
 
-    print("Calculating metrics...")
+    util.log("Calculating metrics...")
 
     unknown_audio_metrics = calculate_metrics(unknown_audio, metrics)
 
-    # dict of metrics indexed by audio
-    other_audios_metrics = {}
-    for other_audio in other_audios_objs:
-        other_audios_metrics[other_audio] = calculate_metrics(other_audio, metrics)
+    if shortlist is not None and index is None:
+        # building an index here would calculate every metric of every audio, which is everything the shortlist is meant to save
+        raise ValueError("Shortlisting needs a prebuilt index of other_audios")
+
+    candidates = range(len(other_audios_objs))
+    if shortlist is not None and shortlist < len(other_audios_objs):
+        util.log("Shortlisting...")
+        # the positions in other_audios each key refers to, a path can be in other_audios more than once
+        positions = {i: [i] for i in range(len(other_audios))}
+        for i, other_audio in enumerate(other_audios):
+            if isinstance(other_audio, str):
+                positions.setdefault(other_audio, []).append(i)
 
-    print("Calculating similarities...")
+        # the index can hold references we aren't comparing against, so rank all of them and keep the nearest of ours
+        indexed = [i for _, key in index.query(unknown_audio, len(index)) if key in positions for i in positions[key]]
+        unindexed = set(range(len(other_audios_objs))) - set(indexed)
+        # keep the original order, so ties are broken the same way as without a shortlist
+        candidates = sorted(set(indexed[:shortlist]) | unindexed)
+
+    if workers != 1:
+        # calculate everything left up front in parallel, after which the calls below just fetch cached metrics
+        calculate_metrics_parallel([other_audios_objs[i] for i in candidates], metrics, workers=workers)
+
+    # the similarity of each metric already calculated for each candidate, indexed by candidate then MetricCalculator
+    calculated_similarities = {i: {} for i in candidates}
+    if cascade:
+        util.log("Cascading...")
+        candidates, calculated_similarities = cascade_candidates(unknown_audio, unknown_audio_metrics, other_audios_objs, candidates, metrics)
+
+    util.log("Calculating similarities...")
     similarities = []
-    
-    for other_audio in other_audios_metrics:
+
+    for i in candidates:
+        other_audio = other_audios_objs[i]
         similarity_sum = 0
-        metrics = other_audios_metrics[other_audio]
+        # added up in the order the metrics were given, whichever order they were calculated in, so cascading gives exactly the same sums
         for metric in metrics:
-            metric_value = metrics[metric]
-            unknown_audio_metric_value = unknown_audio_metrics[metric]
-            similarity = metric.calculate_similarity(
-                unknown_audio, other_audio, unknown_audio_metric_value, metric_value)
+            if metric in calculated_similarities[i]:
+                similarity = calculated_similarities[i][metric]
+            else:
+                metric_value = calculate_metrics(other_audio, [metric])[metric]
+                with instrumentation.stage(f"{metric}.calculate_similarity"):
+                    similarity = metric.calculate_similarity(
+                        unknown_audio, other_audio, unknown_audio_metrics[metric], metric_value)
             similarity_sum += similarity
 
         # now calculate mean similarity and add to our list
@@ -110,6 +355,6 @@ def get_most_similar(unknown_audio, other_audios, metrics):
     index = similarities.index(max(similarities))
 
 
-    return (max(similarities), other_audios[index])
+    return (max(similarities), other_audios[candidates[index]])
 
 
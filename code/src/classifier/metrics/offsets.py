@@ -5,6 +5,9 @@ import matplotlib.pyplot as plt
 import classifier.metrics.metric as metric
 
 class OffsetsCalculator(metric.MetricCalculator):
+    # one pass over the beats
+    COST = 2
+
     def __init__(self):
         # just here for override
         pass
@@ -26,7 +29,6 @@ class OffsetsCalculator(metric.MetricCalculator):
         tempo_variation_average = util.moving_average(tempo_variation, moving_average_window)
 
         # basically, take the moving average tempo, and search for the nearest highest onset value in a small window around the expected beat time based on the moving average tempo
-        current_loc = 0
         onset_window_search_size = 0.1
         # plotting
         """ PLOTTING CODE
@@ -34,13 +36,12 @@ class OffsetsCalculator(metric.MetricCalculator):
         onset_plot = np.zeros(len(audio.signal))
         """
 
-
-        offsets = np.zeros(len(tempo_variation_average))
-        for i, inter_onset_interval in enumerate(tempo_variation_average):
-            current_loc += inter_onset_interval
-            onset_loc, onset_strength = OffsetsCalculator.get_best_nearest_onset(onset_function, current_loc, onset_window_search_size)
-            # negative value is before current_loc
-            offsets[i] = onset_loc - current_loc
+        # cumsum adds up the intervals one after the other, exactly as stepping through them would
+        expected_beat_times = np.cumsum(tempo_variation_average)
+        distances, _ = OffsetsCalculator.get_best_nearest_onsets(onset_function, expected_beat_times, onset_window_search_size)
+        # the distances are already relative to the expected beat times, but the metric has always had the expected beat time subtracted
+        # from them a second time, which we keep so that the metric (and anything stored or tuned on it) stays the same
+        offsets = distances - expected_beat_times
 
         """ PLOTTING CODE
         #TODO: fix this
@@ -85,6 +86,14 @@ class OffsetsCalculator(metric.MetricCalculator):
         return np.exp(-symmetrised_divergence)
 
 
+    def calculate_embedding(self, metric):
+        """
+        metric: an output of self.calculate_metric
+
+        returns: a 2-length np array of the mean and standard deviation of the offsets
+        """
+        return np.array(metric, dtype=float)
+
     def get_best_nearest_onset(onset_function, expected_beat_time, window_size):
         """
         Gets the distance from the expected beat time of the highest onset value in a small window around the expected beat time
@@ -110,6 +119,30 @@ class OffsetsCalculator(metric.MetricCalculator):
         onset_location = onset_function.windows_to_time(best_window)
         return (onset_location - expected_beat_time, best_onset_value)
 
+    def get_best_nearest_onsets(onset_function, expected_beat_times, window_size):
+        """
+        Does get_best_nearest_onset for many expected beat times at once, gathering the onset values of every window to search into one matrix,
+        with one row per expected beat time, and taking the argmax of each row. Gives exactly the same results as calling get_best_nearest_onset on each
+
+        onset_function: an OnsetFunction object containing the onsets of the signal we are searching
+        expected_beat_times: 1D np array of the expected beat times in seconds
+        window_size: size in seconds of the window to search for the note onset
+
+        returns: a tuple of 1D np arrays, the distance from each expected beat time to the best onset in its window, and the strength of this onset
+        """
+        window_size = onset_function.time_to_windows(window_size)
+        min_windows = onset_function.time_to_windows(np.asarray(expected_beat_times)) - window_size
+        windows = min_windows[:, None] + np.arange(2 * window_size + 1)
+        onset_values = onset_function.index_window(windows)
+
+        # argmax picks the first of equal values, like only replacing the best window with a strictly better one
+        best = np.argmax(onset_values, axis=1) if len(expected_beat_times) > 0 else np.zeros(0, dtype=int)
+        best_windows = min_windows + best
+        best_onset_values = onset_values[np.arange(len(best)), best]
+
+        onset_locations = onset_function.window_advance * best_windows
+        return (onset_locations - expected_beat_times, best_onset_values)
+
     def __repr__(self):
         return "Offsets"
 
@@ -3,35 +3,97 @@ import classifier.util as util
 import scipy.fft
 import scipy.signal.windows
 import scipy.signal
+import scipy.stats
 import classifier.metrics.timbre as timbre
 import matplotlib.pyplot as plt
 import classifier.metrics.metric as metric
 
+# bump this whenever the onset function, global tempo or beat tracking changes, so that results persisted in a FeatureStore are recalculated
+# everything computed from the beats depends on this too
+BEAT_TRACKING_VERSION = 2
+
 class OnsetFunction:
+    # onset functions are kept for every audio, often thousands at once, so they don't need a __dict__ each
+    __slots__ = ("data", "window_advance", "sample_rate", "peaks")
+
     def __init__(self, data, window_advance, sample_rate):
+        """
+        The onset function of a signal, with lookups by time, sample or window. Every lookup takes either a single value or a np array of values
+
+        data: 1D np array of the onset value of each window
+        window_advance: time in seconds between successive windows
+        sample_rate: sample rate of the signal the onset function was calculated from
+        """
         self.data = data
         self.window_advance = window_advance
         self.sample_rate = sample_rate
+        # windows of the peaks of the onset function, found the first time they are asked for
+        self.peaks = None
 
-    def index_samples(self, samples):
-        return self.data[min(len(self.data)-1, self.samples_to_windows(samples))]
+    def index_samples(self, samples, interpolate=False):
+        """
+        samples: sample, or np array of samples, of the signal to look up the onset value at
+        interpolate: see index_window
 
-    def index_time(self, t):
-        return self.data[min(len(self.data)-1, self.time_to_windows(t))]
+        returns: the onset value, or np array of onset values
+        """
+        if interpolate:
+            return self.index_window(np.asarray(samples) / self.sample_rate / self.window_advance, interpolate=True)
+        return self.index_window(self.samples_to_windows(samples))
 
-    def index_window(self, w):
-        return self.data[min(len(self.data)-1, w)]
+    def index_time(self, t, interpolate=False):
+        """
+        t: time, or np array of times, in seconds to look up the onset value at
+        interpolate: see index_window
+
+        returns: the onset value, or np array of onset values
+        """
+        if interpolate:
+            return self.index_window(np.asarray(t) / self.window_advance, interpolate=True)
+        return self.index_window(self.time_to_windows(t))
+
+    def index_window(self, w, interpolate=False):
+        """
+        w: window, or np array of windows, to look up the onset value of. Windows past the end are clamped to the last window,
+           and negative windows index from the end, like indexing the data directly
+        interpolate: if True, w can be fractional, and the onset value is linearly interpolated between the two nearest windows.
+                     Windows outside of the onset function are clamped to the first or last window. Defaults to False
+
+        returns: the onset value, or np array of onset values
+        """
+        if interpolate:
+            values = np.interp(w, np.arange(len(self.data)), self.data)
+            return values if np.ndim(w) > 0 else float(values)
+        if np.ndim(w) == 0:
+            return self.data[min(len(self.data)-1, w)]
+        return self.data[np.minimum(len(self.data)-1, w)]
 
     def samples_to_windows(self, samples):
-        return self.time_to_windows(samples / self.sample_rate)
+        if np.ndim(samples) == 0:
+            return self.time_to_windows(samples / self.sample_rate)
+        return self.time_to_windows(np.asarray(samples) / self.sample_rate)
 
     def time_to_windows(self, t):
-        return int(t / self.window_advance)
+        # both truncate towards zero
+        if np.ndim(t) == 0:
+            return int(t / self.window_advance)
+        return (np.asarray(t) / self.window_advance).astype(int)
 
     def windows_to_time(self, w):
-        return self.window_advance * w
+        return self.window_advance * (np.asarray(w) if np.ndim(w) > 0 else w)
+
+    def get_peaks(self):
+        """
+        returns: 1D np array of the windows of every peak (local maximum) of the onset function, in order
+        """
+        if self.peaks is None:
+            self.peaks = scipy.signal.find_peaks(self.data)[0]
+        return self.peaks
 
 class TempoCalculator(metric.MetricCalculator):
+    # only needs the beat times
+    COST = 1
+
     def __init__(self):
         # we use this for certain debugging/plotting stuff
         self.calls = 0
@@ -118,6 +180,22 @@ class TempoCalculator(metric.MetricCalculator):
         # when the two metrics are identical, squared_errors_sum is 0, and becomes larger and larger the less similar the metrics are, so we apply exp(-squared_errors_sum) to get our metric
         return np.exp(-mse)
 
+    def calculate_embedding(self, metric):
+        """
+        metric: an output of self.calculate_metric
+
+        returns: an 8-length np array of the mean, standard deviation, skewness and kurtosis of the smoothed first and second order differences
+        """
+        embedding = []
+        for diffs in metric:
+            if len(diffs) == 0:
+                embedding.extend([0, 0, 0, 0])
+                continue
+            embedding.extend([np.mean(diffs), np.std(diffs), scipy.stats.skew(diffs), scipy.stats.kurtosis(diffs)])
+
+        # skewness and kurtosis aren't defined when the tempo never varies
+        return np.nan_to_num(np.array(embedding, dtype=float))
+
     def calculate_beats(audio, advance=0.004):
         """
         Calculates beat onset times using techniques developed by Ellis
@@ -132,37 +210,61 @@ class TempoCalculator(metric.MetricCalculator):
         # alpha
         WEIGHTING = 200 
 
+        num_windows = int(audio.get_duration() / advance)
+
         # initialise C* and P*
-        score_array = np.zeros(int(audio.get_duration() / advance))
-        backtrace_array = np.zeros(int(audio.get_duration() / advance))
+        # the scores accumulate over the whole signal, so these stay in double precision even for single precision audio
+        score_array = np.zeros(num_windows)
+        backtrace_array = np.zeros(num_windows, dtype=int)
 
         onset_function = audio.get_onset_function()
 
         global_tempo = audio.get_global_tempo()
         ideal_spacing = 60/global_tempo
         ideal_spacing_windows = int(ideal_spacing / advance)
-        for window in range(1, int((audio.get_duration() / advance))):
-            t = window * advance
 
+        # onset value at each point on the grid
+        onset_values = onset_function.index_time(np.arange(num_windows) * advance)
 
+        # the consistency penalty only depends on the gap between beats, so we work it out once for every gap we consider, indexed by gap in windows
+        max_gap = ideal_spacing_windows * 2
+        gap_penalty = np.full(max_gap + 1, -np.inf)
+        gap_penalty[1:] = WEIGHTING * TempoCalculator.beat_consistency(np.arange(1, max_gap + 1) * advance, 0, ideal_spacing)
+
+        # near the start the range of predecessors is cut off by the start of the signal, so we do these windows one at a time
+        for window in range(1, min(num_windows, max_gap)):
             range_start = int(max(0, window - ideal_spacing_windows * 2))
             range_stop = int(max(0, window - ideal_spacing_windows / 2))
 
-            best_score = -9e999
-            best_tau = -1
-            # do the max/argmax
-            onset_value = onset_function.index_time(t)
-            for potential_beat in range(range_start, range_stop):
-                potential_beat_seconds = potential_beat * advance
-                score = WEIGHTING * TempoCalculator.beat_consistency(t, potential_beat_seconds, ideal_spacing)
-                score += score_array[potential_beat]
+            if range_stop <= range_start:
+                score_array[window] = -np.inf
+                backtrace_array[window] = -1
+                continue
+
+            # do the max/argmax, gap_penalty is reversed as later predecessors have smaller gaps
+            scores = score_array[range_start:range_stop] + gap_penalty[window-range_stop+1:window-range_start+1][::-1]
+            best = np.argmax(scores)
 
-                if score > best_score:
-                    best_score = score
-                    best_tau = potential_beat
+            score_array[window] = scores[best] + onset_values[window]
+            # if every predecessor is unreachable, there is no best predecessor
+            backtrace_array[window] = range_start + best if scores[best] > -np.inf else -1
 
-            score_array[window] = best_score + onset_value
-            backtrace_array[window] = best_tau
+        # after that, every window has the same shaped range of predecessors, the last of which is at least min_gap windows behind it,
+        # so a block of min_gap windows never depends on itself and we can do the whole block at once
+        min_gap = max_gap - int(max_gap - ideal_spacing_windows / 2)
+        range_length = max_gap - min_gap
+        block_penalty = gap_penalty[min_gap+1:][::-1]
+        for block_start in range(max_gap, num_windows, min_gap):
+            block_stop = min(num_windows, block_start + min_gap)
+
+            # row i holds the scores of the possible predecessors of block_start + i
+            predecessors = np.lib.stride_tricks.sliding_window_view(
+                    score_array[block_start - max_gap:block_stop - min_gap - 1], range_length)
+            scores = predecessors + block_penalty
+            best = np.argmax(scores, axis=1)
+
+            score_array[block_start:block_stop] = scores[np.arange(len(best)), best] + onset_values[block_start:block_stop]
+            backtrace_array[block_start:block_stop] = np.arange(block_start, block_stop) - max_gap + best
 
 
         # now we have done the dynamic programming, just need to backtrace
@@ -195,37 +297,17 @@ class TempoCalculator(metric.MetricCalculator):
         returns: a 1d NP array containing calculated values of the onset function for each window
         """
 
-        onset_array = np.zeros(
-            int((audio.get_duration() - window_size) / window_advance))
-
         mel_bands = 40
 
-        num_windows = len(onset_array)
+        # we calculate the onset function on a downsampled signal
+        sample_rate = 8000
+        spectrogram = audio.get_spectrogram(window_size, window_advance, window_fn="hann", sample_rate=sample_rate)
+        frame_length = int(round(window_size * sample_rate))
 
-        audio = audio.resample(8000)
+        power_spectrogram = 1/frame_length * (spectrogram ** 2)
 
-        mel_spectrogram = np.zeros((len(onset_array), mel_bands))
-
-        for window in range(num_windows):
-
-            window_start = int(window * window_advance * audio.sample_rate)
-            window_end = int((window * window_advance +
-                          window_size) * audio.sample_rate)
-
-            window_signal = audio.signal[window_start:window_end]
-            window_filter = scipy.signal.windows.hann(len(window_signal))
-            window_signal = window_signal * window_filter
-
-            spectrum = scipy.fft.rfft(window_signal)
-
-
-            power_spectrum = 1/len(window_signal) * (np.abs(spectrum) ** 2)
-
-
-            mel_spectrum = timbre.TimbreCalculator.spectrum_to_mel_bands(
-                power_spectrum, audio.sample_rate, num_filters=mel_bands)
-
-            mel_spectrogram[window] = mel_spectrum
+        mel_spectrogram = timbre.TimbreCalculator.spectrogram_to_mel_bands(
+            power_spectrogram, sample_rate, num_filters=mel_bands)
 
 
         # normalise to 0dB max
@@ -243,7 +325,7 @@ class TempoCalculator(metric.MetricCalculator):
 
         highpass_filter = scipy.signal.butter(5, 0.3, btype="highpass", output="sos", fs=1/window_advance)
 
-        filtered_onsets = scipy.signal.sosfilt(highpass_filter, onset_array)
+        filtered_onsets = scipy.signal.sosfilt(highpass_filter.astype(onset_array.dtype), onset_array)
         # now we smooth by convolving with gaussian envelope
         envelope_length = 0.080
 
@@ -253,13 +335,13 @@ class TempoCalculator(metric.MetricCalculator):
         gaussian_window = scipy.signal.windows.gaussian(
             int(envelope_length / window_advance), int(envelope_sigma / window_advance))
 
-        convolved_onsets = np.convolve(filtered_onsets, gaussian_window, mode='same')
+        convolved_onsets = np.convolve(filtered_onsets, gaussian_window.astype(filtered_onsets.dtype), mode='same')
         normalized_onsets = convolved_onsets / np.std(convolved_onsets)
 
         # the windowing means we slightly lose the first few milliseconds in the onset function, which we add back in here to line up with the original audio
         offset_added_by_window = int(window_size/window_advance)
         normalized_onsets = np.insert(normalized_onsets, offset_added_by_window, np.zeros(offset_added_by_window))
-        onset_function = OnsetFunction(normalized_onsets, window_advance, audio.sample_rate)
+        onset_function = OnsetFunction(normalized_onsets, window_advance, sample_rate)
 
 
         """
@@ -276,35 +358,82 @@ class TempoCalculator(metric.MetricCalculator):
         return onset_function
 
 
-    def calculate_global_tempo(audio, tempo_bias=0.5, envelope_width=0.9):
+    def calculate_global_tempo(audio, tempo_bias=0.5, envelope_width=0.9, min_tempo=30, max_tempo=300):
         """
         Calculates an estimate of the global tempo of an audio signal, using the techniques outlined by Ellis, basically by calculating autocorrelation
 
         audio: an Audio object that contains the signal to calculate the tempo for
         tempo_bias: the centre of the bias for the tempo estimate, defaults to 0.5 (120 BPM)
         envelope_width: the width of the bias envelope, in octaves, defaults to 1.4
+        min_tempo: the slowest tempo in BPM we consider, defaults to 30
+        max_tempo: the fastest tempo in BPM we consider, defaults to 300
 
         returns: an estimate of the global tempo in BPM
         """
 
+        best_tempo, _ = TempoCalculator.calculate_tempo_candidates(audio, tempo_bias, envelope_width, min_tempo, max_tempo, num_candidates=1)[0]
+
+        return best_tempo
+
+    def calculate_tempo_candidates(audio, tempo_bias=0.5, envelope_width=0.9, min_tempo=30, max_tempo=300, num_candidates=5):
+        """
+        Calculates the most likely global tempos of an audio signal, see calculate_global_tempo
+
+        audio: an Audio object that contains the signal to calculate the tempos for
+        tempo_bias: the centre of the bias for the tempo estimate, defaults to 0.5 (120 BPM)
+        envelope_width: the width of the bias envelope, in octaves, defaults to 1.4
+        min_tempo: the slowest tempo in BPM we consider, defaults to 30
+        max_tempo: the fastest tempo in BPM we consider, defaults to 300
+        num_candidates: the maximum number of tempos to return, defaults to 5
+
+        returns: a list of (tempo, score) tuples, where tempo is in BPM and score is the weighted autocorrelation at that tempo, best first
+        """
+
+        onset_function = audio.get_onset_function()
+
+        return TempoCalculator.estimate_tempo_candidates(onset_function.data, onset_function.window_advance, tempo_bias, envelope_width, min_tempo, max_tempo, num_candidates)
+
+    def estimate_tempo_candidates(onsets, window_advance, tempo_bias=0.5, envelope_width=0.9, min_tempo=30, max_tempo=300, num_candidates=5):
+        """
+        Estimates the most likely tempos of an onset function by its weighted autocorrelation, only looking at lags within a plausible range of tempos
+
+        onsets: 1D np array of onset function values
+        window_advance: time in seconds between successive onset values
+        tempo_bias: the centre of the bias for the tempo estimate
+        envelope_width: the width of the bias envelope, in octaves
+        min_tempo: the slowest tempo in BPM we consider
+        max_tempo: the fastest tempo in BPM we consider
+        num_candidates: the maximum number of tempos to return
+
+        returns: a list of (tempo, score) tuples, where tempo is in BPM and score is the weighted autocorrelation at that tempo, best first
+        """
+
         def weighting_func(tau): return np.exp(-0.5 *
                                                (np.log2(tau / tempo_bias)/envelope_width) ** 2)
 
+        # lags in windows corresponding to our range of tempos
+        min_lag = max(1, int(np.ceil(60 / (max_tempo * window_advance))))
+        max_lag = min(len(onsets) - 1, int(60 / (min_tempo * window_advance)))
+        if max_lag < min_lag:
+            raise ValueError(f"Onset function of length {len(onsets)} is too short to estimate tempos between {min_tempo} and {max_tempo} BPM")
 
-        onset_function = audio.get_onset_function()
+        # calculate autocorrelation via the fft, padding so that lags up to max_lag don't wrap around
+        fft_length = scipy.fft.next_fast_len(len(onsets) + max_lag, real=True)
+        spectrum = scipy.fft.rfft(onsets, fft_length)
+        auto_correlation = scipy.fft.irfft(spectrum * np.conj(spectrum), fft_length)[min_lag:max_lag+1]
 
-        # calculate autocorrelation
-        auto_correlation = np.correlate(onset_function.data, onset_function.data, mode='full')
-        auto_correlation = auto_correlation[int(auto_correlation.size/2):]
-        weighting = np.linspace(onset_function.windows_to_time(1), onset_function.windows_to_time(len(auto_correlation)), len(auto_correlation))
-        weighting = weighting_func(weighting)
+        # the weighting at a lag of n windows has always been taken at n+1 windows, we keep this so estimates don't change
+        lags = np.arange(min_lag, max_lag+1)
+        weighting = weighting_func((lags + 1) * window_advance)
         # apply weighting
         weighted_auto_correlation = auto_correlation * weighting
 
-        best_tempo_windows = np.argmax(weighted_auto_correlation)
-        best_tempo = 60/onset_function.windows_to_time(best_tempo_windows)
+        # the candidates are the peaks of the weighted autocorrelation, along with the overall best lag in case it is at the edge of our range
+        candidates = set(scipy.signal.find_peaks(weighted_auto_correlation)[0])
+        candidates.add(np.argmax(weighted_auto_correlation))
+        candidates = sorted(candidates, key=lambda i: (-weighted_auto_correlation[i], i))[:num_candidates]
 
-        return best_tempo
+        return [(60/(lags[i] * window_advance), weighted_auto_correlation[i]) for i in candidates]
 
 
     def beat_consistency(current_t, previous_t, ideal_spacing):
@@ -1,9 +1,19 @@
 import scipy.fft
 import matplotlib.pyplot as plt
 import numpy as np
+import scipy.sparse
+import classifier.util as util
 import classifier.metrics.metric as metric
 
+# mel filter banks indexed by (number of spectrum bins, sample rate, number of filters, dtype), so we only build each one once
+MEL_FILTER_BANKS = {}
+
 class TimbreCalculator(metric.MetricCalculator):
+    # 2: beat windows running past the end of the signal are padded to full length rather than truncated
+    VERSION = 2
+    # one short MFCC per beat
+    COST = 3
+
     def __init__(self, window_size=0.3, target_pitch=440):
         """
         window_size: the size in seconds of the window to calculate the MFCCs for
@@ -23,19 +33,30 @@ class TimbreCalculator(metric.MetricCalculator):
         """
 
         beat_times = audio.get_beat_times()
-        num_filters = 40
+        window_length = int(round(self.window_size * audio.sample_rate))
 
-        timbre_array = np.zeros((len(beat_times), num_filters))
+        # gather every beat's window into one array, padding windows that run off the end of the signal with zeros
+        window_starts = (np.asarray(beat_times) * audio.sample_rate).astype(int)
+        windows = np.zeros((len(window_starts), window_length), dtype=audio.get_dtype())
+        full_windows = window_starts + window_length <= len(audio.signal)
+        if np.any(full_windows):
+            all_windows = np.lib.stride_tricks.sliding_window_view(audio.signal, window_length)
+            windows[full_windows] = all_windows[window_starts[full_windows]]
+        for i in np.nonzero(~full_windows)[0]:
+            window_signal = audio.signal[window_starts[i]:]
+            windows[i, :len(window_signal)] = window_signal
 
-        for i, beat_time in enumerate(beat_times):
-            window_start = int(beat_time * audio.sample_rate)
-            window_end = int((beat_time + self.window_size) * audio.sample_rate)
+        timbre_array = self.calculate_batched_mfccs(windows, audio.sample_rate)
 
-            window_signal = audio.signal[window_start:window_end]
+        return timbre_array
 
-            timbre_array[i] = self.calculate_mfccs(window_signal, audio.sample_rate)
+    def calculate_embedding(self, metric):
+        """
+        metric: an output of self.calculate_metric
 
-        return timbre_array
+        returns: a np array of the mean and standard deviation of each MFCC over the beats
+        """
+        return np.concatenate((np.mean(metric, axis=0), np.std(metric, axis=0)))
 
     def calculate_similarity(self, audio1, audio2, metric1, metric2):
         """
@@ -114,16 +135,21 @@ class TimbreCalculator(metric.MetricCalculator):
 
 
 
-    def spectrum_to_mel_bands(spectrum, sample_rate, num_filters=40):
+    def get_mel_filter_bank(num_bins, sample_rate, num_filters=40, dtype=np.float64):
         """
-        Converts a spectrum to mel bands
+        Gets the triangular mel filter bank for spectra of a particular length, building and caching it if we haven't seen it before
 
-        spectrum: the spectrum to convert
-        sample_rate: the sample rate of the audio from which the spectrum was taken
+        num_bins: the length of the spectra the filter bank will be applied to
+        sample_rate: the sample rate of the audio from which the spectra are taken
         num_filters: number of mel filters to use
+        dtype: the np dtype of the filter bank, which should match the spectra so that applying it doesn't change their precision, defaults to float64
 
-        returns: a num_filters length np array of the filtered spectra
+        returns: a sparse num_filters x num_bins matrix, where each row is one triangular filter
         """
+        key = (num_bins, sample_rate, num_filters, np.dtype(dtype))
+        if key in MEL_FILTER_BANKS:
+            return MEL_FILTER_BANKS[key]
+
         lowest_freq = 0
         # highest frequency we get is half the sample rate
         highest_freq_hertz = sample_rate/2
@@ -133,10 +159,10 @@ class TimbreCalculator(metric.MetricCalculator):
         mel_bands = np.linspace(lowest_freq, highest_freq, num=num_filters+2)
         hertz_bands = TimbreCalculator.mel_to_hertz(mel_bands).astype(int)
 
-        bins = np.floor((len(spectrum) + 1) * hertz_bands / sample_rate)
+        bins = np.floor((num_bins + 1) * hertz_bands / sample_rate)
 
         # now we create our filter bank
-        filter_bank = np.zeros((num_filters, len(spectrum)))
+        filter_bank = np.zeros((num_filters, num_bins))
         for i in range(1, num_filters + 1):
             previous_band = int(bins[i - 1])
             band = int(bins[i])
@@ -146,18 +172,40 @@ class TimbreCalculator(metric.MetricCalculator):
             for j in range(band, next_band):
                 filter_bank[i-1, j] = (next_band-j) / (next_band - band)
 
-        # now we compute all of the filtered spectrums
-        filtered_spectrums = []
-        for f in filter_bank:
-            filtered_spectrums.append(f * spectrum)
+        # each filter only covers a few bins, so storing it sparsely makes applying it much cheaper
+        filter_bank = scipy.sparse.csr_matrix(filter_bank.astype(dtype))
+        MEL_FILTER_BANKS[key] = filter_bank
+
+        return filter_bank
+
+    def spectrum_to_mel_bands(spectrum, sample_rate, num_filters=40):
+        """
+        Converts a spectrum to mel bands
+
+        spectrum: the spectrum to convert
+        sample_rate: the sample rate of the audio from which the spectrum was taken
+        num_filters: number of mel filters to use
+
+        returns: a num_filters length np array of the filtered spectra
+        """
+        spectrum = np.asarray(spectrum)
+        filter_bank = TimbreCalculator.get_mel_filter_bank(len(spectrum), sample_rate, num_filters, util.float_dtype(spectrum))
+
+        return filter_bank @ spectrum
 
-        # now compute the mel filtered power spectra
-        filtered_spectrums = np.array(filtered_spectrums)
+    def spectrogram_to_mel_bands(spectrogram, sample_rate, num_filters=40):
+        """
+        Converts every spectrum in a spectrogram to mel bands at once
 
+        spectrogram: a 2D np array with one spectrum per row
+        sample_rate: the sample rate of the audio from which the spectrogram was taken
+        num_filters: number of mel filters to use
 
-        filter_bank_energies = np.sum(filtered_spectrums, axis=1)
+        returns: a 2D np array with num_filters filtered spectra for each row of the spectrogram
+        """
+        filter_bank = TimbreCalculator.get_mel_filter_bank(spectrogram.shape[1], sample_rate, num_filters, util.float_dtype(spectrogram))
 
-        return filter_bank_energies
+        return (filter_bank @ spectrogram.T).T
 
     def normalise_spectrum(self, spectrum, spectrum_freqs):
         """
@@ -196,21 +244,47 @@ class TimbreCalculator(metric.MetricCalculator):
         returns: a list containing the MFCCs
         """
 
-        # first, we calculate the spectrum of our signal
-        spectrum = np.abs(scipy.fft.rfft(signal))
-        spectrum_freqs = scipy.fft.rfftfreq(len(signal), d=1/sample_rate)
-        shifted_spectrum = self.normalise_spectrum(spectrum, spectrum_freqs)
+        return self.calculate_batched_mfccs(np.asarray(signal)[np.newaxis, :], sample_rate)[0]
+
+    def calculate_batched_mfccs(self, signals, sample_rate):
+        """
+        Calculates the MFCCs of many equal length signals at once
+
+        signals: a 2D array with one signal per row
+        sample_rate: the sample rate of the audio
+
+        returns: a 2D np array with the MFCCs of each signal in each row
+        """
+
+        # first, we calculate the spectrum of our signals
+        spectra = np.abs(scipy.fft.rfft(signals, axis=1))
+        spectrum_freqs = scipy.fft.rfftfreq(signals.shape[1], d=1/sample_rate)
+
+        # then shift each spectrum as normalise_spectrum does, by reading each bin from shift_idx bins below it, and zeroing bins that would come from outside the spectrum
+        fundamental_freqs = spectrum_freqs[np.argmax(spectra, axis=1)]
+        spacing = spectrum_freqs[1] - spectrum_freqs[0]
+        shift_idxs = ((self.target_pitch - fundamental_freqs) / spacing).astype(int)
+        source_idxs = np.arange(spectra.shape[1])[np.newaxis, :] - shift_idxs[:, np.newaxis]
+        in_range = (source_idxs >= 0) & (source_idxs < spectra.shape[1])
+        shifted_spectra = np.take_along_axis(spectra, np.clip(source_idxs, 0, spectra.shape[1] - 1), axis=1)
+        shifted_spectra[~in_range] = 0
 
         #now we calculate the power spectrum (by converting each frequency to a power and normalising)
-        power_spectrum = 1/len(signal) * (np.abs(shifted_spectrum) ** 2)
+        power_spectra = 1/signals.shape[1] * (shifted_spectra ** 2)
 
-        filter_bank_energies = TimbreCalculator.spectrum_to_mel_bands(
-            power_spectrum, sample_rate)
+        filter_bank_energies = TimbreCalculator.spectrogram_to_mel_bands(
+            power_spectra, sample_rate)
 
-        mfccs = scipy.fft.dct(filter_bank_energies)
+        mfccs = scipy.fft.dct(filter_bank_energies, axis=-1)
 
         return mfccs
 
+    def get_parameters(self):
+        return {
+            "window_size": self.window_size,
+            "target_pitch": self.target_pitch,
+        }
+
     def __repr__(self):
         return "Timbre"
 
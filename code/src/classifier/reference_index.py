@@ -0,0 +1,182 @@
+import classifier.metrics.metric_calculator as metric_calculator
+import json
+import os
+import os.path
+import numpy as np
+
+
+class ReferenceIndex:
+    def __init__(self, metrics, capacity=64):
+        """
+        An index of the embeddings of reference audios, which finds the nearest references to an audio with one vectorised distance calculation,
+        rather than calculating the similarity of every metric against every reference
+
+        Each dimension of the embeddings is standardised over the references, and each metric is weighted equally however long its embedding is
+
+        metrics: list of MetricCalculators to embed audios with, all of which must have an embedding
+        capacity: number of references to make room for up front, the index grows as needed
+        """
+        self.metrics = list(metrics)
+        self.keys = []
+        self.embeddings = None
+        # which columns of the embeddings belong to each metric
+        self.metric_slices = None
+        self.capacity = capacity
+        # what to multiply each column by to standardise and weight it, recalculated when references are added
+        self.scale = None
+
+    def __len__(self):
+        return len(self.keys)
+
+    def embed(self, audio):
+        """
+        Calculates the embedding of an audio, calculating (or loading) its metrics as needed
+
+        audio: an Audio object, or a string representing a path to a wavfile
+
+        returns: 1D np array of the embedding of each metric, one after the other
+        """
+        metric_values = metric_calculator.calculate_metrics(audio, self.metrics)
+
+        embeddings = []
+        for metric in self.metrics:
+            embedding = metric.calculate_embedding(metric_values[metric])
+            if embedding is None:
+                raise ValueError(f"{metric} metric doesn't have an embedding")
+            embeddings.append(np.asarray(embedding, dtype=np.float64))
+
+        if self.metric_slices is None:
+            ends = np.cumsum([len(embedding) for embedding in embeddings])
+            self.metric_slices = [slice(int(end) - len(embedding), int(end)) for end, embedding in zip(ends, embeddings)]
+
+        return np.concatenate(embeddings)
+
+    def add(self, audio, key=None):
+        """
+        Adds a reference audio to the index
+
+        audio: an Audio object, or a string representing a path to a wavfile
+        key: what query returns to identify this reference, must be JSON serialisable to save the index, defaults to the audio's name or path
+        """
+        if key is None:
+            key = audio if isinstance(audio, str) else audio.name
+
+        self.add_embedding(self.embed(audio), key)
+
+    def add_embedding(self, embedding, key):
+        """
+        Adds an already calculated embedding to the index
+
+        embedding: 1D np array, from self.embed
+        key: see add
+        """
+        if self.embeddings is None:
+            self.embeddings = np.zeros((self.capacity, len(embedding)))
+        elif len(self.keys) == len(self.embeddings):
+            # double the capacity so adding n references only copies O(n) embeddings
+            grown = np.zeros((2 * len(self.embeddings), self.embeddings.shape[1]))
+            grown[:len(self.keys)] = self.embeddings
+            self.embeddings = grown
+
+        self.embeddings[len(self.keys)] = embedding
+        self.keys.append(key)
+        self.scale = None
+
+    def get_scale(self):
+        if self.scale is None:
+            embeddings = self.embeddings[:len(self.keys)]
+            # the mean of each column cancels out of the distances, so standardising only needs the standard deviation
+            stdev = np.std(embeddings, axis=0)
+            # dimensions that are the same for every reference can't tell them apart anyway
+            stdev[stdev == 0] = 1
+
+            # a metric with a long embedding would otherwise count for more than one with a short embedding
+            weight = np.zeros(embeddings.shape[1])
+            for metric_slice in self.metric_slices:
+                weight[metric_slice] = 1 / np.sqrt(metric_slice.stop - metric_slice.start)
+
+            self.scale = weight / stdev
+
+        return self.scale
+
+    def query(self, audio, k=1):
+        """
+        Finds the references nearest to an audio
+
+        audio: an Audio object, or a string representing a path to a wavfile
+        k: number of references to find
+
+        returns: a list of up to k (distance, key) tuples, nearest first
+        """
+        return self.query_embedding(self.embed(audio), k)
+
+    def query_embedding(self, embedding, k=1):
+        """
+        embedding: 1D np array, from self.embed
+        k: number of references to find
+
+        returns: see query
+        """
+        if len(self.keys) == 0:
+            return []
+
+        differences = (self.embeddings[:len(self.keys)] - embedding) * self.get_scale()
+        distances = np.sqrt(np.einsum("ij,ij->i", differences, differences))
+
+        k = min(k, len(self.keys))
+        nearest = np.argpartition(distances, k - 1)[:k]
+        # stable sort so that ties come out in the order references were added
+        nearest = nearest[np.lexsort((nearest, distances[nearest]))]
+
+        return [(float(distances[i]), self.keys[i]) for i in nearest]
+
+    def save(self, directory):
+        """
+        Saves the index to a directory, created if it doesn't exist
+
+        directory: path to the directory
+        """
+        os.makedirs(directory, exist_ok=True)
+        embeddings = self.embeddings[:len(self.keys)] if self.embeddings is not None else np.zeros((0, 0))
+        np.save(os.path.join(directory, "embeddings.npy"), embeddings)
+
+        description = {
+            "keys": self.keys,
+            "metrics": ReferenceIndex.describe_metrics(self.metrics),
+            "metric_slices": [[s.start, s.stop] for s in self.metric_slices] if self.metric_slices is not None else None,
+        }
+        # write to a temporary file first so that we never leave a half-written index behind
+        temporary_path = os.path.join(directory, "index.json.tmp")
+        with open(temporary_path, "w") as f:
+            json.dump(description, f)
+        os.replace(temporary_path, os.path.join(directory, "index.json"))
+
+    def load(directory, metrics):
+        """
+        Loads an index saved with save
+
+        directory: path to the directory the index was saved to
+        metrics: list of MetricCalculators, which must be the same as the ones the index was built with
+
+        returns: the loaded ReferenceIndex
+        """
+        with open(os.path.join(directory, "index.json")) as f:
+            description = json.load(f)
+
+        if description["metrics"] != ReferenceIndex.describe_metrics(metrics):
+            raise ValueError(f"Index in {directory} was built with different metrics: {description['metrics']}")
+
+        index = ReferenceIndex(metrics)
+        if description["metric_slices"] is not None:
+            index.metric_slices = [slice(start, stop) for start, stop in description["metric_slices"]]
+
+        embeddings = np.load(os.path.join(directory, "embeddings.npy"))
+        if len(embeddings) > 0:
+            index.embeddings = embeddings
+            index.keys = list(description["keys"])
+
+        return index
+
+    def describe_metrics(metrics):
+        # enough to tell whether stored embeddings are still valid, in the form it comes back from JSON
+        return json.loads(json.dumps([[type(metric).__name__, metric_calculator.get_version(metric), metric.get_parameters()] for metric in metrics]))
@@ -0,0 +1,123 @@
+import math
+import numpy as np
+import scipy.signal
+
+
+class PolyphaseResampler:
+    def __init__(self, input_rate, output_rate, dtype=np.float64):
+        """
+        Resamples a signal by a rational ratio a block at a time, giving the same output as scipy.signal.resample_poly however the signal is split up.
+        The signal is conceptually upsampled, low pass filtered to stop aliasing, then downsampled, but only the filter taps that land on
+        real input samples and the outputs we keep are ever calculated, one phase of the filter at a time
+
+        input_rate: sample rate of the signal being resampled, in samples/sec
+        output_rate: sample rate to resample the signal to, in samples/sec
+        dtype: the np dtype to do the filtering in, defaults to float64
+        """
+        divisor = math.gcd(int(input_rate), int(output_rate))
+        self.up = int(output_rate) // divisor
+        self.down = int(input_rate) // divisor
+        self.dtype = dtype
+
+        # same kaiser windowed low pass filter as scipy.signal.resample_poly, centred on each output sample
+        max_rate = max(self.up, self.down)
+        if max_rate == 1:
+            # the sample rate isn't changing, so there is nothing to filter out and the signal is passed straight through
+            half_len = 0
+            taps = np.ones(1)
+        else:
+            half_len = 10 * max_rate
+            taps = scipy.signal.firwin(2 * half_len + 1, 1 / max_rate, window=("kaiser", 5.0)) * self.up
+
+        # output q * up + r is the dot product of phase_filters[r] with the num_taps input samples ending at q * down + phase_offsets[r]
+        self.num_taps = math.ceil(len(taps) / self.up)
+        self.phase_filters = np.zeros((self.up, self.num_taps), dtype=dtype)
+        self.phase_offsets = np.zeros(self.up, dtype=int)
+        for r in range(self.up):
+            newest_input, first_tap = divmod(r * self.down + half_len, self.up)
+            phase_taps = taps[first_tap::self.up]
+            # reversed so that the filter lines up with the input samples in time order
+            self.phase_filters[r, self.num_taps - len(phase_taps):] = phase_taps[::-1]
+            self.phase_offsets[r] = newest_input
+
+        # input samples that later outputs still need, starting from the zeros before the start of the signal
+        self.history = np.zeros(self.num_taps - 1, dtype=dtype)
+        self.history_start = -(self.num_taps - 1)
+        self.num_inputs = 0
+        self.num_outputs = 0
+
+    def process(self, block):
+        """
+        Feeds the next block of the signal to the resampler
+
+        block: 1D np array of the next samples of the signal
+
+        returns: 1D np array of every output sample that can be calculated from the signal so far, which lag behind the input by about half the filter
+        """
+        buffer = np.concatenate((self.history, np.asarray(block, dtype=self.dtype)))
+        self.num_inputs += len(block)
+
+        # each phase can output as far as its newest input sample has arrived, outputs are given in order so we stop at the first phase that can't
+        q_stops = np.maximum(0, (self.num_inputs - 1 - self.phase_offsets) // self.down + 1)
+        end = int(np.min(q_stops * self.up + np.arange(self.up)))
+        end = max(end, self.num_outputs)
+
+        output = np.empty(end - self.num_outputs, dtype=self.dtype)
+        if len(output) > 0:
+            windows = np.lib.stride_tricks.sliding_window_view(buffer, self.num_taps)
+            for r in range(self.up):
+                q_start = -((r - self.num_outputs) // self.up)
+                q_stop = -((r - end) // self.up)
+                if q_stop <= q_start:
+                    continue
+
+                first_window = q_start * self.down + self.phase_offsets[r] - (self.num_taps - 1) - self.history_start
+                phase_windows = windows[first_window::self.down][:q_stop - q_start]
+                output[q_start * self.up + r - self.num_outputs::self.up] = phase_windows @ self.phase_filters[r]
+
+        self.num_outputs = end
+
+        # keep everything from the oldest input sample that the next output of any phase needs
+        next_q = -((np.arange(self.up) - end) // self.up)
+        keep_from = min(int(np.min(next_q * self.down + self.phase_offsets)) - (self.num_taps - 1), self.num_inputs)
+        self.history = buffer[keep_from - self.history_start:].copy()
+        self.history_start = keep_from
+
+        return output
+
+    def flush(self):
+        """
+        Finishes resampling, treating the signal as zero after the last block
+
+        returns: 1D np array of the remaining output samples, so that there are ceil(input length * up / down) output samples in total, as with scipy.signal.resample_poly
+        """
+        total_outputs = -((-self.num_inputs * self.up) // self.down)
+        num_outputs = self.num_outputs
+
+        # enough zeros for the filter to run past the last output sample
+        output = self.process(np.zeros(self.num_taps + self.down, dtype=self.dtype))
+
+        return output[:max(0, total_outputs - num_outputs)]
+
+
+def resample(signal, input_rate, output_rate, block_size=1 << 16, dtype=np.float64):
+    """
+    Resamples a whole signal with a PolyphaseResampler, a block at a time so that memory use doesn't depend on the length of the signal
+
+    signal: 1D np array of the signal, which can be memory mapped
+    input_rate: sample rate of the signal in samples/sec
+    output_rate: sample rate to resample to in samples/sec
+    block_size: number of input samples to process at a time
+    dtype: the np dtype to do the filtering in and of the result, defaults to float64
+
+    returns: 1D np array of the resampled signal, ceil(len(signal) * output_rate / input_rate) samples long
+    """
+    if input_rate == output_rate:
+        return np.array(signal, dtype=dtype)
+
+    resampler = PolyphaseResampler(input_rate, output_rate, dtype)
+
+    blocks = [resampler.process(signal[start:start + block_size]) for start in range(0, len(signal), block_size)]
+    blocks.append(resampler.flush())
+
+    return np.concatenate(blocks)
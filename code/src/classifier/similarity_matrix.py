@@ -0,0 +1,117 @@
+import classifier.metrics.metric_calculator as metric_calculator
+import classifier.instrumentation as instrumentation
+import numpy as np
+
+
+class SimilarityMatrices:
+    def __init__(self, audios, workers=1):
+        """
+        Calculates and keeps the similarity between every pair of a set of audios, one matrix per metric, so that any combination
+        of metrics can be scored without recalculating any similarities
+
+        audios: list of Audio objects
+        workers: number of processes to calculate metrics with, defaults to 1, which calculates everything in this process
+        """
+        self.audios = audios
+        self.workers = workers
+        # N x N similarity matrices, indexed by MetricCalculator
+        self.matrices = {}
+
+    def get_matrix(self, metric):
+        """
+        Gets the similarity matrix for a metric, calculating it if it hasn't been already
+
+        metric: a MetricCalculator
+
+        returns: an N x N np array, where entry (i, j) is the similarity of audio j to audio i as an unknown audio, the diagonal is NaN
+        """
+        if metric not in self.matrices:
+            if self.workers != 1:
+                metric_calculator.calculate_metrics_parallel(self.audios, [metric], workers=self.workers)
+            metric_values = [metric_calculator.calculate_metrics(audio, [metric])[metric] for audio in self.audios]
+
+            matrix = np.full((len(self.audios), len(self.audios)), np.nan)
+            for i, unknown_audio in enumerate(self.audios):
+                for j, other_audio in enumerate(self.audios):
+                    if i != j:
+                        with instrumentation.stage(f"{metric}.calculate_similarity"):
+                            matrix[i, j] = metric.calculate_similarity(unknown_audio, other_audio, metric_values[i], metric_values[j])
+
+            self.matrices[metric] = matrix
+
+        return self.matrices[metric]
+
+    def get_combined_matrix(self, metrics):
+        """
+        Gets the mean similarity matrix of a combination of metrics, as used by metric_calculator.get_most_similar
+
+        metrics: list of MetricCalculators
+
+        returns: an N x N np array of mean similarities, the diagonal is NaN
+        """
+        # summed in the same order as get_most_similar so that we get exactly the same scores
+        similarity_sum = 0
+        for metric in metrics:
+            similarity_sum = similarity_sum + self.get_matrix(metric)
+
+        return similarity_sum / len(metrics)
+
+    def rank(self, metrics):
+        """
+        Ranks the other audios by similarity to each audio, leaving each audio out of its own ranking
+
+        metrics: list of MetricCalculators
+
+        returns: an N x (N-1) np array, where row i holds the indices of the other audios, most similar to audio i first. Ties are broken by lowest index, like get_most_similar,
+                 and any audios with a NaN similarity come last
+        """
+        combined = self.get_combined_matrix(metrics)
+
+        # stable sort of the negated similarities keeps tied audios in index order
+        ranking = np.argsort(-combined, axis=1, kind="stable")
+        # each audio is taken out of its own row by index rather than by sorting it last, as NaN similarities would sort after it
+        num_audios = len(self.audios)
+        return ranking[ranking != np.arange(num_audios)[:, None]].reshape(num_audios, num_audios - 1)
+
+
+def top_k_hits(ranking, labels, k=1):
+    """
+    Works out which audios had an audio with the same label in the top k of their ranking
+
+    ranking: a ranking from SimilarityMatrices.rank
+    labels: 1D np array of the label, e.g. performer, of each audio
+    k: how many of the most similar audios count
+
+    returns: 1D boolean np array, True where the audio was correctly identified
+    """
+    labels = np.asarray(labels)
+    return (labels[ranking[:, :k]] == labels[:, None]).any(axis=1)
+
+
+def top_k_accuracy(ranking, labels, k=1):
+    """
+    ranking, labels, k: see top_k_hits
+
+    returns: the proportion of audios that were correctly identified within the top k
+    """
+    return np.mean(top_k_hits(ranking, labels, k))
+
+
+def confusion_matrix(ranking, labels, classes):
+    """
+    Counts how often each label was identified as each other label, using the most similar audio
+
+    ranking: a ranking from SimilarityMatrices.rank
+    labels: 1D np array of the label of each audio
+    classes: list of every possible label, which decides the order of the rows and columns
+
+    returns: a len(classes) x len(classes) np array, where entry (i, j) counts audios labelled classes[i] identified as classes[j]
+    """
+    labels = np.asarray(labels)
+    class_indices = {label: i for i, label in enumerate(classes)}
+    actual = np.array([class_indices[label] for label in labels], dtype=int)
+    predicted = actual[ranking[:, 0]]
+
+    matrix = np.zeros((len(classes), len(classes)), dtype=int)
+    np.add.at(matrix, (actual, predicted), 1)
+    return matrix
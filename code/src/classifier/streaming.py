@@ -0,0 +1,345 @@
+import classifier.metrics.tempo as tempo
+import classifier.metrics.timbre as timbre
+import classifier.resampling as resampling
+import numpy as np
+import scipy.fft
+import scipy.signal
+import scipy.signal.windows
+
+
+class StreamingOnsetDetector:
+    def __init__(self, sample_rate, window_size=0.064, window_advance=0.004, onset_sample_rate=8000):
+        """
+        Calculates the same onset function as TempoCalculator.calculate_onset_func, but a block of audio at a time, with bounded latency and constant memory.
+        calculate_onset_func normalises by two statistics of the whole recording. Converting to dB relative to the loudest mel band cancels out of the
+        difference between frames anyway, so isn't needed, and the standard deviation of the whole onset function is replaced by the running standard
+        deviation of everything so far. Apart from this normalisation, and the first few windows, the onset values are the same as calculate_onset_func's
+
+        sample_rate: sample rate of the incoming audio in samples/sec
+        window_size: size of the window in s for which onset values are calculated, defaults to 0.064
+        window_advance: how far along each window is in s, defaults to 0.004
+        onset_sample_rate: sample rate the audio is resampled to before calculating the onset function, defaults to 8000
+        """
+        self.window_advance = window_advance
+        self.onset_sample_rate = onset_sample_rate
+        # as in Audio.get_spectrogram, audio that is already at the right sample rate isn't resampled
+        self.resampler = resampling.PolyphaseResampler(sample_rate, onset_sample_rate) if sample_rate != onset_sample_rate else None
+
+        self.frame_length = int(round(window_size * onset_sample_rate))
+        self.window = scipy.signal.windows.get_window("hann", self.frame_length, fftbins=False)
+
+        # resampled samples that frames still to come need, starting at sample self.buffer_start of the resampled signal
+        self.buffer = np.zeros(0)
+        self.buffer_start = 0
+        self.num_frames = 0
+        # log mel spectrum of the last frame, to take the difference with the next one
+        self.previous_mel_db = None
+
+        self.highpass_filter = scipy.signal.butter(5, 0.3, btype="highpass", output="sos", fs=1/window_advance)
+        self.highpass_state = np.zeros((self.highpass_filter.shape[0], 2))
+
+        # same smoothing as calculate_onset_func, which is centred so each smoothed value needs the next few filtered values too
+        envelope_length = 0.080
+        envelope_sigma = 0.020
+        self.gaussian_window = scipy.signal.windows.gaussian(int(envelope_length / window_advance), int(envelope_sigma / window_advance))
+        self.lookahead = (len(self.gaussian_window) - 1) // 2
+        # the last len(gaussian_window) - 1 filtered values, zero before the start as in np.convolve
+        self.smoothing_history = np.zeros(len(self.gaussian_window) - 1)
+        self.num_filtered = 0
+
+        # running count, mean and sum of squared differences from the mean of the smoothed onsets (Welford's algorithm)
+        self.count = 0
+        self.mean = 0.0
+        self.sum_squares = 0.0
+
+        # calculate_onset_func lines the onset function up with the audio by putting this many zeros in front of it
+        self.offset = int(window_size / window_advance)
+        self.num_onsets = 0
+
+    def process(self, block):
+        """
+        Feeds the next block of audio to the detector
+
+        block: 1D np array of the next samples of the audio
+
+        returns: 1D np array of the next onset values, the onset value at index i (counting from the start of the stream) is at time i * window_advance
+        """
+        if self.resampler is None:
+            return self.process_resampled(np.asarray(block, dtype=np.float64))
+        return self.process_resampled(self.resampler.process(block))
+
+    def flush(self):
+        """
+        Finishes the stream, treating the audio as silent after the last block
+
+        returns: 1D np array of the remaining onset values
+        """
+        onsets = self.process_resampled(self.resampler.flush() if self.resampler is not None else np.zeros(0))
+        # the last few smoothed values were waiting on filtered values that will never come, np.convolve treats these as zero
+        return np.concatenate((onsets, self.smooth(np.zeros(self.lookahead))))
+
+    def process_resampled(self, resampled):
+        self.buffer = np.concatenate((self.buffer, resampled))
+        buffer_end = self.buffer_start + len(self.buffer)
+
+        # frames start at the same samples as in Audio.get_frames
+        last_frame = self.num_frames + max(0, (buffer_end - self.frame_length - self.buffer_start) // max(1, int(self.window_advance * self.onset_sample_rate)) + 2)
+        starts = (np.arange(self.num_frames, last_frame) * self.window_advance * self.onset_sample_rate).astype(int)
+        starts = starts[starts + self.frame_length <= buffer_end]
+
+        if len(starts) > 0:
+            frames = np.lib.stride_tricks.sliding_window_view(self.buffer, self.frame_length)[starts - self.buffer_start] * self.window
+            power_spectrogram = 1/self.frame_length * np.abs(scipy.fft.rfft(frames, axis=1)) ** 2
+            mel_spectrogram = timbre.TimbreCalculator.spectrogram_to_mel_bands(power_spectrogram, self.onset_sample_rate)
+            # silence would give -inf, and nan differences, which would never leave the running statistics
+            mel_db = 10 * np.log10(np.maximum(mel_spectrogram, np.finfo(np.float64).tiny))
+
+            if self.previous_mel_db is not None:
+                mel_db_with_previous = np.concatenate(([self.previous_mel_db], mel_db))
+            else:
+                mel_db_with_previous = mel_db
+            self.previous_mel_db = mel_db[-1]
+            self.num_frames += len(starts)
+
+            onset_array = np.sum(np.diff(mel_db_with_previous, axis=0).clip(min=0), axis=1)
+            filtered_onsets, self.highpass_state = scipy.signal.sosfilt(self.highpass_filter, onset_array, zi=self.highpass_state)
+            onsets = self.smooth(filtered_onsets)
+        else:
+            onsets = np.zeros(0)
+
+        # drop everything before the next frame
+        next_start = int(self.num_frames * self.window_advance * self.onset_sample_rate)
+        self.buffer = self.buffer[next_start - self.buffer_start:]
+        self.buffer_start = next_start
+
+        return onsets
+
+    def smooth(self, filtered_onsets):
+        """
+        filtered_onsets: 1D np array of the next high pass filtered onset values
+
+        returns: 1D np array of the next normalised onset values, including the zeros that go in front of the first one
+        """
+        signal = np.concatenate((self.smoothing_history, filtered_onsets))
+        self.smoothing_history = signal[len(signal) - len(self.smoothing_history):]
+
+        # the full convolution at each new filtered value, of which the first few are before the centre of the first window
+        convolved = np.convolve(signal, self.gaussian_window, mode="valid")
+        skip = max(0, self.lookahead - self.num_filtered)
+        self.num_filtered += len(filtered_onsets)
+        convolved = convolved[skip:]
+
+        if len(convolved) == 0:
+            normalised = np.zeros(0)
+        else:
+            # the running count, mean and sum of squared deviations after each new value, from cumulative sums over the block merged into
+            # those of everything before it (Chan et al.'s parallel combination), rather than a Welford update per value.
+            # The values are shifted by the mean so far, or the first value, which doesn't change the deviations but keeps the sums small
+            shift = self.mean if self.count > 0 else convolved[0]
+            shifted = convolved - shift
+            block_counts = np.arange(1, len(convolved) + 1)
+            block_sums = np.cumsum(shifted)
+            block_sum_squares = np.maximum(np.cumsum(shifted ** 2) - block_sums ** 2 / block_counts, 0)
+
+            counts = self.count + block_counts
+            # difference between the mean of the block so far and the mean before it
+            delta = block_sums / block_counts + (shift - self.mean)
+            means = self.mean + delta * block_counts / counts
+            sum_squares = self.sum_squares + block_sum_squares + delta ** 2 * self.count * block_counts / counts
+
+            self.count = int(counts[-1])
+            self.mean = means[-1]
+            self.sum_squares = sum_squares[-1]
+
+            stdevs = np.sqrt(sum_squares / counts)
+            normalised = np.divide(convolved, stdevs, out=np.zeros(len(convolved)), where=stdevs > 0)
+
+        if self.num_onsets == 0 and len(normalised) > 0:
+            normalised = np.concatenate((np.zeros(self.offset), normalised))
+        self.num_onsets += len(normalised)
+
+        return normalised
+
+
+class StreamingBeatTracker:
+    # alpha, as in calculate_beats
+    WEIGHTING = 200
+
+    def __init__(self, window_advance=0.004, latency=1.0, tempo_history=8.0, tempo_interval=1.0, tempo_bias=0.5, envelope_width=0.9, min_tempo=30, max_tempo=300):
+        """
+        Tracks beats in an onset function as it arrives, with the same dynamic programming score as TempoCalculator.calculate_beats.
+        The score of each window only depends on earlier windows, so it is calculated as soon as the window's onset value arrives. Rather than
+        backtracing once from the best window of the whole recording, every block backtraces from the best window in the last beat period,
+        and beats on that path are given out once they are latency seconds old, by which point later windows rarely change them.
+        The global tempo is estimated the same way as calculate_global_tempo, over only the last tempo_history seconds, and is updated as the music goes on
+
+        window_advance: time in seconds between successive onset values, defaults to 0.004
+        latency: how old in seconds a beat has to be before it is given out, defaults to 1.0
+        tempo_history: how many seconds of the onset function the tempo is estimated from, defaults to 8.0
+        tempo_interval: how often in seconds the tempo is estimated, defaults to 1.0
+        tempo_bias, envelope_width, min_tempo, max_tempo: see TempoCalculator.calculate_global_tempo
+        """
+        self.window_advance = window_advance
+        self.latency_windows = int(latency / window_advance)
+        self.tempo_history_windows = int(tempo_history / window_advance)
+        self.tempo_interval_windows = max(1, int(tempo_interval / window_advance))
+        self.tempo_parameters = (tempo_bias, envelope_width, min_tempo, max_tempo)
+        # autocorrelations shorter than twice the longest lag we consider aren't worth much
+        self.min_tempo_windows = 2 * int(60 / (min_tempo * window_advance)) + 1
+
+        # the current global tempo estimate in BPM, None until there is enough of the onset function to estimate it
+        self.tempo = None
+        self.set_tempo(60 / tempo_bias)
+
+        # the onset values, scores and best predecessors (-1 if none) of the latest windows, starting at window self.start
+        # backtrace holds window numbers counted from the start of the stream
+        self.onsets = np.zeros(0)
+        self.scores = np.zeros(0)
+        self.backtrace = np.zeros(0, dtype=int)
+        self.start = 0
+        self.last_tempo_update = 0
+        # the last beat given out, in windows
+        self.last_beat = None
+
+        # enough windows to backtrace through the latency and look back over the longest possible gap between beats
+        self.keep = max(self.tempo_history_windows, self.latency_windows + 4 * int(60 / (min_tempo * window_advance)))
+
+    def set_tempo(self, bpm):
+        ideal_spacing = 60 / bpm
+        self.ideal_spacing_windows = int(ideal_spacing / self.window_advance)
+
+        # the same penalties, and range of gaps between beats, as calculate_beats
+        self.max_gap = self.ideal_spacing_windows * 2
+        self.min_gap = self.max_gap - int(self.max_gap - self.ideal_spacing_windows / 2)
+        self.gap_penalty = np.full(self.max_gap + 1, -np.inf)
+        self.gap_penalty[1:] = StreamingBeatTracker.WEIGHTING * tempo.TempoCalculator.beat_consistency(np.arange(1, self.max_gap + 1) * self.window_advance, 0, ideal_spacing)
+
+    def get_num_windows(self):
+        return self.start + len(self.scores)
+
+    def process(self, onsets):
+        """
+        Feeds the next onset values to the tracker
+
+        onsets: 1D np array of the next onset values, e.g. from StreamingOnsetDetector.process
+
+        returns: 1D np array of the times in seconds of any beats that are now latency seconds old, in order
+        """
+        onsets = np.asarray(onsets, dtype=np.float64)
+        self.onsets = np.concatenate((self.onsets, onsets))
+        self.scores = np.concatenate((self.scores, np.zeros(len(onsets))))
+        self.backtrace = np.concatenate((self.backtrace, np.zeros(len(onsets), dtype=int)))
+
+        window = self.get_num_windows() - len(onsets)
+        while window < self.get_num_windows():
+            if window >= self.get_next_tempo_update():
+                self.update_tempo(window)
+            # a block of min_gap windows never depends on itself, and the tempo doesn't change within one
+            block_stop = min(self.get_num_windows(), window + self.min_gap, self.get_next_tempo_update())
+            self.score_windows(window, block_stop)
+            window = block_stop
+
+        beats = self.commit_beats(self.get_num_windows() - 1 - self.latency_windows)
+        self.trim()
+        return beats
+
+    def flush(self):
+        """
+        Finishes the stream, giving out every remaining beat on the best path
+
+        returns: 1D np array of the times in seconds of the remaining beats
+        """
+        return self.commit_beats(self.get_num_windows() - 1)
+
+    def get_next_tempo_update(self):
+        return max(self.last_tempo_update + self.tempo_interval_windows, self.min_tempo_windows)
+
+    def update_tempo(self, window):
+        self.last_tempo_update = window
+
+        history = self.onsets[max(0, window - self.tempo_history_windows - self.start):window - self.start]
+        (bpm, _), = tempo.TempoCalculator.estimate_tempo_candidates(history, self.window_advance, *self.tempo_parameters, num_candidates=1)
+        self.tempo = bpm
+        self.set_tempo(bpm)
+
+    def score_windows(self, window_start, window_stop):
+        # scores of every possible predecessor of the windows, -inf before the start of the stream
+        first = window_start - self.max_gap
+        last = window_stop - self.min_gap - 1
+        past = np.full(last - first, -np.inf)
+        available = max(first, self.start)
+        if last > available:
+            past[available - first:] = self.scores[available - self.start:last - self.start]
+
+        # row i holds the scores of the possible predecessors of window_start + i, oldest first
+        predecessors = np.lib.stride_tricks.sliding_window_view(past, self.max_gap - self.min_gap)
+        scores = predecessors + self.gap_penalty[self.min_gap+1:][::-1]
+        best = np.argmax(scores, axis=1)
+        best_scores = scores[np.arange(len(best)), best]
+
+        windows = np.arange(window_start, window_stop)
+        onsets = self.onsets[window_start - self.start:window_stop - self.start]
+        # windows without any possible predecessor start a new path
+        reachable = best_scores > -np.inf
+        self.scores[window_start - self.start:window_stop - self.start] = np.where(reachable, best_scores, 0) + onsets
+        self.backtrace[window_start - self.start:window_stop - self.start] = np.where(reachable, windows - self.max_gap + best, -1)
+
+    def commit_beats(self, until):
+        """
+        Backtraces from the best window in the last beat period, giving out the beats on that path after the last beat given out
+
+        until: the latest window that can be given out
+
+        returns: 1D np array of the times in seconds of the beats given out
+        """
+        num_windows = self.get_num_windows()
+        if num_windows == 0:
+            return np.zeros(0)
+
+        search_start = max(self.start, num_windows - self.ideal_spacing_windows)
+        current = search_start + int(np.argmax(self.scores[search_start - self.start:]))
+
+        # beats closer than the shortest gap to the last beat given out are on a path that has since changed, so are skipped
+        earliest = self.last_beat + self.min_gap if self.last_beat is not None else self.start
+        path = []
+        while current >= max(earliest, self.start):
+            path.append(current)
+            current = self.backtrace[current - self.start]
+            if current < 0:
+                break
+        path.reverse()
+
+        beats = [beat for beat in path if beat <= until]
+        if len(beats) > 0:
+            self.last_beat = beats[-1]
+        return np.array(beats) * self.window_advance
+
+    def trim(self):
+        # only trim once there is a fair bit to drop, so we aren't copying the arrays on every block
+        excess = len(self.scores) - self.keep
+        if excess > self.keep:
+            self.onsets = self.onsets[excess:]
+            self.scores = self.scores[excess:]
+            self.backtrace = self.backtrace[excess:]
+            self.start += excess
+
+
+def stream_beats(blocks, sample_rate, **kwargs):
+    """
+    Tracks the beats of audio as it arrives, e.g. from a microphone
+
+    blocks: iterable of 1D np arrays of successive blocks of audio
+    sample_rate: sample rate of the audio in samples/sec
+    kwargs: any arguments for the StreamingBeatTracker
+
+    returns: a generator giving a (beat times, tempo) tuple for each block, and one more once the audio has finished,
+             where beat times is a 1D np array of the times in seconds of any new beats, and tempo is the current tempo estimate in BPM, or None
+    """
+    detector = StreamingOnsetDetector(sample_rate)
+    tracker = StreamingBeatTracker(window_advance=detector.window_advance, **kwargs)
+
+    for block in blocks:
+        yield (tracker.process(detector.process(block)), tracker.tempo)
+
+    beats = tracker.process(detector.flush())
+    yield (np.concatenate((beats, tracker.flush())), tracker.tempo)
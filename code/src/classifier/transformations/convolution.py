@@ -0,0 +1,72 @@
+import numpy as np
+import scipy.fft
+import classifier.util as util
+
+
+class PartitionedConvolver:
+    def __init__(self, ir, block_size=8192):
+        """
+        Convolves signals with a fixed impulse response by uniformly partitioned overlap-add in the frequency domain.
+        The impulse response is split into blocks of block_size samples and the spectrum of each block is calculated once here.
+        Signals are then processed a block at a time, so convolving takes O(N log B + NM/B) time for an N sample signal and M sample impulse response,
+        rather than the O(NM) of direct convolution, and the working memory only depends on the impulse response, however long the signal is
+
+        ir: 1D np array of the impulse response
+        block_size: length of each partition of the impulse response and of each block of the signal, defaults to 8192
+        """
+        self.ir_length = len(ir)
+        self.block_size = block_size
+        self.num_partitions = max(1, -(-len(ir) // block_size))
+
+        padded_ir = np.zeros(self.num_partitions * block_size)
+        padded_ir[:len(ir)] = ir
+        partitions = padded_ir.reshape(self.num_partitions, block_size)
+
+        # each partition is zero padded to twice the block size so that its linear convolution with a block fits without wrapping round.
+        # they are stored latest partition first, which is the order they line up with the most recent signal blocks in convolve
+        ir_spectra = scipy.fft.rfft(partitions, n=2 * block_size, axis=1)[::-1]
+        # spectra indexed by float dtype, so that single precision signals stay in single precision
+        self.ir_spectra = {np.dtype(np.float64): np.ascontiguousarray(ir_spectra)}
+
+    def get_ir_spectra(self, dtype):
+        dtype = np.dtype(dtype)
+        if dtype not in self.ir_spectra:
+            self.ir_spectra[dtype] = self.ir_spectra[np.dtype(np.float64)].astype(np.result_type(dtype, np.complex64))
+        return self.ir_spectra[dtype]
+
+    def convolve(self, signal):
+        """
+        Convolves a signal with the impulse response, giving the same result as np.convolve(signal, ir)
+
+        signal: 1D np array of the signal, which can be memory mapped
+
+        returns: 1D np array of the convolved signal, len(signal) + len(ir) - 1 samples long, in the signal's precision
+        """
+        dtype = util.float_dtype(signal)
+        ir_spectra = self.get_ir_spectra(dtype)
+        block_size = self.block_size
+        num_partitions = self.num_partitions
+
+        output_length = len(signal) + self.ir_length - 1
+        output = np.zeros(max(0, output_length), dtype=dtype)
+
+        # spectra of the most recent blocks of the signal. Each spectrum is written twice, num_partitions apart, so that the last num_partitions
+        # spectra can always be read as one contiguous slice, oldest first, without shuffling the buffer along
+        block_spectra = np.zeros((2 * num_partitions, block_size + 1), dtype=ir_spectra.dtype)
+        overlap = np.zeros(block_size, dtype=dtype)
+
+        for block_number, start in enumerate(range(0, len(output), block_size)):
+            # past the end of the signal we keep going with silence to get the tail of the reverb
+            block = signal[start:start + block_size]
+            position = block_number % num_partitions
+            block_spectra[position] = block_spectra[position + num_partitions] = scipy.fft.rfft(block.astype(dtype, copy=False), n=2 * block_size)
+
+            # every partition of the impulse response against the signal block it lines up with
+            spectrum = np.einsum("pk,pk->k", block_spectra[position + 1:position + num_partitions + 1], ir_spectra)
+            convolved_block = scipy.fft.irfft(spectrum, n=2 * block_size)
+
+            output_block = output[start:start + block_size]
+            output_block[:] = (convolved_block[:block_size] + overlap)[:len(output_block)]
+            overlap = convolved_block[block_size:]
+
+        return output
@@ -2,8 +2,14 @@ import numpy as np
 import scipy.io.wavfile
 import classifier.audio as audio
 import classifier.util as util
+import classifier.instrumentation as instrumentation
 import classifier.transformations.transformation as transformation
 
+# decoded noise signals indexed by the hash of their file, shared by every Noise object whatever its level
+NOISE_CACHE = {}
+# crossfaded loop segments indexed by (hash of the noise file, crossfade length in samples)
+NOISE_LOOPS = {}
+
 class Noise(transformation.Transformation):
     def __init__(self, noise, crossfade=0.5, level=1.0):
         """
@@ -13,10 +19,50 @@ class Noise(transformation.Transformation):
         """
         self.noise_path = noise
         self.level = level
-        self.noise = np.array(util.read_audio(noise).signal)
-        self.noise = (self.noise * level)
+        # what the noise does depends on what is in the file, not where it is, so the fingerprint changes if the file is replaced
+        self.noise_hash = util.hash_file(noise)
+        # the unscaled noise, shared with every other Noise using the same file, the level is applied when the noise is added
+        self.noise = Noise.get_noise(noise, self.noise_hash)
         self.crossfade = crossfade
 
+    def get_noise(noise_path, noise_hash):
+        """
+        Gets the signal of a noise file, decoding and caching it if we haven't seen it before
+
+        noise_path: path to a wavfile containing the noise
+        noise_hash: hash of the file, see util.hash_file, which the signal is cached by so a replaced file is decoded again
+
+        returns: 1D np array of the unscaled noise signal
+        """
+        instrumentation.count_cache("noise", noise_hash in NOISE_CACHE)
+        if noise_hash not in NOISE_CACHE:
+            NOISE_CACHE[noise_hash] = util.read_audio(noise_path).signal
+        return NOISE_CACHE[noise_hash]
+
+    def get_loop(self, crossfade_length_samples):
+        """
+        Gets the segment of noise that is repeated when the noise has to be looped, building and caching it if we haven't already.
+        Each repeat starts with the end of the noise crossfading into its start, followed by the rest of the noise up to where the next crossfade starts
+
+        crossfade_length_samples: length of the crossfade in samples
+
+        returns: 1D np array of the unscaled loop segment, len(self.noise) - crossfade_length_samples long
+        """
+        key = (self.noise_hash, crossfade_length_samples)
+        if key not in NOISE_LOOPS:
+            crossfade_down = np.linspace(1, 0, crossfade_length_samples)
+            crossfade_up = np.linspace(0, 1, crossfade_length_samples)
+
+            crossfade_out = self.noise[len(self.noise) - crossfade_length_samples:] * crossfade_down
+            crossfade_in = self.noise[:crossfade_length_samples] * crossfade_up
+
+            NOISE_LOOPS[key] = np.concatenate((
+                    crossfade_out + crossfade_in,
+                    self.noise[crossfade_length_samples:len(self.noise) - crossfade_length_samples],
+                    ))
+
+        return NOISE_LOOPS[key]
+
     def apply(self, audio_obj, out=None):
         """
         adds background noise to a signal, using pre-recorded noise
@@ -31,32 +77,45 @@ class Noise(transformation.Transformation):
         # we naively interpret the noise's sample rate as the same as the audios, probably fine
         sample_rate = audio_obj.sample_rate
 
-        # might need to repeat noise if it is not long enough, or truncate it if it is too long
-        length_matched_noise = self.noise
-        while len(length_matched_noise) < len(signal):
-            crossfade_length_samples = int(self.crossfade * sample_rate)
-            crossfade_down = np.linspace(1, 0, crossfade_length_samples)
-            crossfade_up = np.linspace(0, 1, crossfade_length_samples)
+        # might need to repeat noise if it is not long enough, or truncate it if it is too long.
+        # the noise bed is the noise up to where the first crossfade starts, then the loop segment as many times as it takes, then the end of the noise
+        length_matched_noise = np.empty(len(signal), dtype=audio_obj.get_dtype())
+        crossfade_length_samples = int(self.crossfade * sample_rate)
+        loop_start = len(self.noise) - crossfade_length_samples
 
-            crossfade_out = length_matched_noise[-crossfade_length_samples:] * crossfade_down
-            crossfade_in = self.noise[:crossfade_length_samples] * crossfade_up
+        head = length_matched_noise[:loop_start]
+        head[:] = self.noise[:len(head)]
 
-            # doesn't matter if we add too much noise, we truncate after this while loop
-            length_matched_noise = np.concatenate((
-                    length_matched_noise[:-crossfade_length_samples],
-                    crossfade_out + crossfade_in,
-                    self.noise[crossfade_length_samples:],
-                    ))
-        # truncate if too long
-        if len(length_matched_noise) > len(signal):
-            length_matched_noise = length_matched_noise[:len(signal)]
+        num_loops = 0
+        if len(signal) > len(self.noise):
+            loop = self.get_loop(crossfade_length_samples)
+            num_loops = -(-(len(signal) - len(self.noise)) // len(loop))
+
+            # write every whole repeat of the loop at once through a 2D view of the output
+            looped = length_matched_noise[loop_start:loop_start + num_loops * len(loop)]
+            whole_loops = len(looped) // len(loop)
+            looped[:whole_loops * len(loop)].reshape(whole_loops, len(loop))[:] = loop
+            looped[whole_loops * len(loop):] = loop[:len(looped) - whole_loops * len(loop)]
+
+        tail = length_matched_noise[loop_start + num_loops * (len(self.noise) - crossfade_length_samples):]
+        tail[:] = self.noise[loop_start:loop_start + len(tail)]
+
+        length_matched_noise *= self.level
+        noisy_signal = length_matched_noise
+        noisy_signal += signal
 
-        noisy_signal = length_matched_noise + signal
         if out != None:
             # we limit at 1.0 here to avoid clipping
             scipy.io.wavfile.write(out, sample_rate, noisy_signal/max(noisy_signal))
 
-        return audio.Audio(noisy_signal, sample_rate, name=audio_obj.name)
+        return audio.Audio(noisy_signal, sample_rate, name=audio_obj.name, fingerprint=self.transform_fingerprint(audio_obj))
+
+    def get_parameters(self):
+        return {
+            "noise": self.noise_hash,
+            "crossfade": self.crossfade,
+            "level": self.level,
+        }
 
     def __repr__(self):
         return f"Noise | path: {self.noise_path} | crossfade: {self.crossfade} | level: {self.level}"
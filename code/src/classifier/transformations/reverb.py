@@ -2,6 +2,7 @@ import numpy as np
 import scipy.io.wavfile
 import classifier.util as util
 import classifier.audio as audio
+import classifier.transformations.convolution as convolution
 import classifier.transformations.transformation as transformation
 
 class Reverb(transformation.Transformation):
@@ -11,10 +12,14 @@ class Reverb(transformation.Transformation):
         """
         self.ir_path = ir
         self.ir = util.read_audio(ir).signal
+        # what the reverb does depends on what is in the file, not where it is, so the fingerprint changes if the file is replaced
+        self.ir_hash = util.hash_file(ir)
+        # the spectra of the impulse response are calculated once here and reused for every audio
+        self.convolver = convolution.PartitionedConvolver(self.ir)
 
     def apply(self, audio_obj, out=None):
         """
-        applies reverb to a signal, using a convolutional method
+        applies reverb to a signal, by convolving it with the impulse response in the frequency domain
 
         audio_obj: Audio object representing the signal to apply reverb to
         out: optionally a path to where a wav file of the reverbed audio should be saved
@@ -25,13 +30,18 @@ class Reverb(transformation.Transformation):
         sample_rate = audio_obj.sample_rate
         signal = audio_obj.signal
 
-        convolved = np.convolve(signal, self.ir)
+        convolved = self.convolver.convolve(signal)
 
         if out != None:
             # we normalise  to max 1.0 here to avoid clipping
             scipy.io.wavfile.write(out, sample_rate, convolved/max(convolved))
 
-        return audio.Audio(convolved, sample_rate, name=audio_obj.name)
+        return audio.Audio(convolved, sample_rate, name=audio_obj.name, fingerprint=self.transform_fingerprint(audio_obj))
+
+    def get_parameters(self):
+        return {
+            "ir": self.ir_hash,
+        }
 
     def __repr__(self):
         return f"Reverb | IR : {self.ir_path}"
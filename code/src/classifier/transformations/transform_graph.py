@@ -0,0 +1,83 @@
+import classifier.instrumentation as instrumentation
+import classifier.util as util
+
+
+class TransformGraph:
+    def __init__(self, transform_combinations, load=util.read_audio):
+        """
+        Applies many combinations of transformations to audios, sharing the work between combinations that start with the same transformations.
+        The combinations form a tree, where each node is a prefix of some combination, e.g. (Noise,) is the parent of both (Noise,) and (Noise, Reverb).
+        The audio at each node is only calculated once per source, and is released as soon as every combination passing through it has been got
+
+        transform_combinations: list of tuples of Transformations, each of which will be applied in order
+        load: function turning a source, e.g. a path to a wavfile, into an Audio object, defaults to util.read_audio
+        """
+        self.load = load
+        self.combinations = set(tuple(combination) for combination in transform_combinations)
+
+        # how many of the combinations pass through each prefix, which is how many times each source's audio at that prefix will be needed
+        self.consumers = {}
+        for combination in self.combinations:
+            for length in range(len(combination) + 1):
+                prefix = combination[:length]
+                self.consumers[prefix] = self.consumers.get(prefix, 0) + 1
+
+        # audios at each prefix, indexed by (source, prefix), only held while some combination still needs them
+        self.audios = {}
+        # how many combinations still need each audio in self.audios
+        self.remaining = {}
+        # (source, combination) pairs that have already been got
+        self.done = set()
+
+    def get(self, source, combination):
+        """
+        Gets the audio resulting from applying a combination of transformations to a source
+
+        source: the source to transform, passed to load if we don't have any of its intermediate audios
+        combination: tuple of Transformations, which must be one of the combinations the graph was created with
+
+        returns: the transformed Audio object
+        """
+        combination = tuple(combination)
+        if combination not in self.combinations:
+            raise ValueError(f"Transform combination {combination} is not in the graph")
+
+        # start from the longest prefix we still have
+        length = len(combination)
+        while length >= 0 and (source, combination[:length]) not in self.audios:
+            length -= 1
+
+        if length < 0:
+            audio = self.load(source)
+            length = 0
+            self.hold(source, (), audio)
+        else:
+            audio = self.audios[source, combination[:length]]
+
+        for i in range(length, len(combination)):
+            with instrumentation.stage(f"{type(combination[i]).__name__}.apply"):
+                audio = combination[i].apply(audio)
+            self.hold(source, combination[:i+1], audio)
+
+        if (source, combination) not in self.done:
+            self.done.add((source, combination))
+            # this combination no longer needs any of its prefixes
+            for length in range(len(combination) + 1):
+                self.release(source, combination[:length])
+
+        return audio
+
+    def hold(self, source, prefix, audio):
+        # only hold on to audios that some combination we haven't got yet still needs.
+        # every prefix of a combination is held while getting it, so the first time we see a prefix none of its combinations have been got yet
+        if (source, prefix) not in self.remaining:
+            self.remaining[source, prefix] = self.consumers[prefix]
+        if self.remaining[source, prefix] > 0:
+            self.audios[source, prefix] = audio
+
+    def release(self, source, prefix):
+        if (source, prefix) not in self.remaining:
+            return
+        self.remaining[source, prefix] -= 1
+        if self.remaining[source, prefix] <= 0:
+            self.audios.pop((source, prefix), None)
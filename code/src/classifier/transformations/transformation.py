@@ -1,6 +1,34 @@
+import hashlib
+import json
+
 class Transformation:
     def __init__(self):
         raise NotImplementedError("Please override this method")
 
     def apply(self, audio, out=None):
         raise NotImplementedError("Please override this method")
+
+    def get_parameters(self):
+        """
+        returns: a dictionary of the parameters that decide what this transformation does, two transformations of the same class with the same parameters are equal
+        """
+        raise NotImplementedError("Please override this method")
+
+    def __eq__(self, other):
+        return type(self) == type(other) and self.get_parameters() == other.get_parameters()
+
+    def __hash__(self):
+        return hash((type(self).__name__, json.dumps(self.get_parameters(), sort_keys=True)))
+
+    def transform_fingerprint(self, audio):
+        """
+        Works out the fingerprint of the audio that results from applying this transformation to some audio
+
+        audio: the Audio object this transformation is being applied to
+
+        returns: a string identifying the transformed audio, or None if the original audio has no fingerprint
+        """
+        if audio.fingerprint is None:
+            return None
+        description = json.dumps([audio.fingerprint, type(self).__name__, self.get_parameters()], sort_keys=True)
+        return hashlib.sha256(description.encode()).hexdigest()
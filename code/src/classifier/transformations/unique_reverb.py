@@ -2,6 +2,7 @@ import numpy as np
 import scipy.io.wavfile
 import classifier.util as util
 import classifier.audio as audio
+import classifier.transformations.convolution as convolution
 import classifier.transformations.transformation as transformation
 
 class UniqueReverb(transformation.Transformation):
@@ -11,10 +12,14 @@ class UniqueReverb(transformation.Transformation):
         """
         self.ir_paths = irs
         self.irs = [util.read_audio(ir).signal for ir in irs]
+        # fingerprinted by what is in the files, as in Reverb
+        self.ir_hashes = [util.hash_file(ir) for ir in irs]
+        # the spectra of each impulse response are calculated once here and reused for every audio
+        self.convolvers = [convolution.PartitionedConvolver(ir) for ir in self.irs]
 
     def apply(self, audio_obj, out=None):
         """
-        applies reverb to a signal, using a convolutional method
+        applies reverb to a signal, by convolving it with the performer's impulse response in the frequency domain
 
         audio_obj: Audio object representing the signal to apply reverb to
         out: optionally a path to where a wav file of the reverbed audio should be saved
@@ -29,16 +34,21 @@ class UniqueReverb(transformation.Transformation):
         audio_name = audio_obj.name.split("_")
         performer_num = int(audio_name[-3])
 
-        ir = self.irs[performer_num - 1]
-        print(self.ir_paths[performer_num - 1])
+        convolver = self.convolvers[performer_num - 1]
+        util.log(self.ir_paths[performer_num - 1], level=2)
 
-        convolved = np.convolve(signal, ir)
+        convolved = convolver.convolve(signal)
 
         if out != None:
             # we normalise  to max 1.0 here to avoid clipping
             scipy.io.wavfile.write(out, sample_rate, convolved/max(convolved))
 
-        return audio.Audio(convolved, sample_rate, name=audio_obj.name)
+        return audio.Audio(convolved, sample_rate, name=audio_obj.name, fingerprint=self.transform_fingerprint(audio_obj))
+
+    def get_parameters(self):
+        return {
+            "irs": list(self.ir_hashes),
+        }
 
     def __repr__(self):
         return f"Reverb | IRs : {self.ir_paths}"
@@ -1,21 +1,182 @@
+import classifier.instrumentation as instrumentation
+import hashlib
 import scipy.io.wavfile
 import numpy as np
 import matplotlib.pyplot as plt
 
-def read_audio(wavfile_path):
+# formats in the WAV fmt chunk
+WAVE_FORMAT_PCM = 0x0001
+WAVE_FORMAT_IEEE_FLOAT = 0x0003
+WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+
+# how much progress log prints, 0 prints nothing, 1 prints the main steps of a run, 2 also prints every metric of every audio
+VERBOSITY = 1
+
+
+def log(message, level=1):
+    """
+    Prints a progress message if VERBOSITY is at least level
+
+    message: string to print
+    level: the lowest VERBOSITY the message is printed at, defaults to 1
+    """
+    if VERBOSITY >= level:
+        print(message)
+
+
+def read_audio(wavfile_path, dtype=np.float32, mmap=False, chunk_size=1 << 20):
     """
     wavfile_path: string of the path to a WAV file that contains the audio that should be read
+    dtype: the np dtype the signal should be converted to, defaults to float32. If None, mono signals keep the dtype they are stored with
+           (24-bit audio is stored in int32, in the top 3 bytes) and multichannel signals are mixed down in float64
+    mmap: if True, the file is memory mapped rather than read into memory, so only the converted mono signal takes up memory, defaults to False
+    chunk_size: number of samples to convert and mix down at a time, which bounds the extra memory needed for the conversion
 
     returns: an Audio object containing the mono signal
     """
     # avoids circular import
     from classifier.audio import Audio
 
-    rate, data = scipy.io.wavfile.read(wavfile_path)
-    if data.ndim > 1:
-        # mix to mono
-        data = np.mean(data, axis=1)
-    return Audio(data, rate, name=wavfile_path)
+    with instrumentation.stage("read_audio"):
+        if mmap:
+            rate, data = read_wav_mmap(wavfile_path)
+        else:
+            rate, data = scipy.io.wavfile.read(wavfile_path)
+
+        data = mix_to_mono(data, dtype, chunk_size)
+        # results calculated in different precisions differ slightly, so they shouldn't be stored under the same fingerprint
+        return Audio(data, rate, name=wavfile_path, fingerprint=f"{hash_file(wavfile_path)}/{data.dtype.name}")
+
+
+def float_dtype(array):
+    """
+    array: np array of a signal, spectrum etc.
+
+    returns: the float dtype calculations on array should be done in, float32 arrays stay in single precision and anything else is done in double precision
+    """
+    if array.dtype == np.float32:
+        return np.float32
+    return np.float64
+
+
+def is_24_bit(data):
+    # read_wav_mmap gives 24-bit samples as their 3 raw bytes
+    return data.dtype == np.uint8 and data.ndim == 3
+
+
+def mix_to_mono(data, dtype, chunk_size=1 << 20):
+    """
+    Converts a (possibly memory mapped) signal to mono in a particular dtype, a chunk at a time so that we never have a converted copy of every channel in memory
+
+    data: np array of the signal, either 1D, 2D with one column per channel, or 3D holding the raw bytes of each 24-bit sample
+    dtype: the np dtype of the mono signal, or None to keep the dtype of mono signals and mix down multichannel signals in float64
+    chunk_size: number of samples to convert at a time
+
+    returns: a 1D np array of the mono signal
+    """
+    mono = data.ndim == 1 or (is_24_bit(data) and data.shape[1] == 1)
+    if data.ndim == 1 and (dtype is None or data.dtype == dtype):
+        # nothing to do, if data is memory mapped it stays that way
+        return data
+    if dtype is None:
+        dtype = np.int32 if mono else np.float64
+
+    signal = np.empty(len(data), dtype=dtype)
+    for start in range(0, len(data), chunk_size):
+        chunk = data[start:start + chunk_size]
+        if is_24_bit(chunk):
+            # put the 3 bytes of each sample in the top of an int32, which keeps the sign, like scipy.io.wavfile does
+            chunk = (chunk[..., 0].astype(np.int32) << 8) | (chunk[..., 1].astype(np.int32) << 16) | (chunk[..., 2].astype(np.int32) << 24)
+
+        if chunk.ndim > 1:
+            # mix to mono
+            signal[start:start + chunk_size] = np.mean(chunk, axis=1, dtype=dtype if np.issubdtype(dtype, np.floating) else np.float64)
+        else:
+            signal[start:start + chunk_size] = chunk
+
+    return signal
+
+
+def read_wav_mmap(wavfile_path):
+    """
+    Memory maps the samples of a WAV file, without reading them
+
+    wavfile_path: string of the path to a WAV file
+
+    returns: a (sample rate, data) tuple, where data is a read-only memory mapped array with one column per channel,
+             except for 24-bit audio, where there is a third axis holding the 3 little-endian bytes of each sample
+    """
+    with open(wavfile_path, "rb") as f:
+        header = f.read(12)
+        if len(header) < 12 or header[:4] != b"RIFF" or header[8:12] != b"WAVE":
+            raise ValueError(f"{wavfile_path} is not a little-endian RIFF WAVE file")
+
+        fmt = None
+        while True:
+            chunk_header = f.read(8)
+            if len(chunk_header) < 8:
+                raise ValueError(f"{wavfile_path} has no data chunk")
+            chunk_id = chunk_header[:4]
+            chunk_size = int.from_bytes(chunk_header[4:], "little")
+
+            if chunk_id == b"fmt ":
+                fmt = f.read(chunk_size)
+                # chunks are padded to an even number of bytes
+                f.seek(chunk_size % 2, 1)
+            elif chunk_id == b"data":
+                data_offset = f.tell()
+                data_size = chunk_size
+                break
+            else:
+                f.seek(chunk_size + chunk_size % 2, 1)
+
+    if fmt is None:
+        raise ValueError(f"{wavfile_path} has no fmt chunk before its data chunk")
+
+    format_tag = int.from_bytes(fmt[0:2], "little")
+    channels = int.from_bytes(fmt[2:4], "little")
+    sample_rate = int.from_bytes(fmt[4:8], "little")
+    bits_per_sample = int.from_bytes(fmt[14:16], "little")
+    if format_tag == WAVE_FORMAT_EXTENSIBLE:
+        # the actual format is the start of the sub-format GUID
+        format_tag = int.from_bytes(fmt[24:26], "little")
+
+    dtypes = {
+        (WAVE_FORMAT_PCM, 8): np.uint8,
+        (WAVE_FORMAT_PCM, 16): np.dtype("<i2"),
+        (WAVE_FORMAT_PCM, 24): np.uint8,
+        (WAVE_FORMAT_PCM, 32): np.dtype("<i4"),
+        (WAVE_FORMAT_IEEE_FLOAT, 32): np.dtype("<f4"),
+        (WAVE_FORMAT_IEEE_FLOAT, 64): np.dtype("<f8"),
+    }
+    if (format_tag, bits_per_sample) not in dtypes:
+        raise ValueError(f"{wavfile_path} has an unsupported format {format_tag} with {bits_per_sample} bits per sample")
+
+    bytes_per_sample = bits_per_sample // 8
+    num_samples = data_size // (bytes_per_sample * channels)
+    shape = (num_samples, channels, 3) if bits_per_sample == 24 else (num_samples, channels)
+
+    data = np.memmap(wavfile_path, dtype=dtypes[format_tag, bits_per_sample], mode="r", offset=data_offset, shape=shape)
+    if channels == 1 and bits_per_sample != 24:
+        data = data[:, 0]
+
+    return sample_rate, data
+
+
+def hash_file(path, chunk_size=1 << 20):
+    """
+    Hashes the contents of a file, reading it in chunks
+
+    path: string of the path to the file to hash
+    chunk_size: number of bytes to read at a time
+
+    returns: a hex string of the SHA-256 hash of the file contents
+    """
+    file_hash = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            file_hash.update(chunk)
+    return file_hash.hexdigest()
 
 
 def moving_average(data, n):
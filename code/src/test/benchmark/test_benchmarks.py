@@ -0,0 +1,55 @@
+import benchmark.benchmarks as benchmarks
+import benchmark.signals as signals
+import copy
+import numpy as np
+import tempfile
+import unittest
+
+
+class SignalsTestCase(unittest.TestCase):
+    def test_piano_is_deterministic(self):
+        performance = signals.piano(3, sample_rate=8000)
+        self.assertEqual(len(performance.signal), 24000)
+        self.assertEqual(performance.signal.dtype, np.float32)
+        self.assertAlmostEqual(float(np.max(np.abs(performance.signal))), 20000, places=1)
+        np.testing.assert_array_equal(performance.signal, signals.piano(3, sample_rate=8000).signal)
+        self.assertFalse(np.array_equal(performance.signal, signals.piano(3, sample_rate=8000, seed=1).signal))
+
+
+class BenchmarksTestCase(unittest.TestCase):
+    def setUp(self):
+        self.stage_names = ["beat_tracking", "Offsets.calculate_metric", "Offsets.calculate_similarity", "Noise.apply"]
+        self.results = benchmarks.run_benchmarks([4, 6], stage_names=self.stage_names, sample_rate=8000)
+
+    def test_run_benchmarks(self):
+        self.assertEqual(list(self.results["results"]), self.stage_names)
+        for name in self.stage_names:
+            self.assertEqual(set(self.results["results"][name]), {"4", "6"})
+            for result in self.results["results"][name].values():
+                self.assertGreaterEqual(result["wall_time"], 0)
+                self.assertGreaterEqual(result["peak_memory"], 0)
+
+        self.assertIn("Noise.apply", benchmarks.format_results(self.results))
+
+    def test_find_regressions(self):
+        self.assertEqual(benchmarks.find_regressions(self.results, self.results), [])
+
+        slower = copy.deepcopy(self.results)
+        slower["results"]["Noise.apply"]["6"]["wall_time"] += 1
+        slower["results"]["beat_tracking"]["4"]["peak_memory"] += 100 << 20
+        regressions = benchmarks.find_regressions(slower, self.results)
+        self.assertEqual([(r["stage"], r["duration"], r["measure"]) for r in regressions],
+                [("beat_tracking", "4", "peak_memory"), ("Noise.apply", "6", "wall_time")])
+
+    def test_save_baseline_merges(self):
+        with tempfile.TemporaryDirectory() as directory:
+            self.assertIsNone(benchmarks.load_baseline(self.results["machine"], directory))
+            benchmarks.save_baseline(self.results, directory)
+
+            later = copy.deepcopy(self.results)
+            later["results"] = {"Noise.apply": {"8": self.results["results"]["Noise.apply"]["4"]}}
+            benchmarks.save_baseline(later, directory)
+
+            baseline = benchmarks.load_baseline(self.results["machine"], directory)
+            self.assertEqual(set(baseline["results"]["Noise.apply"]), {"4", "6", "8"})
+            self.assertEqual(baseline["results"]["beat_tracking"], self.results["results"]["beat_tracking"])
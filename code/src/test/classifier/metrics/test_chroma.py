@@ -2,6 +2,7 @@ import classifier.metrics.chroma as chroma
 import numpy as np
 import unittest
 import classifier.util as util
+import classifier.audio as audio
 import matplotlib.pyplot as plt
 
 class ChromaTestCase(unittest.TestCase):
@@ -20,4 +21,16 @@ class ChromaTestCase(unittest.TestCase):
 
         self.assertCountEqual([4,9], np.argsort(pitch_profile)[-2:])
 
+    def test_pitch_class_projection(self):
+        projection = chroma.ChromaCalculator.get_pitch_class_projection(2206, 44100)
 
+        self.assertEqual(projection.shape, (12, 2206))
+        # each bin belongs to at most one pitch band
+        self.assertTrue((np.sum(projection, axis=0) <= 1).all())
+
+    def test_calculate_metric_single_pitch(self):
+        sample_rate = 44100
+        signal = np.sin(2 * np.pi * 440 * np.arange(sample_rate) / sample_rate)
+        chroma_array = chroma.ChromaCalculator().calculate_metric(audio.Audio(signal, sample_rate))
+
+        self.assertTrue((np.argmax(chroma_array, axis=1) == 9).all())
@@ -1,6 +1,8 @@
 import classifier.metrics.dynamics as dynamics
 import numpy as np
 import unittest
+import scipy.signal
+import classifier.audio as audio
 
 class DynamicsTestCase(unittest.TestCase):
     def test_freqweighting(self):
@@ -10,5 +12,25 @@ class DynamicsTestCase(unittest.TestCase):
         for i, freq in enumerate(freqs):
             self.assertAlmostEqual(actual_weightings[i], dynamics.DynamicsCalculator.freqweighting(freq), places=0)
 
+    def test_weighting_filter(self):
+        sample_rate = 44100
+        freqs = np.geomspace(31.5, 20000, 50)
+        _, response = scipy.signal.sosfreqz(dynamics.DynamicsCalculator.get_weighting_filter(sample_rate), worN=freqs, fs=sample_rate)
 
+        np.testing.assert_allclose(20 * np.log10(np.abs(response)), dynamics.DynamicsCalculator.freqweighting(freqs), atol=0.5)
 
+    def test_filtered_levels(self):
+        sample_rate = 44100
+        tone = audio.Audio(10000 * np.sin(2 * np.pi * 1000 * np.arange(2 * sample_rate) / sample_rate), sample_rate)
+
+        spectral_levels = dynamics.DynamicsCalculator().calculate_metric(tone)
+        filtered_levels = dynamics.DynamicsCalculator(loudness="filter").calculate_metric(tone)
+
+        self.assertEqual(len(spectral_levels), len(filtered_levels))
+        # the spectral levels weight the tone as if it were at 2kHz, see calculate_filtered_levels
+        expected_difference = dynamics.DynamicsCalculator.freqweighting(2000) - dynamics.DynamicsCalculator.freqweighting(1000)
+        self.assertAlmostEqual(np.median(spectral_levels - filtered_levels), expected_difference, places=0)
+
+    def test_unknown_loudness(self):
+        with self.assertRaises(ValueError):
+            dynamics.DynamicsCalculator(loudness="loud")
@@ -0,0 +1,130 @@
+import classifier.metrics.metric_calculator as metric_calculator
+import classifier.metrics.chroma as chroma
+import classifier.metrics.dynamics as dynamics
+import classifier.metrics.offsets as offsets
+import classifier.metrics.tempo as tempo
+import classifier.metrics.timbre as timbre
+import classifier.metrics.metric as metric
+import classifier.audio as audio
+import numpy as np
+import unittest
+
+
+def performance(seed, duration=6, sample_rate=8000):
+    """
+    Makes a signal of decaying notes of random pitches at a slightly uneven tempo
+    """
+    rng = np.random.default_rng(seed)
+    signal = rng.normal(0, 0.01, int(duration * sample_rate))
+    beat_time = 0.25
+    while beat_time < duration - 0.5:
+        frequency = 220 * 2 ** (rng.integers(0, 24) / 12)
+        note = np.sin(2 * np.pi * frequency * np.arange(4000) / sample_rate) * np.exp(-np.arange(4000) / 800)
+        start = int(beat_time * sample_rate)
+        signal[start:start + len(note)] += note[:len(signal) - start]
+        beat_time += 0.5 * rng.uniform(0.95, 1.05)
+    return audio.Audio(signal * 10000, sample_rate, name=f"performance {seed}")
+
+
+class CountingLevelCalculator(metric.MetricCalculator):
+    def __init__(self, scale, cost):
+        self.scale = scale
+        self.COST = cost
+        self.metric_calls = 0
+        self.similarity_calls = 0
+
+    def calculate_metric(self, audio):
+        self.metric_calls += 1
+        return np.mean(audio.signal)
+
+    def calculate_similarity(self, audio1, audio2, metric1, metric2):
+        self.similarity_calls += 1
+        return np.exp(-self.scale * abs(metric1 - metric2))
+
+    def __repr__(self):
+        return f"Level {self.scale} {self.COST}"
+
+
+class MetricCalculatorTestCase(unittest.TestCase):
+    def setUp(self):
+        self.metrics = [
+            chroma.ChromaCalculator(),
+            dynamics.DynamicsCalculator(),
+            offsets.OffsetsCalculator(),
+            tempo.TempoCalculator(),
+            timbre.TimbreCalculator(),
+        ]
+
+    def assert_metrics_equal(self, metrics1, metrics2):
+        for metric in self.metrics:
+            if isinstance(metrics1[metric], tuple):
+                for value1, value2 in zip(metrics1[metric], metrics2[metric]):
+                    np.testing.assert_array_equal(value1, value2)
+            else:
+                np.testing.assert_array_equal(metrics1[metric], metrics2[metric])
+
+    def test_parallel_matches_serial(self):
+        serial = [metric_calculator.calculate_metrics(performance(seed), self.metrics) for seed in range(3)]
+
+        audios = [performance(seed) for seed in range(3)]
+        parallel = metric_calculator.calculate_metrics_parallel(audios, self.metrics, workers=2)
+
+        for serial_metrics, parallel_metrics, parallel_audio in zip(serial, parallel, audios):
+            self.assert_metrics_equal(serial_metrics, parallel_metrics)
+            # the results should also be cached in the audio objects
+            self.assertIsNotNone(parallel_audio.beat_times)
+            for metric in self.metrics:
+                self.assertIs(parallel_audio.get_cached_metric(metric), parallel_metrics[metric])
+
+    def test_parallel_most_similar(self):
+        serial = metric_calculator.get_most_similar(performance(0), [performance(1), performance(2)], self.metrics)
+        parallel = metric_calculator.get_most_similar(performance(0), [performance(1), performance(2)], self.metrics, workers=2)
+
+        self.assertEqual(serial[0], parallel[0])
+        self.assertEqual(serial[1].name, parallel[1].name)
+
+    def test_cascade_matches_exhaustive(self):
+        for seed in range(3):
+            others = [performance(other_seed) for other_seed in range(4) if other_seed != seed]
+            exhaustive = metric_calculator.get_most_similar(performance(seed), others, self.metrics)
+            cascaded = metric_calculator.get_most_similar(performance(seed), others, self.metrics, cascade=True)
+
+            self.assertEqual(exhaustive[0], cascaded[0])
+            self.assertEqual(exhaustive[1].name, cascaded[1].name)
+
+    def test_cascade_skips_expensive_metrics(self):
+        expensive = CountingLevelCalculator(1.0, cost=10)
+        metrics = [expensive, CountingLevelCalculator(2.0, cost=1), CountingLevelCalculator(3.0, cost=2)]
+        unknown = audio.Audio(np.zeros(10), 10)
+        others = [audio.Audio(np.full(10, level), 10) for level in [5.0, 0.1, 3.0, 0.2, 10.0]]
+
+        exhaustive = metric_calculator.get_most_similar(unknown, others, metrics)
+        calls = expensive.metric_calls
+        cascaded = metric_calculator.get_most_similar(audio.Audio(np.zeros(10), 10), [audio.Audio(other.signal, 10) for other in others], metrics, cascade=True)
+
+        self.assertEqual(exhaustive[0], cascaded[0])
+        np.testing.assert_array_equal(exhaustive[1].signal, cascaded[1].signal)
+        # the cheap metrics rule out everything but the closest audio, so the expensive one is only calculated for it and the unknown audio
+        self.assertEqual(expensive.metric_calls - calls, 2)
+
+    def test_cascade_calculates_each_similarity_once(self):
+        metrics = [CountingLevelCalculator(1.0, cost=1) for _ in range(3)]
+        others = [audio.Audio(np.full(10, level), 10) for level in [0.1, 5.0, 10.0, 20.0]]
+
+        exhaustive = metric_calculator.get_most_similar(audio.Audio(np.zeros(10), 10), others, metrics)
+        exhaustive_calls = sum(metric.similarity_calls for metric in metrics)
+        cascaded = metric_calculator.get_most_similar(audio.Audio(np.zeros(10), 10), others, metrics, cascade=True)
+
+        self.assertEqual(exhaustive_calls, 12)
+        self.assertEqual(exhaustive, cascaded)
+        # the first audio leads after the first metric, and its whole similarity already rules out the others, which are never scored again
+        self.assertEqual(sum(metric.similarity_calls for metric in metrics) - exhaustive_calls, 4 + 2)
+
+    def test_cascade_keeps_ties(self):
+        metrics = [CountingLevelCalculator(1.0, cost=2), CountingLevelCalculator(1.0, cost=1)]
+        others = [audio.Audio(np.full(10, level), 10, name=str(i)) for i, level in enumerate([1.0, 0.5, -0.5])]
+
+        similarity, most_similar = metric_calculator.get_most_similar(audio.Audio(np.zeros(10), 10), others, metrics, cascade=True)
+        # tied with the last audio, but the first one in the list wins, as without cascading
+        self.assertEqual(most_similar.name, "1")
+        self.assertEqual(similarity, np.exp(-0.5))
@@ -2,6 +2,7 @@ import classifier.metrics.offsets as offsets
 import numpy as np
 import unittest
 import classifier.util as util
+from test.classifier.metrics.test_metric_calculator import performance
 
 class OffsetsTestCase(unittest.TestCase):
     def test_best_nearest_onset(self):
@@ -19,6 +20,21 @@ class OffsetsTestCase(unittest.TestCase):
         # have to account for granularity of windows
         self.assertAlmostEqual(onset_distance, actual_beat_time - off_beat_time, places=2)
 
+    def test_best_nearest_onsets_match_one_at_a_time(self):
+        onset_function = performance(0).get_onset_function()
+        duration = onset_function.windows_to_time(len(onset_function.data))
+        # including beats right at the start, whose windows go negative, and past the end, whose windows are clamped
+        expected_beat_times = np.concatenate(([0, 0.05], np.linspace(0.3, duration - 0.3, 40), [duration - 0.05, duration + 0.2]))
+
+        distances, strengths = offsets.OffsetsCalculator.get_best_nearest_onsets(onset_function, expected_beat_times, 0.1)
+        for i, expected_beat_time in enumerate(expected_beat_times):
+            distance, strength = offsets.OffsetsCalculator.get_best_nearest_onset(onset_function, expected_beat_time, 0.1)
+            self.assertEqual(distances[i], distance)
+            self.assertEqual(strengths[i], strength)
+
+        distances, strengths = offsets.OffsetsCalculator.get_best_nearest_onsets(onset_function, np.zeros(0), 0.1)
+        self.assertEqual((len(distances), len(strengths)), (0, 0))
+
     def test_divergence(self):
 
         mean1 = 2
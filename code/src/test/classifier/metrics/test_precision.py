@@ -0,0 +1,64 @@
+import classifier.metrics.chroma as chroma
+import classifier.metrics.dynamics as dynamics
+import classifier.metrics.offsets as offsets
+import classifier.metrics.tempo as tempo
+import classifier.metrics.timbre as timbre
+import numpy as np
+import unittest
+from test.classifier.metrics.test_metric_calculator import performance
+
+
+class PrecisionTestCase(unittest.TestCase):
+    def setUp(self):
+        self.metrics = [
+            chroma.ChromaCalculator(),
+            dynamics.DynamicsCalculator(),
+            dynamics.DynamicsCalculator(loudness="filter"),
+            offsets.OffsetsCalculator(),
+            tempo.TempoCalculator(),
+            timbre.TimbreCalculator(),
+        ]
+        self.double_audios = [performance(seed).astype(np.float64) for seed in range(3)]
+        self.single_audios = [performance(seed).astype(np.float32) for seed in range(3)]
+
+    def test_dtype(self):
+        self.assertEqual(self.double_audios[0].get_dtype(), np.float64)
+        self.assertEqual(self.single_audios[0].get_dtype(), np.float32)
+        # integer signals are processed in double precision
+        self.assertEqual(performance(0).astype(np.int16).get_dtype(), np.float64)
+
+    def test_single_precision_throughout(self):
+        audio = self.single_audios[0]
+
+        self.assertEqual(audio.get_spectrogram(0.1, 0.025).dtype, np.float32)
+        self.assertEqual(audio.get_spectrogram(0.064, 0.004, window_fn="hann", sample_rate=4000).dtype, np.float32)
+        self.assertEqual(audio.get_onset_function().data.dtype, np.float32)
+
+        for metric in [chroma.ChromaCalculator(), dynamics.DynamicsCalculator(), dynamics.DynamicsCalculator(loudness="filter"), timbre.TimbreCalculator()]:
+            self.assertEqual(metric.calculate_metric(audio).dtype, np.float32, msg=metric)
+
+    def test_beats_match(self):
+        for double_audio, single_audio in zip(self.double_audios, self.single_audios):
+            self.assertEqual(double_audio.get_global_tempo(), single_audio.get_global_tempo())
+            np.testing.assert_array_equal(double_audio.get_beat_times(), single_audio.get_beat_times())
+
+    def test_similarity_drift(self):
+        for metric in self.metrics:
+            double_values = [metric.calculate_metric(audio) for audio in self.double_audios]
+            single_values = [metric.calculate_metric(audio) for audio in self.single_audios]
+
+            for i in range(len(self.double_audios)):
+                for j in range(len(self.double_audios)):
+                    if i == j:
+                        continue
+                    double_similarity = metric.calculate_similarity(self.double_audios[i], self.double_audios[j], double_values[i], double_values[j])
+                    single_similarity = metric.calculate_similarity(self.single_audios[i], self.single_audios[j], single_values[i], single_values[j])
+                    self.assertAlmostEqual(single_similarity, double_similarity, delta=1e-5, msg=metric)
+
+    def test_astype_fingerprint(self):
+        audio = performance(0)
+        audio.fingerprint = "abc"
+
+        self.assertEqual(audio.astype(np.float32).fingerprint, "abc/float32")
+        self.assertNotEqual(audio.astype(np.float32).fingerprint, audio.astype(np.float64).fingerprint)
+        self.assertIsNone(performance(0).astype(np.float32).fingerprint)
@@ -2,6 +2,7 @@ import classifier.metrics.tempo as tempo
 import numpy as np
 import unittest
 import classifier.util as util
+import classifier.audio as audio
 
 class OnsetFunctionTestCase(unittest.TestCase):
     def setUp(self):
@@ -25,6 +26,22 @@ class OnsetFunctionTestCase(unittest.TestCase):
         index_wanted = 2
         self.assertEqual(self.onset_func.index_window(index_wanted), self.data[index_wanted])
 
+    def test_array_lookups_match_scalar_lookups(self):
+        windows = np.array([-2, 0, 1, 2, 4, 7])
+        times = np.array([0, 4.9, 5, 12.5, 19.99, 100])
+        np.testing.assert_array_equal(self.onset_func.index_window(windows), [self.onset_func.index_window(w) for w in windows])
+        np.testing.assert_array_equal(self.onset_func.index_time(times), [self.onset_func.index_time(t) for t in times])
+        np.testing.assert_array_equal(self.onset_func.index_samples(times * self.sample_rate), [self.onset_func.index_samples(s) for s in times * self.sample_rate])
+        np.testing.assert_array_equal(self.onset_func.time_to_windows(times), [self.onset_func.time_to_windows(t) for t in times])
+
+    def test_interpolation(self):
+        self.assertEqual(self.onset_func.index_time(7.5, interpolate=True), 25.5)
+        np.testing.assert_array_equal(self.onset_func.index_window(np.array([-1, 0.5, 3.25, 10]), interpolate=True), [0, 0.5, 2.25, 3])
+
+    def test_peaks(self):
+        np.testing.assert_array_equal(self.onset_func.get_peaks(), [2])
+        self.assertFalse(hasattr(self.onset_func, "__dict__"))
+
 
 
 class TempoTestCase(unittest.TestCase):
@@ -34,3 +51,73 @@ class TempoTestCase(unittest.TestCase):
     def test_global_tempo(self):
         estimated_tempo = tempo.TempoCalculator.calculate_global_tempo(self.audio)
         self.assertEqual(estimated_tempo, 120)
+
+
+def click_track(tempo, duration, sample_rate=8000):
+    """
+    Makes a signal of short decaying clicks at a regular tempo, with a little noise so that it is never silent
+    """
+    signal = np.random.default_rng(0).normal(0, 0.01, int(duration * sample_rate))
+    click = np.sin(2 * np.pi * 1000 * np.arange(400) / sample_rate) * np.exp(-np.arange(400) / 50)
+    for beat_time in np.arange(0.25, duration - 0.1, 60 / tempo):
+        start = int(beat_time * sample_rate)
+        signal[start:start + len(click)] += click
+    return audio.Audio(signal, sample_rate)
+
+
+class BeatTrackingTestCase(unittest.TestCase):
+    def setUp(self):
+        self.audio = click_track(100, 10)
+
+    def test_beats_match_reference(self):
+        # straightforward implementation of the dynamic programming, one predecessor at a time
+        advance = 0.004
+        onset_function = self.audio.get_onset_function()
+        ideal_spacing = 60 / self.audio.get_global_tempo()
+        ideal_spacing_windows = int(ideal_spacing / advance)
+        num_windows = int(self.audio.get_duration() / advance)
+        score_array = np.zeros(num_windows)
+        backtrace_array = np.zeros(num_windows, dtype=int)
+        for window in range(1, num_windows):
+            best_score, best_tau = -np.inf, -1
+            for potential_beat in range(int(max(0, window - ideal_spacing_windows * 2)), int(max(0, window - ideal_spacing_windows / 2))):
+                score = score_array[potential_beat] + 200 * tempo.TempoCalculator.beat_consistency(window * advance, potential_beat * advance, ideal_spacing)
+                if score > best_score:
+                    best_score, best_tau = score, potential_beat
+            score_array[window] = best_score + onset_function.index_time(window * advance)
+            backtrace_array[window] = best_tau
+
+        beats = [np.argmax(score_array)]
+        while beats[-1] != 0:
+            beats.append(backtrace_array[beats[-1]])
+
+        np.testing.assert_array_almost_equal(tempo.TempoCalculator.calculate_beats(self.audio), np.array(beats[::-1]) * advance)
+
+    def test_beat_spacing(self):
+        beat_times = tempo.TempoCalculator.calculate_beats(self.audio)
+        self.assertAlmostEqual(np.median(np.diff(beat_times)), 0.6, places=1)
+
+
+
+class TempoCandidatesTestCase(unittest.TestCase):
+    def test_matches_direct_autocorrelation(self):
+        onsets = np.random.default_rng(1).random(2000)
+        window_advance = 0.004
+        candidates = tempo.TempoCalculator.estimate_tempo_candidates(onsets, window_advance, num_candidates=3)
+
+        auto_correlation = np.correlate(onsets, onsets, mode='full')[len(onsets)-1:]
+        for candidate_tempo, score in candidates:
+            lag = int(round(60 / (candidate_tempo * window_advance)))
+            weighting = np.exp(-0.5 * (np.log2((lag + 1) * window_advance / 0.5) / 0.9) ** 2)
+            self.assertAlmostEqual(score, auto_correlation[lag] * weighting)
+
+        self.assertEqual(len(candidates), 3)
+        scores = [score for _, score in candidates]
+        self.assertEqual(scores, sorted(scores, reverse=True))
+
+    def test_tempo_range(self):
+        candidates = tempo.TempoCalculator.calculate_tempo_candidates(click_track(100, 10), min_tempo=60, max_tempo=180)
+
+        self.assertAlmostEqual(candidates[0][0], 100, delta=2)
+        for candidate_tempo, _ in candidates:
+            self.assertTrue(60 <= candidate_tempo <= 180)
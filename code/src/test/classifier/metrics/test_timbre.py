@@ -1,5 +1,7 @@
 import classifier.metrics.timbre as timbre
 import classifier.util as util
+import classifier.audio as audio
+import scipy.fft
 import numpy as np
 import unittest
 import matplotlib.pyplot as plt
@@ -36,6 +38,19 @@ class TimbreTestCase(unittest.TestCase):
         mel_energies = timbre.TimbreCalculator.spectrum_to_mel_bands(spectrum, sample_rate_hz, num_filters=5)
         np.testing.assert_almost_equal(mel_energies, [3,5,7,10,15])
 
+    def test_spectrogram_to_mel_bands(self):
+        spectrogram = np.random.default_rng(0).random((4, 100))
+        sample_rate = 8000
+        mel_spectrogram = timbre.TimbreCalculator.spectrogram_to_mel_bands(spectrogram, sample_rate, num_filters=10)
+
+        self.assertEqual(mel_spectrogram.shape, (4, 10))
+        for spectrum, mel_energies in zip(spectrogram, mel_spectrogram):
+            np.testing.assert_almost_equal(mel_energies, timbre.TimbreCalculator.spectrum_to_mel_bands(spectrum, sample_rate, num_filters=10))
+
+    def test_mel_filter_bank_cached(self):
+        filter_bank = timbre.TimbreCalculator.get_mel_filter_bank(100, 8000, num_filters=10)
+        self.assertIs(timbre.TimbreCalculator.get_mel_filter_bank(100, 8000, num_filters=10), filter_bank)
+
     def test_normalise_spectrum_up(self):
         audio = util.read_audio("../res/test_data/A.wav")
         pitch = 440
@@ -47,11 +62,28 @@ class TimbreTestCase(unittest.TestCase):
         shifted_spectrum = timbre_calculator.normalise_spectrum(spectrum, freqs)
         self.assertAlmostEqual(freqs[np.argmax(shifted_spectrum)], target_pitch)
 
+    def test_batched_mfccs(self):
+        sample_rate = 8000
+        times = np.arange(800) / sample_rate
+        signals = np.array([np.sin(2 * np.pi * frequency * times) + 0.5 * np.sin(4 * np.pi * frequency * times) for frequency in [220, 300, 523, 1000]])
+        timbre_calculator = timbre.TimbreCalculator()
 
+        batched_mfccs = timbre_calculator.calculate_batched_mfccs(signals, sample_rate)
 
+        for signal, mfccs in zip(signals, batched_mfccs):
+            # calculated the way calculate_mfccs has always done it
+            spectrum = np.abs(np.fft.rfft(signal))
+            shifted_spectrum = timbre_calculator.normalise_spectrum(spectrum, np.fft.rfftfreq(len(signal), d=1/sample_rate))
+            filter_bank_energies = timbre.TimbreCalculator.spectrum_to_mel_bands(1/len(signal) * shifted_spectrum ** 2, sample_rate)
+            np.testing.assert_allclose(mfccs, scipy.fft.dct(filter_bank_energies), rtol=1e-9, atol=1e-6)
 
+    def test_metric_pads_last_window(self):
+        sample_rate = 8000
+        signal_audio = audio.Audio(np.sin(np.arange(sample_rate)), sample_rate)
+        signal_audio.beat_times = np.array([0.1, 0.5, 0.9])
 
+        timbre_array = timbre.TimbreCalculator().calculate_metric(signal_audio)
 
-
-
+        self.assertEqual(timbre_array.shape, (3, 40))
+        self.assertTrue(np.all(np.isfinite(timbre_array)))
 
@@ -24,3 +24,73 @@ class AudioTestCase(unittest.TestCase):
     def test_to_samples(self):
         self.assertEqual(self.audio.to_samples(1.0), self.sample_rate)
 
+
+class FramesTestCase(unittest.TestCase):
+    def setUp(self):
+        self.signal = np.arange(2000.0)
+        self.audio = audio.Audio(self.signal, 1000)
+
+    def get_sliced_frames(self, window_size, hop):
+        num_frames = int((self.audio.get_duration() - window_size) / hop)
+        starts = (np.arange(num_frames) * hop * 1000).astype(int)
+        return np.array([self.signal[start:start + int(round(window_size * 1000))] for start in starts])
+
+    def test_whole_sample_hop_is_a_view(self):
+        frames = self.audio.get_frames(0.1, 0.025)
+
+        np.testing.assert_array_equal(frames, self.get_sliced_frames(0.1, 0.025))
+        self.assertTrue(np.shares_memory(frames, self.signal))
+
+    def test_fractional_hop(self):
+        frames = self.audio.get_frames(0.1, 0.0125)
+
+        np.testing.assert_array_equal(frames, self.get_sliced_frames(0.1, 0.0125))
+
+
+class SpectrogramTestCase(unittest.TestCase):
+    def setUp(self):
+        self.sample_rate = 1000
+        self.signal = np.sin(np.arange(2000) * 0.3)
+        self.audio = audio.Audio(self.signal, self.sample_rate)
+
+    def test_matches_per_frame_rfft(self):
+        window_size = 0.1
+        hop = 0.025
+        spectrogram = self.audio.get_spectrogram(window_size, hop)
+
+        self.assertEqual(len(spectrogram), int((self.audio.get_duration() - window_size) / hop))
+        for window in [0, 1, 50]:
+            start = int(window * hop * self.sample_rate)
+            frame = self.signal[start:start + int(window_size * self.sample_rate)]
+            np.testing.assert_array_almost_equal(spectrogram[window], np.abs(np.fft.rfft(frame)))
+
+    def test_spectrogram_is_cached(self):
+        spectrogram = self.audio.get_spectrogram(0.1, 0.025, window_fn="hann")
+        self.assertIs(self.audio.get_spectrogram(0.1, 0.025, window_fn="hann"), spectrogram)
+        self.assertIsNot(self.audio.get_spectrogram(0.1, 0.025), spectrogram)
+
+
+class ResampleTestCase(unittest.TestCase):
+    def setUp(self):
+        self.audio = audio.Audio(np.sin(np.arange(44100) * 0.01), 44100)
+
+    def test_length(self):
+        resampled = self.audio.resample(8000)
+
+        self.assertEqual(resampled.sample_rate, 8000)
+        self.assertEqual(len(resampled.signal), int(44100 * 8000 / 44100))
+
+    def test_resample_is_cached(self):
+        resampled = self.audio.resample(8000)
+
+        self.assertIs(self.audio.resample(8000), resampled)
+        self.assertIsNot(self.audio.resample(16000), resampled)
+
+    def test_keeps_precision(self):
+        self.assertEqual(self.audio.astype(np.float32).resample(8000).signal.dtype, np.float32)
+
+    def test_same_sample_rate(self):
+        resampled = self.audio.resample(44100)
+
+        self.assertEqual(resampled.sample_rate, 44100)
+        np.testing.assert_array_equal(resampled.signal, self.audio.signal)
@@ -0,0 +1,146 @@
+import classifier.daemon as daemon
+import classifier.feature_store as feature_store
+import classifier.identify as identify
+import classifier.metrics.metric_calculator as metric_calculator
+import classifier.metrics.offsets as offsets
+import classifier.metrics.tempo as tempo
+import classifier.metrics.timbre as timbre
+import json
+import numpy as np
+import os.path
+import scipy.io.wavfile
+import socket
+import tempfile
+import threading
+import unittest
+from test.classifier.metrics.test_metric_calculator import performance
+
+
+class IdentificationDaemonTestCase(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.reference_dir = os.path.join(self.directory.name, "references")
+        os.mkdir(self.reference_dir)
+
+        self.metrics = [offsets.OffsetsCalculator(), tempo.TempoCalculator(), timbre.TimbreCalculator()]
+        for seed in range(3):
+            self.write_wav(os.path.join(self.reference_dir, f"performance_{seed}.wav"), performance(seed))
+
+        self.daemon = daemon.IdentificationDaemon(self.reference_dir, metrics=self.metrics)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def write_wav(self, path, audio):
+        scipy.io.wavfile.write(path, audio.sample_rate, np.clip(audio.signal, -32768, 32767).astype(np.int16))
+        return path
+
+    def test_identifies_same_recording(self):
+        unknown_path = self.write_wav(os.path.join(self.directory.name, "unknown.wav"), performance(1))
+        result = self.daemon.identify(unknown_path, top=3)
+
+        self.assertEqual(result["match"], "performance_1.wav")
+        self.assertAlmostEqual(result["similarity"], 1.0, places=6)
+        self.assertEqual(set(result["scores"]), {"Offsets", "Tempo", "Timbre"})
+        self.assertEqual([entry["reference"] for entry in result["ranking"]][0], "performance_1.wav")
+        self.assertEqual(len(result["ranking"]), 3)
+        self.assertEqual(set(result["timings"]["metrics"]), {"Offsets", "Tempo", "Timbre"})
+
+    def test_matches_get_most_similar(self):
+        unknown_path = self.write_wav(os.path.join(self.directory.name, "unknown.wav"), performance(7))
+        result = self.daemon.identify(unknown_path, metrics=["Tempo", "Timbre"])
+
+        reference_paths = [os.path.join(self.reference_dir, name) for name in self.daemon.names]
+        similarity, match = metric_calculator.get_most_similar(unknown_path, reference_paths, self.metrics[1:])
+        self.assertEqual(result["match"], os.path.basename(match))
+        self.assertAlmostEqual(result["similarity"], similarity)
+        self.assertEqual(set(result["scores"]), {"Tempo", "Timbre"})
+
+    def test_bad_requests_return_errors(self):
+        result = self.daemon.handle({"path": os.path.join(self.directory.name, "missing.wav")})
+        self.assertIn("error", result)
+
+        result = self.daemon.handle({"path": os.path.join(self.reference_dir, "performance_0.wav"), "metrics": ["Loudness"]})
+        self.assertIn("error", result)
+
+        # valid JSON that isn't an object still gets an answer
+        for request in [[], "unknown.wav", 3, None]:
+            self.assertIn("error", self.daemon.handle(request))
+
+    def test_socket_streams_results(self):
+        socket_path = os.path.join(self.directory.name, "classifier.sock")
+        server = self.daemon.create_server(socket_path)
+        thread = threading.Thread(target=server.serve_forever)
+        thread.start()
+        try:
+            paths = [
+                os.path.join(self.reference_dir, "performance_2.wav"),
+                os.path.join(self.directory.name, "missing.wav"),
+                os.path.join(self.reference_dir, "performance_0.wav"),
+            ]
+            results = list(identify.submit(paths, socket_path=socket_path, metrics=["Offsets"]))
+        finally:
+            server.shutdown()
+            server.server_close()
+            thread.join()
+
+        self.assertEqual([result["path"] for result in results], paths)
+        self.assertEqual(results[0]["match"], "performance_2.wav")
+        self.assertIn("error", results[1])
+        self.assertEqual(results[2]["match"], "performance_0.wav")
+        self.assertEqual(set(results[2]["scores"]), {"Offsets"})
+
+    def test_socket_answers_malformed_lines(self):
+        socket_path = os.path.join(self.directory.name, "classifier.sock")
+        server = self.daemon.create_server(socket_path)
+        thread = threading.Thread(target=server.serve_forever)
+        thread.start()
+        try:
+            with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as connection, connection.makefile("rb") as lines:
+                connection.connect(socket_path)
+                answers = []
+                # invalid UTF-8, invalid JSON, then a good request down the same connection
+                for request in [b"\xff\xfe\n", b"{\n", (json.dumps({"path": os.path.join(self.reference_dir, "performance_1.wav")}) + "\n").encode()]:
+                    connection.sendall(request)
+                    answers.append(json.loads(lines.readline()))
+        finally:
+            server.shutdown()
+            server.server_close()
+            thread.join()
+
+        self.assertTrue(answers[0]["error"].startswith("Malformed request"))
+        self.assertTrue(answers[1]["error"].startswith("Malformed request"))
+        self.assertEqual(answers[2]["match"], "performance_1.wav")
+
+    def test_create_server_only_replaces_stale_sockets(self):
+        socket_path = os.path.join(self.directory.name, "classifier.sock")
+
+        # a socket left behind by a daemon that didn't shut down cleanly
+        stale = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        stale.bind(socket_path)
+        stale.close()
+        server = self.daemon.create_server(socket_path)
+        try:
+            # while it is listening, another daemon can't take over its socket
+            with self.assertRaises(RuntimeError):
+                self.daemon.create_server(socket_path)
+        finally:
+            server.server_close()
+        os.remove(socket_path)
+
+        with open(socket_path, "w") as f:
+            f.write("not a socket")
+        with self.assertRaises(FileExistsError):
+            self.daemon.create_server(socket_path)
+        with open(socket_path) as f:
+            self.assertEqual(f.read(), "not a socket")
+
+    def test_unknown_metrics_not_persisted(self):
+        with tempfile.TemporaryDirectory() as features_dir:
+            store = feature_store.FeatureStore(features_dir)
+            stored_daemon = daemon.IdentificationDaemon(self.reference_dir, metrics=self.metrics, feature_store=store)
+            num_entries = len(store.index)
+
+            unknown_path = self.write_wav(os.path.join(self.directory.name, "unknown.wav"), performance(7))
+            stored_daemon.identify(unknown_path)
+            self.assertEqual(len(store.index), num_entries)
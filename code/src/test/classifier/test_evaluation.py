@@ -0,0 +1,37 @@
+import classifier.transformations.transform_graph as transform_graph
+import test.classifier.transformations.test_transform_graph as test_transform_graph
+import numpy as np
+import os.path
+import scipy.io.wavfile
+import tempfile
+import unittest
+
+
+class GetFilesTestCase(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        for performer in [1, 2]:
+            scipy.io.wavfile.write(os.path.join(self.directory.name, f"participant_{performer}_piece_1.wav"), 8000, np.arange(100, dtype=np.int16) * performer)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_graph_results_cached(self):
+        # importing evaluation reads the noise and impulse response its TRANSFORMS use, so it is only imported by the tests that need it
+        import classifier.evaluation as evaluation
+
+        double = test_transform_graph.Gain(2)
+        triple = test_transform_graph.Gain(3)
+        graph = transform_graph.TransformGraph([(double,), (double, triple)])
+
+        first = evaluation.get_files(self.directory.name, transforms=[double, triple], graph=graph)
+        second = evaluation.get_files(self.directory.name, transforms=[double, triple], graph=graph)
+
+        # the second call gets the same Audio objects, along with anything they have cached, without transforming anything again
+        self.assertEqual(double.applications, 2)
+        self.assertEqual(triple.applications, 2)
+        for performer in [1, 2]:
+            self.assertIs(first["piece"][performer][1].audio, second["piece"][performer][1].audio)
+
+        evaluation.release_files([double, triple])
+        self.assertNotIn((os.path.join(self.directory.name, "participant_1_piece_1.wav"), (double, triple)), evaluation.AUDIO_CACHE)
@@ -0,0 +1,113 @@
+import classifier.feature_store as feature_store
+import classifier.metrics.metric as metric
+import classifier.metrics.metric_calculator as metric_calculator
+import classifier.audio as audio
+import numpy as np
+import os.path
+import tempfile
+import unittest
+
+
+class CountingCalculator(metric.MetricCalculator):
+    def __init__(self):
+        self.calls = 0
+
+    def calculate_metric(self, audio):
+        self.calls += 1
+        return (np.cumsum(audio.signal), 2.5)
+
+    def __repr__(self):
+        return "Counting"
+
+
+class FeatureStoreTestCase(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.store = feature_store.FeatureStore(self.directory.name)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_round_trip(self):
+        value = (np.arange(5.0), 3.0, np.ones((2, 3)))
+        self.store.save("abc", "Feature", 1, value, {"window_size": 0.1})
+        loaded = self.store.load("abc", "Feature", 1, {"window_size": 0.1})
+
+        np.testing.assert_array_equal(loaded[0], value[0])
+        self.assertEqual(loaded[1], 3.0)
+        np.testing.assert_array_equal(loaded[2], value[2])
+
+    def test_key_includes_version_and_parameters(self):
+        self.store.save("abc", "Feature", 1, np.arange(3), {"window_size": 0.1})
+
+        self.assertIsNone(self.store.load("abc", "Feature", 2, {"window_size": 0.1}))
+        self.assertIsNone(self.store.load("abc", "Feature", 1, {"window_size": 0.2}))
+        self.assertIsNone(self.store.load("def", "Feature", 1, {"window_size": 0.1}))
+
+    def test_persists_between_instances(self):
+        self.store.save("abc", "Feature", 1, 7.0)
+        self.assertEqual(feature_store.FeatureStore(self.directory.name).load("abc", "Feature", 1), 7.0)
+
+    def test_saves_append_to_journal(self):
+        for i in range(5):
+            self.store.save("abc", "Feature", i, float(i))
+
+        # saving doesn't rewrite the index, so filling the store costs a line per feature
+        self.assertFalse(os.path.isfile(self.store.index_path))
+        with open(self.store.journal_path) as f:
+            self.assertEqual(len(f.readlines()), 5)
+
+        # a process killed mid save leaves a half written line, which is skipped
+        with open(self.store.journal_path, "a") as f:
+            f.write('["def", {"fingerprint"')
+
+        reopened = feature_store.FeatureStore(self.directory.name)
+        self.assertEqual([reopened.load("abc", "Feature", i) for i in range(5)], [float(i) for i in range(5)])
+        self.assertEqual(len(reopened.index), 5)
+        # opening the store folds the journal into the index
+        self.assertTrue(os.path.isfile(reopened.index_path))
+        self.assertFalse(os.path.isfile(reopened.journal_path))
+
+    def test_saves_atomically(self):
+        self.store.save("abc", "Feature", 1, (np.arange(3), 1.0))
+        # nothing but the feature and the journal is left behind
+        self.assertEqual(sorted(os.listdir(self.directory.name)), sorted([f"{self.store.get_key('abc', 'Feature', 1)}.npz", "journal.jsonl"]))
+
+    def test_corrupt_files_are_dropped(self):
+        for i, contents in enumerate([b"", b"not a zip file", b"PK\x03\x04truncated"]):
+            self.store.save("abc", "Feature", i, np.arange(3))
+            path = self.store.get_path(self.store.get_key("abc", "Feature", i))
+            with open(path, "wb") as f:
+                f.write(contents)
+
+            self.assertIsNone(self.store.load("abc", "Feature", i))
+            self.assertFalse(self.store.contains("abc", "Feature", i))
+            self.assertFalse(os.path.isfile(path))
+
+            # it can then be saved again as if it had never been stored
+            self.store.save("abc", "Feature", i, np.arange(3))
+            np.testing.assert_array_equal(self.store.load("abc", "Feature", i), np.arange(3))
+
+    def test_prune(self):
+        self.store.save("abc", "Feature", 1, 1.0)
+        self.store.save("abc", "Feature", 2, 2.0)
+        self.store.save("abc", "Other", 1, 3.0)
+
+        self.assertEqual(self.store.prune({"Feature": 2}), 1)
+        self.assertIsNone(self.store.load("abc", "Feature", 1))
+        self.assertEqual(self.store.load("abc", "Feature", 2), 2.0)
+        self.assertEqual(self.store.load("abc", "Other", 1), 3.0)
+
+        # pruned features don't come back from the journal
+        self.assertIsNone(feature_store.FeatureStore(self.directory.name).load("abc", "Feature", 1))
+
+    def test_calculate_metrics_uses_store(self):
+        calculator = CountingCalculator()
+        signal = np.arange(10.0)
+
+        first = metric_calculator.calculate_metrics(audio.Audio(signal, 10, fingerprint="abc"), [calculator], feature_store=self.store)
+        second = metric_calculator.calculate_metrics(audio.Audio(signal, 10, fingerprint="abc"), [calculator], feature_store=self.store)
+
+        self.assertEqual(calculator.calls, 1)
+        np.testing.assert_array_equal(first[calculator][0], second[calculator][0])
+        self.assertEqual(first[calculator][1], second[calculator][1])
@@ -0,0 +1,130 @@
+import benchmark.signals as signals
+import classifier.audio as audio
+import classifier.identification_session as identification_session
+import classifier.metrics.chroma as chroma
+import classifier.metrics.dynamics as dynamics
+import classifier.metrics.metric_calculator as metric_calculator
+import classifier.metrics.offsets as offsets
+import classifier.metrics.tempo as tempo
+import classifier.metrics.timbre as timbre
+import classifier.streaming as streaming
+import test.classifier.metrics.test_metric_calculator as test_metric_calculator
+import numpy as np
+import unittest
+
+
+def blocks(signal, block_size):
+    return (signal[start:start + block_size] for start in range(0, len(signal), block_size))
+
+
+class IdentificationSessionTestCase(unittest.TestCase):
+    def setUp(self):
+        self.metrics = [
+            chroma.ChromaCalculator(),
+            dynamics.DynamicsCalculator(),
+            offsets.OffsetsCalculator(),
+            tempo.TempoCalculator(),
+            timbre.TimbreCalculator(),
+        ]
+        self.references = [signals.piano(40, sample_rate=8000, bpm=bpm, seed=seed) for seed, bpm in enumerate([96, 112, 128])]
+
+    def test_stops_early(self):
+        # the second reference, with a little noise on top
+        unknown = self.references[1].signal + np.random.default_rng(0).normal(0, 0.01, len(self.references[1].signal)).astype(np.float32)
+        session = identification_session.identify_incrementally(blocks(unknown, 800), self.references, 8000, metrics=self.metrics,
+                update_interval=5, min_duration=10, threshold=0.03, confirmations=2)
+
+        self.assertTrue(session.stopped)
+        self.assertIs(session.get_best()[1], self.references[1])
+        # the first update is after 10s, and it needs two in a row
+        self.assertEqual(session.get_duration(), 15)
+        self.assertGreaterEqual(session.get_margin(), 0.03)
+        self.assertEqual([i for _, i in session.ranking][0], 1)
+
+    def test_ranking_matches_get_most_similar(self):
+        unknown = signals.piano(12, sample_rate=8000, bpm=110, seed=7)
+        session = identification_session.IdentificationSession(self.references, 8000, metrics=self.metrics, update_interval=5, min_duration=5,
+                threshold=np.inf)
+        for block in blocks(unknown.signal, 1000):
+            self.assertFalse(session.add(block))
+        self.assertEqual(session.get_duration(), 12)
+
+        # the last update was after 10s, finishing updates with all 12s, compared with the first 12s of each reference
+        similarity, best = session.finish()
+        self.assertFalse(session.stopped)
+        self.assertEqual(session.unknown_audio.get_duration(), 12)
+        prefixes = [reference.get_prefix(8000 * 12) for reference in self.references]
+        expected_similarity, expected_best = metric_calculator.get_most_similar(session.unknown_audio, prefixes, self.metrics)
+        self.assertEqual(similarity, expected_similarity)
+        self.assertIs(best, self.references[prefixes.index(expected_best)])
+        self.assertEqual(sorted(similarity for similarity, _ in session.ranking)[::-1], [similarity for similarity, _ in session.ranking])
+
+    def test_threshold_and_labels(self):
+        unknown = self.references[0].signal
+        # two references by the same performer as the unknown, which shouldn't count against each other
+        references = self.references + [self.references[0]]
+        labels = ["a", "b", "c", "a"]
+        session = identification_session.IdentificationSession(references, 8000, metrics=self.metrics, labels=labels, update_interval=5,
+                min_duration=10, threshold=0.02, confirmations=1)
+        for block in blocks(unknown[:8000 * 10], 800):
+            session.add(block)
+
+        self.assertTrue(session.stopped)
+        self.assertEqual(session.ranking[0][0], session.ranking[1][0])
+        self.assertGreater(session.get_margin(), 0)
+        # any more audio is ignored once it has stopped
+        self.assertTrue(session.add(unknown[8000 * 10:8000 * 11]))
+        self.assertEqual(session.get_duration(), 10)
+
+        strict = identification_session.IdentificationSession(references, 8000, metrics=self.metrics, update_interval=5, min_duration=10,
+                threshold=0.02, confirmations=1)
+        for block in blocks(unknown[:8000 * 10], 800):
+            strict.add(block)
+        # without labels, the two copies of the same performance are tied
+        self.assertEqual(strict.get_margin(), 0)
+        self.assertFalse(strict.stopped)
+
+    def test_no_updates(self):
+        session = identification_session.IdentificationSession(self.references, 8000, metrics=self.metrics)
+        self.assertIsNone(session.get_best())
+        self.assertIsNone(session.finish())
+
+    def test_whole_references(self):
+        # once the unknown performance is as long as a reference, it is compared with the whole reference, as get_most_similar would
+        unknown = signals.piano(40, sample_rate=8000, bpm=110, seed=7)
+        session = identification_session.IdentificationSession(self.references, 8000, metrics=self.metrics, min_duration=40, threshold=np.inf)
+        for block in blocks(unknown.signal, 4000):
+            session.add(block)
+        self.assertIs(session.get_reference_prefix(self.references[0], 8000 * 40), self.references[0])
+        self.assertEqual(session.finish(), metric_calculator.get_most_similar(session.unknown_audio, self.references, self.metrics))
+
+    def test_beats_are_tracked_as_audio_arrives(self):
+        unknown = signals.piano(30, sample_rate=8000, bpm=110, seed=7)
+        session = identification_session.IdentificationSession(self.references, 8000, metrics=self.metrics, update_interval=5, min_duration=10,
+                threshold=np.inf)
+        for block in blocks(unknown.signal, 800):
+            session.add(block)
+        session.finish()
+
+        # the unknown performance's beats are the streamed ones, not tracked again from scratch at each update
+        beats = np.concatenate([new_beats for new_beats, _ in streaming.stream_beats(blocks(unknown.signal, 800), 8000)])
+        np.testing.assert_array_equal(session.unknown_audio.get_beat_times(), beats[beats < 30])
+        self.assertEqual(session.unknown_audio.get_global_tempo(), session.tracker.tempo)
+
+    def test_reference_starts_are_cached(self):
+        counting = test_metric_calculator.CountingLevelCalculator(1, 1)
+        unknown = signals.piano(20, sample_rate=8000, bpm=110, seed=7)
+
+        for block_size in [800, 1100]:
+            session = identification_session.IdentificationSession(self.references, 8000, metrics=[counting], update_interval=5, min_duration=10,
+                    threshold=np.inf)
+            for block in blocks(unknown.signal, block_size):
+                session.add(block)
+            session.finish()
+
+        # updates at 10, 15 and 20s whatever the size of the blocks, and again at 20s once the last beats are in, so the second session only
+        # calculates the unknown performance's metrics
+        self.assertEqual(counting.metric_calls, 3 * len(self.references) + 4 + 4)
+        start = self.references[0].get_prefix(8000 * 10)
+        self.assertIs(session.get_reference_prefix(self.references[0], 8000 * 10), start)
+        self.assertTrue(np.all(start.get_beat_times() < 10))
@@ -0,0 +1,54 @@
+import classifier.instrumentation as instrumentation
+import classifier.metrics.metric_calculator as metric_calculator
+import classifier.metrics.offsets as offsets
+import classifier.metrics.tempo as tempo
+import numpy as np
+import unittest
+from test.classifier.metrics.test_metric_calculator import performance
+
+
+class InstrumentationTestCase(unittest.TestCase):
+    def test_nothing_recorded_by_default(self):
+        self.assertIsNone(instrumentation.RECORDER)
+        self.assertIs(instrumentation.stage("read_audio"), instrumentation.NULL_STAGE)
+        instrumentation.count_cache("metric", True)
+
+    def test_nested_stages(self):
+        with instrumentation.record() as recorder:
+            with instrumentation.stage("outer"):
+                with instrumentation.stage("inner"):
+                    data = np.ones(1 << 20)
+                del data
+                with instrumentation.stage("inner"):
+                    pass
+
+        self.assertIsNone(instrumentation.RECORDER)
+        self.assertEqual([(stage["stage"], stage["depth"]) for stage in recorder.stages], [("inner", 1), ("inner", 1), ("outer", 0)])
+
+        # the outer stage's peak includes the inner stage's allocation, even though it was freed before the outer stage ended
+        allocated = 8 << 20
+        self.assertGreaterEqual(recorder.stages[0]["peak_memory"], allocated)
+        self.assertLess(recorder.stages[1]["peak_memory"], allocated)
+        self.assertGreaterEqual(recorder.stages[2]["peak_memory"], allocated)
+        self.assertGreaterEqual(recorder.stages[2]["wall_time"], recorder.stages[0]["wall_time"])
+
+        summary = recorder.summarise()
+        self.assertEqual(summary["inner"]["count"], 2)
+        self.assertEqual(summary["inner"]["peak_memory"], recorder.stages[0]["peak_memory"])
+
+    def test_records_metric_calculation(self):
+        audio = performance(0)
+        metrics = [offsets.OffsetsCalculator(), tempo.TempoCalculator()]
+        with instrumentation.record(memory=False) as recorder:
+            metric_calculator.calculate_metrics(audio, metrics)
+            metric_calculator.calculate_metrics(audio, metrics)
+
+        stages = {stage["stage"] for stage in recorder.stages}
+        self.assertTrue({"beat_tracking", "onset_function", "Offsets.calculate_metric", "Tempo.calculate_metric"} <= stages)
+        self.assertTrue(all(stage["peak_memory"] is None for stage in recorder.stages))
+        # each metric is calculated the first time and cached the second
+        self.assertEqual(recorder.caches["metric"], [2, 2])
+
+        table = recorder.format_summary()
+        self.assertIn("Tempo.calculate_metric", table)
+        self.assertIn("metric", table.split("\n\n")[1])
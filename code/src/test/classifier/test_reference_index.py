@@ -0,0 +1,124 @@
+import classifier.reference_index as reference_index
+import classifier.metrics.metric_calculator as metric_calculator
+import classifier.metrics.chroma as chroma
+import classifier.metrics.dynamics as dynamics
+import classifier.metrics.offsets as offsets
+import classifier.metrics.tempo as tempo
+import classifier.metrics.timbre as timbre
+import numpy as np
+import tempfile
+import unittest
+from test.classifier.metrics.test_metric_calculator import performance
+
+
+class ReferenceIndexTestCase(unittest.TestCase):
+    def setUp(self):
+        self.metrics = [
+            chroma.ChromaCalculator(),
+            dynamics.DynamicsCalculator(),
+            offsets.OffsetsCalculator(),
+            tempo.TempoCalculator(),
+            timbre.TimbreCalculator(),
+        ]
+        self.audios = [performance(seed) for seed in range(5)]
+
+    def test_embeddings_are_fixed_length(self):
+        short_audio = performance(5, duration=4)
+        for metric in self.metrics:
+            embedding = metric.calculate_embedding(metric.calculate_metric(self.audios[0]))
+            self.assertEqual(embedding.ndim, 1)
+            self.assertTrue(np.all(np.isfinite(embedding)), msg=metric)
+            self.assertEqual(len(metric.calculate_embedding(metric.calculate_metric(short_audio))), len(embedding), msg=metric)
+
+    def test_query_finds_itself(self):
+        index = reference_index.ReferenceIndex(self.metrics, capacity=2)
+        for i, audio in enumerate(self.audios):
+            index.add(audio, key=i)
+
+        self.assertEqual(len(index), len(self.audios))
+        for i, audio in enumerate(self.audios):
+            nearest = index.query(audio, k=3)
+            self.assertEqual(len(nearest), 3)
+            self.assertEqual(nearest[0], (0.0, i))
+            self.assertEqual([distance for distance, _ in nearest], sorted(distance for distance, _ in nearest))
+
+    def test_query_matches_brute_force(self):
+        index = reference_index.ReferenceIndex(self.metrics)
+        for i, audio in enumerate(self.audios[1:]):
+            index.add(audio, key=i)
+
+        embeddings = np.array([index.embed(audio) for audio in self.audios[1:]])
+        query = index.embed(self.audios[0])
+        stdev = np.std(embeddings, axis=0)
+        distances = []
+        for embedding in embeddings:
+            distance = 0
+            for metric_slice in index.metric_slices:
+                distance += np.sum(((embedding[metric_slice] - query[metric_slice]) / stdev[metric_slice]) ** 2) / (metric_slice.stop - metric_slice.start)
+            distances.append(np.sqrt(distance))
+
+        nearest = index.query(self.audios[0], k=4)
+        self.assertEqual([key for _, key in nearest], list(np.argsort(distances)))
+        np.testing.assert_allclose([distance for distance, _ in nearest], np.sort(distances))
+
+    def test_save_and_load(self):
+        index = reference_index.ReferenceIndex(self.metrics)
+        for i, audio in enumerate(self.audios[:3]):
+            index.add(audio, key=f"performance {i}")
+
+        with tempfile.TemporaryDirectory() as directory:
+            index.save(directory)
+            loaded = reference_index.ReferenceIndex.load(directory, self.metrics)
+
+            self.assertEqual(loaded.query(self.audios[3], k=3), index.query(self.audios[3], k=3))
+
+            # we can keep adding to a loaded index
+            loaded.add(self.audios[3], key="performance 3")
+            self.assertEqual(loaded.query(self.audios[3])[0], (0.0, "performance 3"))
+
+            with self.assertRaises(ValueError):
+                reference_index.ReferenceIndex.load(directory, [chroma.ChromaCalculator(window_size=0.2)])
+
+    def test_shortlist(self):
+        unknown = performance(0)
+        # all with the same name, so only their positions tell them apart
+        others = [performance(seed) for seed in range(1, 5)]
+        for other in others:
+            other.name = ""
+        index = reference_index.ReferenceIndex(self.metrics)
+        for i, other in enumerate(others):
+            index.add(other, key=i)
+
+        similarity, audio = metric_calculator.get_most_similar(unknown, others, self.metrics)
+        shortlisted_similarity, shortlisted_audio = metric_calculator.get_most_similar(unknown, others, self.metrics, shortlist=4, index=index)
+        self.assertEqual(similarity, shortlisted_similarity)
+        self.assertIs(audio, shortlisted_audio)
+
+        # whatever the shortlist, the answer is one of the other audios, scored exactly
+        shortlisted_similarity, shortlisted_audio = metric_calculator.get_most_similar(unknown, others, self.metrics, shortlist=2, index=index)
+        self.assertIn(shortlisted_audio, [others[key] for _, key in index.query(unknown, 2)])
+        self.assertLessEqual(shortlisted_similarity, similarity)
+
+        # without an index, every metric of every audio would have to be calculated to build one
+        with self.assertRaises(ValueError):
+            metric_calculator.get_most_similar(unknown, others, self.metrics, shortlist=2)
+
+    def test_shortlist_with_index(self):
+        # keyed by position in others below
+        index = reference_index.ReferenceIndex(self.metrics)
+        for i, audio in enumerate(self.audios[1:]):
+            index.add(audio, key=i)
+
+        with tempfile.TemporaryDirectory() as directory:
+            index.save(directory)
+            loaded = reference_index.ReferenceIndex.load(directory, self.metrics)
+
+        # fresh audios, so we can see which of them had their metrics calculated. The last isn't in the index so is always compared
+        unknown = performance(0)
+        others = [performance(seed) for seed in range(1, 6)]
+        similarity, audio = metric_calculator.get_most_similar(unknown, others, self.metrics, shortlist=2, index=loaded)
+
+        shortlisted = sorted(key for _, key in loaded.query(unknown, 2)) + [4]
+        for i, other in enumerate(others):
+            self.assertEqual(other.get_cached_metric(self.metrics[0]) is not None, i in shortlisted, msg=i)
+        self.assertEqual((similarity, audio), metric_calculator.get_most_similar(unknown, [others[i] for i in shortlisted], self.metrics))
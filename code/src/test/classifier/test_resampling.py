@@ -0,0 +1,57 @@
+import classifier.resampling as resampling
+import numpy as np
+import scipy.signal
+import unittest
+
+
+class PolyphaseResamplerTestCase(unittest.TestCase):
+    def setUp(self):
+        self.signal = np.random.default_rng(0).normal(size=20000)
+
+    def test_matches_resample_poly(self):
+        for input_rate, output_rate in [(44100, 8000), (8000, 44100), (48000, 8000), (22050, 16000), (3, 2)]:
+            expected = scipy.signal.resample_poly(self.signal, output_rate, input_rate)
+            resampled = resampling.resample(self.signal, input_rate, output_rate, block_size=1000)
+
+            self.assertEqual(len(resampled), len(expected))
+            np.testing.assert_allclose(resampled, expected, atol=1e-12)
+
+    def test_block_size_does_not_matter(self):
+        signal = self.signal[:3000]
+        expected = resampling.resample(signal, 44100, 8000)
+
+        for block_size in [1, 7, 441, 5000]:
+            np.testing.assert_allclose(resampling.resample(signal, 44100, 8000, block_size=block_size), expected, atol=1e-12)
+
+    def test_streaming(self):
+        resampler = resampling.PolyphaseResampler(44100, 8000)
+        outputs = []
+        for start in range(0, len(self.signal), 3000):
+            output = resampler.process(self.signal[start:start + 3000])
+            # outputs only lag the input by about half the filter
+            self.assertGreater(resampler.num_outputs, resampler.num_inputs * 8000 / 44100 - resampler.num_taps)
+            outputs.append(output)
+        outputs.append(resampler.flush())
+
+        np.testing.assert_allclose(np.concatenate(outputs), scipy.signal.resample_poly(self.signal, 80, 441), atol=1e-12)
+
+    def test_anti_aliasing(self):
+        # a tone above the new nyquist frequency should be filtered out rather than folded back down
+        sample_rate = 44100
+        tone = np.sin(2 * np.pi * 6000 * np.arange(sample_rate) / sample_rate)
+        resampled = resampling.resample(tone, sample_rate, 8000)
+
+        self.assertLess(np.max(np.abs(resampled[1000:-1000])), 0.01)
+
+    def test_same_rate(self):
+        resampled = resampling.resample(self.signal, 8000, 8000, dtype=np.float32)
+        self.assertEqual(resampled.dtype, np.float32)
+        np.testing.assert_array_equal(resampled, self.signal.astype(np.float32))
+
+        resampler = resampling.PolyphaseResampler(8000, 8000)
+        outputs = [resampler.process(self.signal[start:start + 3000]) for start in range(0, len(self.signal), 3000)]
+        outputs.append(resampler.flush())
+        np.testing.assert_array_equal(np.concatenate(outputs), self.signal)
+
+    def test_empty(self):
+        self.assertEqual(len(resampling.resample(np.zeros(0), 44100, 8000)), 0)
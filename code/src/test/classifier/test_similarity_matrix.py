@@ -0,0 +1,77 @@
+import classifier.similarity_matrix as similarity_matrix
+import classifier.metrics.metric as metric
+import classifier.metrics.metric_calculator as metric_calculator
+import classifier.audio as audio
+import numpy as np
+import unittest
+
+
+class LevelCalculator(metric.MetricCalculator):
+    def __init__(self, scale=1.0):
+        self.scale = scale
+        self.similarity_calls = 0
+
+    def calculate_metric(self, audio):
+        return np.mean(audio.signal)
+
+    def calculate_similarity(self, audio1, audio2, metric1, metric2):
+        self.similarity_calls += 1
+        return np.exp(-self.scale * abs(metric1 - metric2))
+
+    def __repr__(self):
+        return f"Level {self.scale}"
+
+
+class SimilarityMatricesTestCase(unittest.TestCase):
+    def setUp(self):
+        self.levels = [0.0, 0.1, 1.0, 1.2, 3.0, 3.05]
+        self.labels = np.array([1, 1, 2, 2, 3, 3])
+        self.audios = [audio.Audio(np.full(10, level), 10, name=str(level)) for level in self.levels]
+        self.metrics = [LevelCalculator(1.0), LevelCalculator(0.3)]
+        self.matrices = similarity_matrix.SimilarityMatrices(self.audios)
+
+    def test_similarities_calculated_once(self):
+        self.matrices.rank(self.metrics)
+        self.matrices.rank(self.metrics[:1])
+
+        for metric in self.metrics:
+            self.assertEqual(metric.similarity_calls, len(self.audios) * (len(self.audios) - 1))
+
+    def test_rank_matches_most_similar(self):
+        ranking = self.matrices.rank(self.metrics)
+        combined = self.matrices.get_combined_matrix(self.metrics)
+
+        for i, unknown_audio in enumerate(self.audios):
+            others = [other_audio for other_audio in self.audios if other_audio is not unknown_audio]
+            similarity, most_similar = metric_calculator.get_most_similar(unknown_audio, others, self.metrics)
+
+            self.assertIs(self.audios[ranking[i, 0]], most_similar)
+            self.assertEqual(combined[i, ranking[i, 0]], similarity)
+            self.assertNotIn(i, ranking[i])
+
+    def test_rank_with_nan_similarities(self):
+        nan_metric = LevelCalculator(1.0)
+        # a metric that can't compare anything with the audio at level 1.0
+        nan_metric.calculate_similarity = lambda audio1, audio2, metric1, metric2: np.nan if metric2 == 1.0 else np.exp(-abs(metric1 - metric2))
+        ranking = self.matrices.rank([nan_metric])
+
+        self.assertEqual(ranking.shape, (len(self.audios), len(self.audios) - 1))
+        for i in range(len(self.audios)):
+            # every other audio is still ranked, with the one that can't be compared last
+            self.assertEqual(sorted(ranking[i]), [j for j in range(len(self.audios)) if j != i])
+            if i != 2:
+                self.assertEqual(ranking[i, -1], 2)
+
+    def test_accuracy(self):
+        ranking = self.matrices.rank(self.metrics)
+
+        self.assertEqual(similarity_matrix.top_k_accuracy(ranking, self.labels, k=1), 1.0)
+        # with the labels shifted along, every nearest neighbour has a different label
+        shifted_labels = np.array([1, 2, 2, 3, 3, 1])
+        self.assertEqual(similarity_matrix.top_k_accuracy(ranking, shifted_labels, k=1), 0.0)
+
+    def test_confusion_matrix(self):
+        ranking = self.matrices.rank(self.metrics)
+        confusion = similarity_matrix.confusion_matrix(ranking, self.labels, [1, 2, 3])
+
+        np.testing.assert_array_equal(confusion, np.diag([2, 2, 2]))
@@ -0,0 +1,74 @@
+import benchmark.signals as signals
+import classifier.streaming as streaming
+import numpy as np
+import unittest
+
+
+def stream_onsets(signal, sample_rate, block_size):
+    detector = streaming.StreamingOnsetDetector(sample_rate)
+    onsets = [detector.process(signal[start:start + block_size]) for start in range(0, len(signal), block_size)]
+    onsets.append(detector.flush())
+    return np.concatenate(onsets)
+
+
+class StreamingOnsetDetectorTestCase(unittest.TestCase):
+    def setUp(self):
+        self.performance = signals.piano(20, sample_rate=11025, bpm=100, seed=4)
+
+    def test_block_size_doesnt_matter(self):
+        onsets = stream_onsets(self.performance.signal, 11025, 11025)
+        # the resampler adds up its filter in different sized batches, which only changes the rounding
+        np.testing.assert_allclose(stream_onsets(self.performance.signal, 11025, 333), onsets, rtol=1e-7, atol=1e-10)
+
+    def test_matches_onset_function(self):
+        onsets = stream_onsets(self.performance.signal, 11025, 1000)
+        offline_onsets = self.performance.get_onset_function().data
+        self.assertLessEqual(abs(len(onsets) - len(offline_onsets)), 1)
+
+        # only the normalisation and the first few windows differ, and the running normalisation settles down after a few seconds
+        length = min(len(onsets), len(offline_onsets))
+        self.assertGreater(np.corrcoef(onsets[100:length], offline_onsets[100:length])[0, 1], 0.99)
+        np.testing.assert_allclose(onsets[2500:length], offline_onsets[2500:length], rtol=0.05, atol=0.05)
+
+    def test_silence(self):
+        onsets = stream_onsets(np.zeros(8000 * 3), 8000, 800)
+        self.assertTrue(np.all(onsets == 0))
+
+
+class StreamingBeatTrackerTestCase(unittest.TestCase):
+    def test_matches_offline_beats(self):
+        performance = signals.piano(40, sample_rate=8000, bpm=112, seed=2)
+        block_size = 800
+
+        beats = []
+        tempos = []
+        for new_beats, bpm in streaming.stream_beats((performance.signal[start:start + block_size] for start in range(0, len(performance.signal), block_size)), 8000):
+            beats.extend(new_beats)
+            tempos.append(bpm)
+        beats = np.array(beats)
+
+        offline_beats = performance.get_beat_times()
+        self.assertTrue(np.all(np.diff(beats) > 0))
+        self.assertLessEqual(abs(len(beats) - len(offline_beats)), 2)
+        distances = np.array([np.min(np.abs(offline_beats - beat)) for beat in beats])
+        self.assertGreater(np.mean(distances < 0.02), 0.9)
+
+        # no tempo until there are a few seconds of onsets, then close to the offline estimate
+        self.assertIsNone(tempos[0])
+        self.assertAlmostEqual(tempos[-1], performance.get_global_tempo(), delta=3)
+
+    def test_bounded_latency_and_memory(self):
+        performance = signals.piano(120, sample_rate=8000, bpm=90, seed=5)
+        detector = streaming.StreamingOnsetDetector(8000)
+        tracker = streaming.StreamingBeatTracker(latency=0.5)
+        block_size = 400
+
+        largest = 0
+        for start in range(0, len(performance.signal), block_size):
+            beats = tracker.process(detector.process(performance.signal[start:start + block_size]))
+            now = tracker.get_num_windows() * tracker.window_advance
+            for beat in beats:
+                self.assertLessEqual(now - beat, 0.5 + block_size / 8000 + tracker.window_advance)
+            largest = max(largest, len(tracker.scores), len(detector.buffer))
+
+        self.assertLessEqual(largest, 2 * tracker.keep + 1)
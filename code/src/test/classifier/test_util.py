@@ -1,4 +1,11 @@
 import classifier.util as util
+import contextlib
+import io
+import numpy as np
+import os.path
+import scipy.io.wavfile
+import struct
+import tempfile
 import unittest
 
 class ReadAudioTestCase(unittest.TestCase):
@@ -15,6 +22,69 @@ class ReadAudioTestCase(unittest.TestCase):
         self.assertTrue((audio.signal == [0, 0, 0]).all())
 
 
+class ReadAudioFormatsTestCase(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.stereo_data = np.random.default_rng(0).integers(-30000, 30000, (1000, 2)).astype(np.int16)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def write_wav(self, name, sample_rate, data):
+        path = os.path.join(self.directory.name, name)
+        scipy.io.wavfile.write(path, sample_rate, data)
+        return path
+
+    def write_24_bit_wav(self, name, sample_rate, data):
+        """
+        scipy can't write 24-bit WAV files, so we write this one ourselves
+        """
+        path = os.path.join(self.directory.name, name)
+        samples = data.astype(np.int64) & 0xFFFFFF
+        raw = np.stack((samples & 0xFF, (samples >> 8) & 0xFF, samples >> 16), axis=-1).astype(np.uint8).tobytes()
+        channels = data.shape[1]
+        fmt = struct.pack("<HHIIHH", 1, channels, sample_rate, sample_rate * 3 * channels, 3 * channels, 24)
+        with open(path, "wb") as f:
+            f.write(b"RIFF" + struct.pack("<I", 4 + 8 + len(fmt) + 8 + len(raw)) + b"WAVE")
+            f.write(b"fmt " + struct.pack("<I", len(fmt)) + fmt)
+            f.write(b"data" + struct.pack("<I", len(raw)) + raw)
+        return path
+
+    def test_dtype(self):
+        path = self.write_wav("stereo.wav", 44100, self.stereo_data)
+
+        self.assertEqual(util.read_audio(path).signal.dtype, np.float32)
+        self.assertEqual(util.read_audio(path, dtype=np.float64).signal.dtype, np.float64)
+        np.testing.assert_allclose(util.read_audio(path).signal, np.mean(self.stereo_data, axis=1))
+
+    def test_mmap_matches_read(self):
+        path = self.write_wav("stereo.wav", 44100, self.stereo_data)
+
+        for dtype in [None, np.float32, np.float64]:
+            read = util.read_audio(path, dtype=dtype)
+            mapped = util.read_audio(path, dtype=dtype, mmap=True, chunk_size=100)
+            self.assertEqual(mapped.sample_rate, 44100)
+            self.assertEqual(mapped.signal.dtype, read.signal.dtype)
+            np.testing.assert_array_equal(mapped.signal, read.signal)
+
+    def test_mmap_mono_stays_mapped(self):
+        path = self.write_wav("mono.wav", 44100, self.stereo_data[:, 0].copy())
+        audio = util.read_audio(path, dtype=None, mmap=True)
+
+        self.assertIsInstance(audio.signal, np.memmap)
+        np.testing.assert_array_equal(audio.signal, self.stereo_data[:, 0])
+
+    def test_24_bit(self):
+        data = np.random.default_rng(1).integers(-2**23, 2**23, (700, 2))
+        path = self.write_24_bit_wav("24bit.wav", 48000, data)
+
+        for mmap in [False, True]:
+            audio = util.read_audio(path, dtype=np.float64, mmap=mmap, chunk_size=100)
+            self.assertEqual(audio.sample_rate, 48000)
+            # 24-bit samples are scaled to fill an int32, like scipy.io.wavfile
+            np.testing.assert_array_equal(audio.signal, np.mean(data * 256, axis=1))
+
+
 class MovingAverageTestCase(unittest.TestCase):
     def test_moving_average_smaller_than_window(self):
         data = [0,2,4]
@@ -25,3 +95,17 @@ class MovingAverageTestCase(unittest.TestCase):
         data = [0,2,4,6,8]
         average = util.moving_average(data, 2)
         self.assertTrue((average == [0,1,3,5,7]).all())
+
+
+class LogTestCase(unittest.TestCase):
+    def tearDown(self):
+        util.VERBOSITY = 1
+
+    def test_verbosity(self):
+        for verbosity, expected in [(0, ""), (1, "main\n"), (2, "main\ndetail\n")]:
+            util.VERBOSITY = verbosity
+            output = io.StringIO()
+            with contextlib.redirect_stdout(output):
+                util.log("main")
+                util.log("detail", level=2)
+            self.assertEqual(output.getvalue(), expected)
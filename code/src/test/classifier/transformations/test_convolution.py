@@ -0,0 +1,33 @@
+import classifier.transformations.convolution as convolution
+import numpy as np
+import unittest
+
+
+class PartitionedConvolverTestCase(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.signal = rng.normal(size=10000)
+        self.ir = rng.normal(size=3000) * np.exp(-np.arange(3000) / 500)
+
+    def test_matches_np_convolve(self):
+        for block_size in [64, 512, 3000, 8192]:
+            convolved = convolution.PartitionedConvolver(self.ir, block_size).convolve(self.signal)
+            np.testing.assert_allclose(convolved, np.convolve(self.signal, self.ir), atol=1e-10)
+
+    def test_short_signals_and_irs(self):
+        for signal_length, ir_length in [(1, 1), (100, 3000), (5000, 1), (7, 7)]:
+            convolved = convolution.PartitionedConvolver(self.ir[:ir_length], 256).convolve(self.signal[:signal_length])
+            np.testing.assert_allclose(convolved, np.convolve(self.signal[:signal_length], self.ir[:ir_length]), atol=1e-10)
+
+    def test_convolver_is_reusable(self):
+        convolver = convolution.PartitionedConvolver(self.ir, 512)
+        convolver.convolve(self.signal)
+
+        np.testing.assert_allclose(convolver.convolve(self.signal[:4000]), np.convolve(self.signal[:4000], self.ir), atol=1e-10)
+
+    def test_keeps_precision(self):
+        convolver = convolution.PartitionedConvolver(self.ir, 512)
+
+        self.assertEqual(convolver.convolve(self.signal.astype(np.float32)).dtype, np.float32)
+        self.assertEqual(convolver.convolve((self.signal * 1000).astype(np.int16)).dtype, np.float64)
+        np.testing.assert_allclose(convolver.convolve(self.signal.astype(np.float32)), np.convolve(self.signal, self.ir), rtol=0, atol=1e-4)
@@ -0,0 +1,72 @@
+import classifier.audio as audio
+import classifier.transformations.noise as noise
+import numpy as np
+import os.path
+import scipy.io.wavfile
+import tempfile
+import unittest
+
+
+def loop_noise(noise_signal, crossfade_length_samples, length):
+    """
+    Loops noise by repeatedly crossfading the end of the noise bed into another copy of the noise, the way Noise used to
+    """
+    length_matched_noise = noise_signal
+    while len(length_matched_noise) < length:
+        crossfade_out = length_matched_noise[-crossfade_length_samples:] * np.linspace(1, 0, crossfade_length_samples)
+        crossfade_in = noise_signal[:crossfade_length_samples] * np.linspace(0, 1, crossfade_length_samples)
+        length_matched_noise = np.concatenate((
+                length_matched_noise[:-crossfade_length_samples],
+                crossfade_out + crossfade_in,
+                noise_signal[crossfade_length_samples:],
+                ))
+    return length_matched_noise[:length]
+
+
+class NoiseTestCase(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.noise_path = os.path.join(self.directory.name, "noise.wav")
+        self.noise_signal = (np.random.default_rng(0).normal(size=2345) * 3000).astype(np.int16)
+        scipy.io.wavfile.write(self.noise_path, 1000, self.noise_signal)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_matches_looped_noise(self):
+        for length in [10, 1845, 2345, 2346, 3189, 3190, 3191, 10000]:
+            signal = np.random.default_rng(length).normal(size=length)
+            noisy = noise.Noise(self.noise_path, crossfade=0.5, level=2.0).apply(audio.Audio(signal, 1000))
+
+            expected = signal + 2.0 * loop_noise(self.noise_signal.astype(np.float64), 500, length)
+            np.testing.assert_allclose(noisy.signal, expected, atol=1e-6)
+
+    def test_no_crossfade(self):
+        noisy = noise.Noise(self.noise_path, crossfade=0, level=1.0).apply(audio.Audio(np.zeros(5000), 1000))
+
+        np.testing.assert_array_equal(noisy.signal, np.resize(self.noise_signal, 5000))
+
+    def test_noise_is_shared(self):
+        quiet = noise.Noise(self.noise_path, level=1.0)
+        loud = noise.Noise(self.noise_path, level=10.0)
+
+        self.assertIs(quiet.noise, loud.noise)
+        np.testing.assert_allclose(loud.apply(audio.Audio(np.zeros(6000), 1000)).signal,
+                10.0 * quiet.apply(audio.Audio(np.zeros(6000), 1000)).signal, rtol=1e-6)
+
+    def test_replaced_file(self):
+        original = audio.Audio(np.zeros(3000), 1000, fingerprint="abc")
+        before = noise.Noise(self.noise_path)
+
+        scipy.io.wavfile.write(self.noise_path, 1000, -self.noise_signal)
+        after = noise.Noise(self.noise_path)
+
+        # the new noise is decoded and fingerprinted rather than the old one being reused
+        np.testing.assert_array_equal(after.noise, -before.noise)
+        self.assertNotEqual(after.transform_fingerprint(original), before.transform_fingerprint(original))
+        np.testing.assert_allclose(after.apply(original).signal, -before.apply(original).signal)
+
+    def test_keeps_precision(self):
+        noisy = noise.Noise(self.noise_path).apply(audio.Audio(np.zeros(6000, dtype=np.float32), 1000))
+
+        self.assertEqual(noisy.signal.dtype, np.float32)
@@ -0,0 +1,111 @@
+import classifier.audio as audio
+import classifier.transformations.reverb as reverb
+import classifier.transformations.transform_graph as transform_graph
+import classifier.transformations.transformation as transformation
+import numpy as np
+import os.path
+import scipy.io.wavfile
+import tempfile
+import unittest
+
+
+class Gain(transformation.Transformation):
+    def __init__(self, gain):
+        self.gain = gain
+        self.applications = 0
+
+    def apply(self, audio_obj, out=None):
+        self.applications += 1
+        return audio.Audio(audio_obj.signal * self.gain, audio_obj.sample_rate, name=audio_obj.name, fingerprint=self.transform_fingerprint(audio_obj))
+
+    def get_parameters(self):
+        return {"gain": self.gain}
+
+
+class TransformIdentityTestCase(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.ir_path = os.path.join(self.directory.name, "ir.wav")
+        scipy.io.wavfile.write(self.ir_path, 1000, np.array([1, 0, 0, 100], dtype=np.int16))
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_equal_parameters(self):
+        self.assertEqual(reverb.Reverb(self.ir_path), reverb.Reverb(self.ir_path))
+        self.assertEqual(hash(reverb.Reverb(self.ir_path)), hash(reverb.Reverb(self.ir_path)))
+        self.assertEqual(len({(reverb.Reverb(self.ir_path),): 1, (reverb.Reverb(self.ir_path),): 2}), 1)
+
+        self.assertNotEqual(Gain(2), Gain(3))
+        self.assertNotEqual(Gain(2), reverb.Reverb(self.ir_path))
+
+    def test_fingerprint(self):
+        original = audio.Audio(np.zeros(10), 1000, fingerprint="abc")
+
+        self.assertEqual(reverb.Reverb(self.ir_path).transform_fingerprint(original), reverb.Reverb(self.ir_path).transform_fingerprint(original))
+        self.assertNotEqual(Gain(2).transform_fingerprint(original), Gain(3).transform_fingerprint(original))
+
+    def test_fingerprint_follows_file_contents(self):
+        original = audio.Audio(np.zeros(10), 1000, fingerprint="abc")
+        fingerprint = reverb.Reverb(self.ir_path).transform_fingerprint(original)
+
+        # the same impulse response somewhere else does the same thing
+        copy_path = os.path.join(self.directory.name, "copy.wav")
+        scipy.io.wavfile.write(copy_path, 1000, np.array([1, 0, 0, 100], dtype=np.int16))
+        self.assertEqual(reverb.Reverb(copy_path).transform_fingerprint(original), fingerprint)
+
+        # but replacing the file with a different one doesn't, so features of the old reverbed audio aren't reused
+        scipy.io.wavfile.write(self.ir_path, 1000, np.array([1, 0, 50, 0], dtype=np.int16))
+        self.assertNotEqual(reverb.Reverb(self.ir_path).transform_fingerprint(original), fingerprint)
+
+
+class TransformGraphTestCase(unittest.TestCase):
+    def setUp(self):
+        self.loads = []
+        self.double = Gain(2)
+        self.triple = Gain(3)
+        self.combinations = [(), (self.double,), (self.triple,), (self.double, self.triple)]
+        self.graph = transform_graph.TransformGraph(self.combinations, load=self.load)
+
+    def load(self, source):
+        self.loads.append(source)
+        return audio.Audio(np.arange(10.0) * source, 1000, name=str(source))
+
+    def test_results(self):
+        for source in [1, 2]:
+            for combination in self.combinations:
+                expected = np.arange(10.0) * source
+                for transform in combination:
+                    expected = expected * transform.gain
+                np.testing.assert_array_equal(self.graph.get(source, combination).signal, expected)
+
+    def test_shared_prefixes(self):
+        for combination in self.combinations:
+            self.graph.get(1, combination)
+
+        # each source is only read once, and (double,) is shared with (double, triple)
+        self.assertEqual(self.loads, [1])
+        self.assertEqual(self.double.applications, 1)
+        self.assertEqual(self.triple.applications, 2)
+
+    def test_released(self):
+        self.graph.get(1, (self.double,))
+        self.assertIn((1, (self.double,)), self.graph.audios)
+
+        self.graph.get(1, (self.double, self.triple))
+        self.assertNotIn((1, (self.double,)), self.graph.audios)
+        self.assertIn((1, ()), self.graph.audios)
+
+        self.graph.get(1, ())
+        self.graph.get(1, (self.triple,))
+        self.assertEqual(self.graph.audios, {})
+
+    def test_equal_transforms_share(self):
+        self.graph.get(1, (self.double,))
+        self.graph.get(1, (Gain(2), Gain(3)))
+
+        self.assertEqual(self.double.applications, 1)
+
+    def test_unknown_combination(self):
+        with self.assertRaises(ValueError):
+            self.graph.get(1, (Gain(5),))